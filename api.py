@@ -0,0 +1,449 @@
+"""
+Headless HTTP API for document generation.
+
+Runs next to the Streamlit UI and uses the same build path (documents.py), job manager,
+result cache and output store, so a CRM can generate documents without a browser:
+
+    POST /v1/documents              {"template": "Invoice", "fields": {...}, "format": "pdf"}
+                                    -> the file, streamed; the reference is in X-Reference
+    POST /v1/documents?mode=async   -> 202 {"job_id": ...}
+    GET  /v1/jobs/{job_id}          -> status, progress, reference and file URLs
+    GET  /v1/jobs/{job_id}/files/{name}
+    GET  /v1/templates
+    GET  /v1/archive?reference=&client=&q=&template=&service_type=&date_from=&date_to=&before=
+    GET  /v1/archive/{document_id}  /v1/archive/{document_id}/files/{name}
+    GET  /healthz
+    GET  /metrics
+    GET  /metrics/prometheus        per-stage generation histograms (see metrics.py)
+
+``format`` is "pdf" (default), "docx" or "zip" (both files); ``fresh: true`` issues a new
+reference number even when the same fields were generated before. Field names are the
+ones used by batch mode (``client_name``, ``invoice_date``...).
+
+``outputs`` replaces ``format`` with a render plan (see render_plan.py), e.g.
+``["docx", "pdfa+signature", "pdf+draft"]``, with ``signature`` the base64-encoded PNG or
+JPEG for signed variants. One output is returned as is, several as a zip.
+
+At most ``API_CONCURRENCY`` synchronous requests generate at once; others wait up to
+``API_QUEUE_TIMEOUT`` seconds for a slot and are then answered with 503. Start it with
+
+    python api.py          # listens on API_HOST:API_PORT (default 0.0.0.0:8000)
+"""
+import asyncio
+import base64
+import binascii
+import collections
+import contextlib
+import hashlib
+import io
+import json
+import os
+import time
+import urllib.parse
+import zipfile
+
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+
+import pdf_converter
+from document_archive import get_document_archive
+from documents import TEMPLATES, generate_outputs, run_generation, start_warmup, validate_templates
+from jobs import DONE, FAILED, get_job_manager, input_key
+from metrics import get_registry
+from output_store import get_output_store
+from render_plan import FORMATS as OUTPUT_FORMATS, check_plan, parse_plan
+from result_cache import get_result_cache
+
+API_HOST = os.environ.get("API_HOST", "0.0.0.0")
+API_PORT = int(os.environ.get("API_PORT", 8000))
+API_CONCURRENCY = int(os.environ.get("API_CONCURRENCY", 8))
+API_QUEUE_TIMEOUT = float(os.environ.get("API_QUEUE_TIMEOUT", 30))
+API_MAX_BODY = int(os.environ.get("API_MAX_BODY", 1024 * 1024))
+STREAM_CHUNK = 64 * 1024
+# Async jobs from the API share one job-table "session"
+API_SESSION = "api"
+
+FORMATS = ("pdf", "docx", "zip")
+MEDIA_TYPES = {
+    ".pdf": "application/pdf",
+    ".docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    ".zip": "application/zip",
+}
+
+
+class ApiError(Exception):
+    """Turned into a JSON error response with ``status``."""
+
+    def __init__(self, status, message, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers
+
+
+class Metrics:
+    """Request counters and recent latencies for /metrics."""
+
+    def __init__(self, window=1000):
+        self.started = time.time()
+        self.requests = collections.Counter()
+        self.responses = collections.Counter()
+        self.in_flight = 0
+        self.waiting = 0
+        self.rejected = 0
+        self._latencies = collections.deque(maxlen=window)
+
+    def record(self, route, status, seconds):
+        self.requests[route] += 1
+        self.responses[str(status)] += 1
+        self._latencies.append(seconds)
+
+    def snapshot(self):
+        latencies = sorted(self._latencies)
+
+        def percentile(pct):
+            if not latencies:
+                return None
+            return latencies[min(len(latencies) - 1, int(round(pct / 100 * (len(latencies) - 1))))]
+
+        return {
+            "uptime": time.time() - self.started,
+            "requests": dict(self.requests),
+            "responses": dict(self.responses),
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "rejected": self.rejected,
+            "concurrency_limit": API_CONCURRENCY,
+            "latency_p50": percentile(50),
+            "latency_p95": percentile(95),
+        }
+
+
+metrics = Metrics()
+_slots = None
+
+
+def _semaphore():
+    # Created lazily so it binds to the running event loop
+    global _slots
+    if _slots is None:
+        _slots = asyncio.Semaphore(API_CONCURRENCY)
+    return _slots
+
+
+def error_response(status, message, headers=None):
+    return JSONResponse({"error": message}, status_code=status, headers=headers)
+
+
+def ascii_header(text):
+    """``text`` as a header value: printable ASCII kept, anything else percent-encoded."""
+    return urllib.parse.quote(text, safe="".join(chr(c) for c in range(0x20, 0x7f)))
+
+
+def content_disposition(name):
+    """
+    An attachment header for ``name`` that cannot fail to encode: an ASCII fallback
+    ``filename`` (non-ASCII replaced, quotes and backslashes escaped) plus the exact
+    name as RFC 6266 ``filename*``.
+    """
+    fallback = "".join(c if " " <= c < "\x7f" else "_" for c in name)
+    fallback = fallback.replace("\\", "\\\\").replace('"', '\\"')
+    return f"attachment; filename=\"{fallback}\"; filename*=UTF-8''{urllib.parse.quote(name, safe='')}"
+
+
+def stream_bytes(data, name, headers=None):
+    """Stream ``data`` in chunks as an attachment called ``name``."""
+    def chunks():
+        for start in range(0, len(data), STREAM_CHUNK):
+            yield data[start:start + STREAM_CHUNK]
+
+    headers = {
+        "Content-Disposition": content_disposition(name),
+        "Content-Length": str(len(data)),
+        **(headers or {}),
+    }
+    media_type = MEDIA_TYPES.get(os.path.splitext(name)[1], "application/octet-stream")
+    return StreamingResponse(chunks(), media_type=media_type, headers=headers)
+
+
+def select_output(files, fmt, stem):
+    """Return (name, bytes) for ``fmt`` from a {name: bytes} result."""
+    if fmt == "zip":
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+            for name, data in files.items():
+                archive.writestr(name, data)
+        return f"{stem}.zip", buffer.getvalue()
+    for name, data in files.items():
+        if name.endswith(f".{fmt}"):
+            return name, data
+    raise ApiError(500, f"No .{fmt} file was generated")
+
+
+async def read_request(request):
+    """Parse and validate a generation request body."""
+    length = request.headers.get("content-length")
+    if length is not None:
+        try:
+            length = int(length)
+        except ValueError:
+            raise ApiError(400, "Invalid Content-Length header")
+        if length > API_MAX_BODY:
+            raise ApiError(413, f"Request body larger than {API_MAX_BODY} bytes")
+    # The header is optional (chunked bodies), so count what is actually read
+    chunks, size = [], 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > API_MAX_BODY:
+            raise ApiError(413, f"Request body larger than {API_MAX_BODY} bytes")
+        chunks.append(chunk)
+    try:
+        body = json.loads(b"".join(chunks))
+    except ValueError:
+        raise ApiError(400, "Request body must be JSON")
+    if not isinstance(body, dict):
+        raise ApiError(400, "Request body must be a JSON object")
+    template_name = body.get("template")
+    if template_name not in TEMPLATES:
+        raise ApiError(400, f"Unknown template {template_name!r}; expected one of {', '.join(TEMPLATES)}")
+    fields = body.get("fields") or {}
+    if not isinstance(fields, dict):
+        raise ApiError(400, "'fields' must be an object")
+    fmt = body.get("format", "pdf")
+    if fmt not in FORMATS:
+        raise ApiError(400, f"Unknown format {fmt!r}; expected one of {', '.join(FORMATS)}")
+    outputs = body.get("outputs")
+    if outputs is not None:
+        if not isinstance(outputs, list):
+            raise ApiError(400, "'outputs' must be a list such as [\"docx\", \"pdfa+signature\"]")
+        try:
+            outputs = parse_plan(outputs)
+        except ValueError as e:
+            raise ApiError(400, str(e))
+        fmt = None if len(outputs) == 1 else "zip"
+    elif fmt != "zip":
+        # Render only the requested file; a zip holds the default .docx + PDF plan
+        outputs = parse_plan([fmt])
+    signature = None
+    if body.get("signature"):
+        try:
+            signature = base64.b64decode(body["signature"], validate=True)
+        except (binascii.Error, TypeError):
+            raise ApiError(400, "'signature' must be base64-encoded image data")
+    if outputs is not None:
+        # Rejected here rather than after a reference number was issued
+        try:
+            check_plan(outputs, signature)
+        except ValueError as e:
+            raise ApiError(400, str(e))
+        outputs = [variant.name for variant in outputs]
+    options = {"fresh": bool(body.get("fresh", False)), "variants": outputs, "signature": signature}
+    return template_name, {**fields, "template": template_name}, fmt, options
+
+
+async def create_document(request):
+    template_name, fields, fmt, options = await read_request(request)
+
+    if request.query_params.get("mode") == "async":
+        signature = options["signature"]
+        key = input_key({**fields, "outputs": options["variants"],
+                         "signature": hashlib.sha256(signature).hexdigest() if signature else None})
+        key += "-fresh" if options["fresh"] else ""
+        job = get_job_manager().submit(API_SESSION, key, run_generation, template_name, fields, **options)
+        return JSONResponse({"job_id": job.id, "status": job.status, "url": f"/v1/jobs/{job.id}"}, status_code=202)
+
+    slots = _semaphore()
+    metrics.waiting += 1
+    try:
+        await asyncio.wait_for(slots.acquire(), API_QUEUE_TIMEOUT)
+    except asyncio.TimeoutError:
+        metrics.rejected += 1
+        raise ApiError(503, "Too many concurrent requests", {"Retry-After": "1"})
+    finally:
+        metrics.waiting -= 1
+    metrics.in_flight += 1
+    try:
+        result = await run_in_threadpool(generate_outputs, template_name, fields, None, **options)
+    except ValueError as e:
+        raise ApiError(400, str(e))
+    finally:
+        metrics.in_flight -= 1
+        slots.release()
+
+    stem = os.path.splitext(next(iter(result["files"])))[0]
+    if fmt is None:
+        name, data = next(iter(result["files"].items()))
+    else:
+        name, data = select_output(result["files"], fmt, stem)
+    headers = {"X-Reference": result["reference"]}
+    if result.get("unfilled"):
+        headers["X-Unfilled-Placeholders"] = ascii_header(", ".join(result["unfilled"]))
+    return stream_bytes(data, name, headers)
+
+
+def _job_or_404(job_id):
+    job = get_job_manager().get(job_id)
+    if job is None or job.session_id != API_SESSION:
+        raise ApiError(404, f"Unknown job {job_id!r}")
+    return job
+
+
+async def job_status(request):
+    job = _job_or_404(request.path_params["job_id"])
+    body = {"job_id": job.id, "status": job.status, "progress": job.progress, "stage": job.stage}
+    if job.status == DONE:
+        body["reference"] = job.result["reference"]
+        body["files"] = {name: f"/v1/jobs/{job.id}/files/{urllib.parse.quote(name)}" for name in job.result["files"]}
+        body["unfilled"] = job.result.get("unfilled", [])
+    elif job.status == FAILED:
+        body["error"] = str(job.error)
+    return JSONResponse(body)
+
+
+async def job_file(request):
+    job = _job_or_404(request.path_params["job_id"])
+    if job.status != DONE:
+        raise ApiError(409, f"Job is {job.status}")
+    files = get_output_store().get(job.id)
+    if files is None:
+        raise ApiError(410, "The generated files have expired")
+    name = request.path_params["name"]
+    if name not in files:
+        raise ApiError(404, f"Unknown file {name!r}")
+    return stream_bytes(files[name], name, {"X-Reference": job.result["reference"]})
+
+
+def _archive():
+    archive = get_document_archive()
+    if archive is None:
+        raise ApiError(404, "The document archive is disabled")
+    return archive
+
+
+async def search_archive(request):
+    params = request.query_params
+    filters = {key: params.get(key) for key in ("reference", "client", "template", "service_type",
+                                                "date_from", "date_to")}
+    filters["text"] = params.get("q")
+    try:
+        limit = min(int(params.get("limit", 50)), 500)
+        before = int(params["before"]) if params.get("before") else None
+        page = await run_in_threadpool(_archive().search, limit, before, **filters)
+    except ValueError as e:
+        raise ApiError(400, str(e))
+    if page["next"] is not None:
+        query = urllib.parse.urlencode({**params, "before": page["next"]})
+        page["next_url"] = f"/v1/archive?{query}"
+    return JSONResponse(page)
+
+
+def _archived_or_404(document_id):
+    document = _archive().get(int(document_id)) if document_id.isdigit() else None
+    if document is None:
+        raise ApiError(404, f"Unknown archived document {document_id!r}")
+    return document
+
+
+async def archived_document(request):
+    document_id = request.path_params["document_id"]
+    document = await run_in_threadpool(_archived_or_404, document_id)
+    document["files"] = {name: f"/v1/archive/{document_id}/files/{urllib.parse.quote(name)}"
+                         for name in document["file_names"]}
+    return JSONResponse(document)
+
+
+async def archived_file(request):
+    document = await run_in_threadpool(_archived_or_404, request.path_params["document_id"])
+    files = await run_in_threadpool(_archive().files, document["id"])
+    name = request.path_params["name"]
+    if name not in files:
+        raise ApiError(404, f"File {name!r} is not in the archive")
+    return stream_bytes(files[name], name, {"X-Reference": document["reference"]})
+
+
+def available_outputs():
+    """Render plan formats the configured PDF backend can produce."""
+    return [fmt for fmt in OUTPUT_FORMATS if fmt != "pdfa" or pdf_converter.supports_pdfa()]
+
+
+async def list_templates(request):
+    templates = {
+        name: {
+            "fields": [
+                {"key": field.key, "label": field.label, "type": field.type, "computed": not field.has_widget}
+                for field in schema.fields
+            ],
+        }
+        for name, schema in TEMPLATES.items()
+    }
+    return JSONResponse({"templates": templates, "formats": list(FORMATS), "outputs": available_outputs(),
+                         "output_options": ["signature", "draft"]})
+
+
+async def health(request):
+    return JSONResponse({"status": "ok"})
+
+
+async def metrics_endpoint(request):
+    return JSONResponse({
+        "api": metrics.snapshot(),
+        "result_cache": get_result_cache().stats(),
+        "output_store": await run_in_threadpool(get_output_store().stats),
+        "jobs": await run_in_threadpool(get_job_manager().stats),
+        "archive": (await run_in_threadpool(_archive().stats)) if get_document_archive() else None,
+        "pdf_pool": pdf_converter.pool_metrics(),
+    })
+
+
+async def prometheus_metrics(request):
+    return PlainTextResponse(get_registry().render(), media_type="text/plain; version=0.0.4")
+
+
+def instrumented(route, handler):
+    """Wrap a handler with error mapping and request metrics."""
+    async def endpoint(request):
+        started = time.perf_counter()
+        try:
+            response = await handler(request)
+        except ApiError as e:
+            response = error_response(e.status, str(e), e.headers)
+        except Exception as e:
+            response = error_response(500, f"{type(e).__name__}: {e}")
+        metrics.record(route, response.status_code, time.perf_counter() - started)
+        return response
+
+    return endpoint
+
+
+routes = [
+    Route(path, instrumented(path, handler), methods=methods)
+    for path, handler, methods in [
+        ("/v1/documents", create_document, ["POST"]),
+        ("/v1/jobs/{job_id}", job_status, ["GET"]),
+        ("/v1/jobs/{job_id}/files/{name}", job_file, ["GET"]),
+        ("/v1/templates", list_templates, ["GET"]),
+        ("/v1/archive", search_archive, ["GET"]),
+        ("/v1/archive/{document_id}", archived_document, ["GET"]),
+        ("/v1/archive/{document_id}/files/{name}", archived_file, ["GET"]),
+        ("/healthz", health, ["GET"]),
+        ("/metrics", metrics_endpoint, ["GET"]),
+        ("/metrics/prometheus", prometheus_metrics, ["GET"]),
+    ]
+]
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    # Fail at startup, not on the first request, if a schema does not match its .docx
+    validate_templates()
+    start_warmup(templates=False)
+    yield
+
+
+app = Starlette(routes=routes, lifespan=lifespan)
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(app, host=API_HOST, port=API_PORT)
@@ -1,451 +1,240 @@
-from docx import Document
-from docx.shared import Pt, Inches
-from docx.enum.text import WD_ALIGN_PARAGRAPH
 import streamlit as st
 from datetime import datetime
+import hashlib
+import io
 import os
-import platform
-import subprocess
+import time
+import uuid
+
+from batch import load_rows, run_batch
+from document_archive import get_document_archive
+from documents import TEMPLATES, output_stem, run_generation, start_warmup, validate_templates
+from jobs import FAILED, QueuedJobManager, get_job_manager, input_key
+from output_store import get_output_store
+from pdf_converter import supports_pdfa
+from render_plan import Variant
+from result_cache import get_result_cache
+from template_schema import NO_CHOICE, SERVICE_CATALOGUE, TemplateSchemaError
 
 port = int(os.environ.get("PORT", 8501))
-# Path to the text file for storing base number and counter
-SERIAL_FILE = "serial_data.txt"
 
-def get_serial_number():
-    # Read base number and counter from file
-    with open(SERIAL_FILE, "r") as f:
-        base_number, counter = map(int, f.read().strip().split(","))
-
-    # Calculate current serial number
-    serial_number = base_number + counter
-
-    # Increment the counter and update the file
-    with open(SERIAL_FILE, "w") as f:
-        f.write(f"{base_number},{counter + 1}")
-
-    return serial_number
-
-def generate_reference_number(company_name="BKR"):
-    """
-    Generate the full reference number in the format: BKRMM-YYYY-CR<serial>.
-    """
-    current_month = datetime.now().strftime("%m")
-    current_year = datetime.now().strftime("%Y")
-    serial_number = get_serial_number()
-    return f"{company_name}{current_month}-{current_year}-CR{serial_number}"
-
-# Code to replace placeholder for VAT
-def replace_placeholders_vat(doc, placeholders):
-    """Replace placeholders in a Word document, maintaining original formatting."""
-    
-    def replace_in_paragraph(paragraph, key, value):
-        """Replace placeholders in a paragraph, preserving formatting."""
-        for run in paragraph.runs:
-            if key in run.text:
-                # Replace placeholder text
-                run.text = run.text.replace(key, value)
-                # Retain original font style and size
-                run.font.name = paragraph.style.font.name
-                run.font.size = paragraph.style.font.size
-
-    def replace_in_cell(cell, placeholders):
-        """Replace placeholders inside a table cell."""
-        for para in cell.paragraphs:
-            for key, value in placeholders.items():
-                replace_in_paragraph(para, key, value)
-
-    # Replace placeholders in all paragraphs
-    for para in doc.paragraphs:
-        for key, value in placeholders.items():
-            replace_in_paragraph(para, key, value)
-
-    # Replace placeholders in tables
-    for table in doc.tables:
-        for row in table.rows:
-            for cell in row.cells:
-                replace_in_cell(cell, placeholders)
-
-    return doc
-
-def replace_placeholders(doc, placeholders):
-    """Replace placeholders in a Word document, including paragraphs and tables."""
-    
-    def replace_in_paragraph(paragraph, key, value):
-        """Replace placeholders in a single paragraph, handling split runs."""
-        full_text = "".join(run.text for run in paragraph.runs)
-        if key in full_text:
-            full_text = full_text.replace(key, value)
-            for run in paragraph.runs:
-                run.text = ""  # Clear all runs
-            paragraph.runs[0].text = full_text  # Add the replaced text back
-
-    def replace_in_cell(cell, placeholders):
-        """Replace placeholders inside a table cell."""
-        for para in cell.paragraphs:
-            for key, value in placeholders.items():
-                replace_in_paragraph(para, key, value)
-
-    # Replace placeholders in all paragraphs
-    for para in doc.paragraphs:
-        for key, value in placeholders.items():
-            replace_in_paragraph(para, key, value)
-
-    # Replace placeholders in tables
-    for table in doc.tables:
-        for row in table.rows:
-            for cell in row.cells:
-                replace_in_cell(cell, placeholders)
-
-    return doc
-  
-
-
-def convert_to_pdf(doc_path, pdf_path):
-    doc_path = os.path.abspath(doc_path)
-    pdf_path = os.path.abspath(pdf_path)
-
-    if not os.path.exists(doc_path):
-        raise FileNotFoundError(f"Word document not found at {doc_path}")
-
-    if platform.system() == "Windows":
-        try:
-            import comtypes.client
-            import pythoncom
-            pythoncom.CoInitialize()
-            word = comtypes.client.CreateObject("Word.Application")
-            word.Visible = False
-            doc = word.Documents.Open(doc_path)
-            doc.SaveAs(pdf_path, FileFormat=17)
-            doc.Close()
-            word.Quit()
-        except Exception as e:
-            raise Exception(f"Error using COM on Windows: {e}")
-    else:
-        try:
-            subprocess.run(
-                ['libreoffice', '--headless', '--convert-to', 'pdf', '--outdir', os.path.dirname(pdf_path), doc_path],
-                check=True
-            )
-        except subprocess.CalledProcessError as e:
-            raise Exception(f"Error using LibreOffice: {e}")
+# Output choices in the generator tab -> render plan formats
+OUTPUT_FORMATS = {"Word": "docx", "PDF": "pdf", "PDF/A (archival)": "pdfa"}
+ARCHIVE_PAGE_SIZE = 25
+ANY = "All"
 
 def options_changed():
     if "current_input" not in st.session_state:
         return False
     return st.session_state["current_input"] != current_input
 
-def generate_unique_reference():
-    """
-    Generate a unique reference number based on the current date and time in the format:
-    DDMMYYYYHHMMSS
-    """
-    now = datetime.now()
-    return now.strftime("%d%m%Y%H%M%S")
-
-st.title("Generator")
-
-# VAT Registration Fields
-template_option = st.selectbox("Select Template", ["VAT Registration", "Service Agreement","Invoice"])
-current_input = {}
-
-if template_option == "VAT Registration":
-    agreement_date = st.date_input("Date of Agreement", datetime.today())
-    atten = st.text_input("Attention")
-    email = st.text_input("Email")
-    client_name = st.text_input("Client Name")
-    commercial_registration_number = st.text_input("Commercial Registration Number")
-    service_provider_name = st.text_input("Service Provider Name")
-    service_provider_cr = st.text_input("Service Provider CR Number")
-    company_name = st.text_input("Company Name")
-    vat_registration_fee = st.text_input("VAT Registration Fee")
-    consultancy_fee = st.text_input("Consultancy Fee")
-    authorized_person_name = st.text_input("Authorized Person Name")
-
-    # Prepare inputs for comparison
-    current_input = {
-        "template": template_option,
-        "agreement_date": agreement_date,
-        "atten": atten,
-        "email": email,
-        "client_name": client_name,
-        "commercial_registration_number": commercial_registration_number,
-        "service_provider_name": service_provider_name,
-        "service_provider_cr": service_provider_cr,
-        "company_name": company_name,
-        "vat_registration_fee": vat_registration_fee,
-        "consultancy_fee": consultancy_fee,
-        "authorized_person_name": authorized_person_name,
-    }
-
-    if st.button("Generate VAT Document"):
-       
-            try:
-                reference_number = generate_reference_number()
-                placeholders = {
-                    "<<Date>>": agreement_date.strftime("%d-%m-%Y"),
-                    "<<Atten>>": atten,
-                    "<<Email>>": email,
-                    "<<Client Name>>": client_name,
-                    "<<Commercial Registration Number>>": commercial_registration_number,
-                    "<<Service Provider CR Number>>": service_provider_cr,
-                    "<<Company Name>>": company_name,
-                    "<<VAT Registration Fee>>": vat_registration_fee,
-                    "<<Consultancy Fee>>": consultancy_fee,
-                    "<<Authorized Person Name>>": authorized_person_name,
-                    "<<Reference Number>>": reference_number,
-                    "<<Service Provider Name>>":service_provider_name
-                }
-
-                # Generate document
-                template_path = "SAMPLE VAT registration and VAT filling -SME package.docx"
-                doc = Document(template_path)
-                doc = replace_placeholders_vat(doc, placeholders)
-
-                word_output = f"VAT {client_name}.docx"
-                pdf_output = word_output.replace(".docx", ".pdf")
-                doc.save(word_output)
-                convert_to_pdf(word_output, pdf_output)
-
-                st.success("Document generated successfully!")
-                st.session_state["current_input"] = current_input
-                st.session_state["word_output"] = word_output
-                st.session_state["pdf_output"] = pdf_output
-
-            except Exception as e:
-                st.error(f"Error: {e}")
-
-    # Display download buttons only if options haven't changed
-    if not options_changed() and "word_output" in st.session_state and "pdf_output" in st.session_state:
-        with open(st.session_state["word_output"], "rb") as word_file:
-            st.download_button("Download VAT Document (Word)", word_file, file_name=st.session_state["word_output"])
-        with open(st.session_state["pdf_output"], "rb") as pdf_file:
-            st.download_button("Download VAT Document (PDF)", pdf_file, file_name=st.session_state["pdf_output"])
-
-    elif options_changed():
-        st.session_state.pop("word_output", None)
-        st.session_state.pop("pdf_output", None)
-
-elif template_option == "Service Agreement":
-    agreement_date = st.date_input("Date of Agreement", datetime.today())
-    client_name = st.text_input("Client Name")
-    bahraini_ownership = st.number_input("Bahraini Ownership (%)", min_value=0, max_value=100, step=1)
-    gcc_ownership = st.number_input("GCC Nationals Ownership (%)", min_value=0, max_value=100, step=1)
-    american_ownership = st.number_input("American Nationals Ownership (%)", min_value=0, max_value=100, step=1)
-    foreign_ownership = st.number_input("Foreign Ownership (%)", min_value=0, max_value=100, step=1)
-    business_activity_1_isic = st.text_input("Business Activity ISIC4 Code (1st)")
-    business_activity_1_name = st.text_input("Business Activity Name (1st)")
-    business_activity_1_desc = st.text_area("Business Activity Description (1st)")
-    business_activity_2_isic = st.text_input("Business Activity ISIC4 Code (2nd)")
-    business_activity_2_name = st.text_input("Business Activity Name (2nd)")
-    business_activity_2_desc = st.text_area("Business Activity Description (2nd)")
-    costs = {
-        "Company Formation Cost": st.number_input("Company Formation Cost", min_value=0.0, step=0.01),
-        "Desk-Space Office Rental Cost": st.number_input("Desk-Space Office Rental Cost", min_value=0.0, step=0.01),
-        "Businessman Visa Cost": st.number_input("Businessman Visa Cost", min_value=0.0, step=0.01),
-        "Miscellaneous/Admin Charges": st.number_input("Miscellaneous/Admin Charges", min_value=0.0, step=0.01),
-        "Power of Attorney Cost": st.number_input("Power of Attorney Cost", min_value=0.0, step=0.01),
-        "Estimation Charges (Per Head)": st.number_input("Estimation Charges (Per Head)", min_value=0.0, step=0.01),
-        "Labour Authority Registration Cost": st.number_input("Labour Authority Registration Cost", min_value=0.0, step=0.01),
-        "Social Insurance Registration Cost": st.number_input("Social Insurance Registration Cost", min_value=0.0, step=0.01),
-        "Free Advice/Guidance Cost": st.number_input("Free Advice/Guidance Cost", min_value=0.0, step=0.01),
-    }
-    total_cost = sum(costs.values())
-
-    signatory_name = st.text_input("Signatory Name")
-    passport_number = st.text_input("Passport Number")
-
-    current_input = {
-        "template": template_option,
-        "agreement_date": agreement_date,
-        "client_name": client_name,
-        "bahraini_ownership": bahraini_ownership,
-        "gcc_ownership": gcc_ownership,
-        "american_ownership": american_ownership,
-        "foreign_ownership": foreign_ownership,
-        "business_activity_1_isic": business_activity_1_isic,
-        "business_activity_1_name": business_activity_1_name,
-        "business_activity_1_desc": business_activity_1_desc,
-        "business_activity_2_isic": business_activity_2_isic,
-        "business_activity_2_name": business_activity_2_name,
-        "business_activity_2_desc": business_activity_2_desc,
-        "company_formation_cost": costs["Company Formation Cost"],
-        "desk_rental_cost": costs["Desk-Space Office Rental Cost"],
-        "businessman_visa_cost": costs["Businessman Visa Cost"],
-        "misc_admin_charges": costs["Miscellaneous/Admin Charges"],
-        "power_of_attorney_cost": costs["Power of Attorney Cost"],
-        "estimation_charges": costs["Estimation Charges (Per Head)"],
-        "labour_registration_cost": costs["Labour Authority Registration Cost"],
-        "social_insurance_cost": costs["Social Insurance Registration Cost"],
-        "free_advice_cost": costs["Free Advice/Guidance Cost"],
-        "total_cost": total_cost,
-        "signatory_name": signatory_name,
-        "passport_number": passport_number,
-       
-    }
-
-
-    if st.button("Generate Service Agreement Document"):
-        
-            try:
-                reference_number = generate_reference_number()
-                placeholders = {
-    "<< Date >>": agreement_date.strftime("%d-%m-%Y"),
-    "<< Reference Number >>": reference_number,
-    "<< Client Name >>": client_name,
-    "<< Bahraini Ownership >>": f"{bahraini_ownership}%",
-    "<< GCC Nationals Ownership >>": f"{gcc_ownership}%",
-    "<< American Nationals Ownership >>": f"{american_ownership}%",
-    "<< Foreign Ownership >>": f"{foreign_ownership}%",
-    "<<Text1>>": business_activity_1_isic,
-    "<<Text2>>": business_activity_1_name,
-    "<<Text3>>": business_activity_1_desc,
-    "<<Text4>>": business_activity_2_isic,
-    "<<Text5>>": business_activity_2_name,
-    "<<Text6>>": business_activity_2_desc,
-    "<< Company Formation Cost >>": f"{costs['Company Formation Cost']:.2f}",
-    "<< Desk-Space Office Rental Cost >>": f"{costs['Desk-Space Office Rental Cost']:.2f}",
-    "<< Businessman Visa Cost >>": f"{costs['Businessman Visa Cost']:.2f}",
-    "<< Miscellaneous/Admin Charges >>": f"{costs['Miscellaneous/Admin Charges']:.2f}",
-    "<< Power of Attorney Cost >>": f"{costs['Power of Attorney Cost']:.2f}",
-    "<< Estimation Charges (Per Head) >>": f"{costs['Estimation Charges (Per Head)']:.2f}",
-    "<< Labour Authority Registration Cost >>": f"{costs['Labour Authority Registration Cost']:.2f}",
-    "<< Social Insurance Registration Cost >>": f"{costs['Social Insurance Registration Cost']:.2f}",
-    "<< Free Advice/Guidance Cost >>": f"{costs['Free Advice/Guidance Cost']:.2f}",
-    "<< Total Cost >>": f"{total_cost:.2f}",
-    "<< Signatory Name >>": signatory_name,
-    "<< Passport Number >>": passport_number,
-}
-                
-                doc = replace_placeholders(Document("SAMPLE Service Agreement -Company formation -Bahrain - Filled.docx"), placeholders)
-
-
-                word_output = f"Service Agreement {client_name}.docx"
-                pdf_output = word_output.replace(".docx", ".pdf")
-                doc.save(word_output)
-                convert_to_pdf(word_output, pdf_output)
-
-                st.success("Document generated successfully!")
-                st.session_state["current_input"] = current_input
-                st.session_state["word_output"] = word_output
-                st.session_state["pdf_output"] = pdf_output
-
-            except Exception as e:
-                st.error(f"Error: {e}")
-
-    if not options_changed() and "word_output" in st.session_state and "pdf_output" in st.session_state:
-        with open(st.session_state["word_output"], "rb") as word_file:
-            st.download_button("Download Service Agreement (Word)", word_file, file_name=st.session_state["word_output"])
-        with open(st.session_state["pdf_output"], "rb") as pdf_file:
-            st.download_button("Download Service Agreement (PDF)", pdf_file, file_name=st.session_state["pdf_output"])
-    
-    elif options_changed():
-        st.session_state.pop("word_output", None)
-        st.session_state.pop("pdf_output", None)
-        
-        
-elif template_option == "Invoice":
-    
-    service_data = {
-        "LMRA Affairs": [
-            "Visa Application", "Visa Termination", "Visa Renewal", "Visa Ceiling Application", "Changing Occupation", "Mobility Issues", "Offences Removal Application", "Runaway Application", "Domestic Permit Application", "LMRA Registration of Establishments", "Work Load Application", "Biometrics Appointment"
-        ],
-        "NPRA (Immigration) Affairs": [
-            "Visa Cancellation and Extension", "Dependent Visa Processing", "Domestic Visa Processing", "Visit Visa Extension", "Business Visit Visa Processing", "Dependent Visit Visa Processing", "Visa Cancellation Update", "Passport Update", "RP Stamping", "eVisa Processing", "Business Investor Visa Processing"
-        ],
-        "SIO Affairs": [
-            "Employee's Registration", "Employee's Termination", "Payment Processing", "Establishment Registration", "Addition Bahraini Employee"
-        ],
-        "CIO Affairs": [
-            "CPR Issuance", "CPR Renewal", "CPR Update", "Dependent CPR", "Lost CPR", "Address Update"
-        ],
-        "CID Affairs": [
-            "Report Issuance for Lost Passport", "Good Conduct Certificate Issuance", "Other Kind of Reports", "CPR Offense Inquiry and Removal"
-        ],
-        "eGovernment": ["Driving School Appointments","EWA Bills","Traffic Contraventions Details","Vehicle Details","Online Appointments"],
-        
-        "MOICT Affairs":["SPC(Single Person Company) Formation","WLL(With Limited Liability) Formation","Partnership Company Formation","Individual Establishment Formation","Sijili Formation","Branch of a Foreign Company Formation","Branch of Addition/Deletion","Company Liquidation","Change Name","Change Address","Change Financial Year","Partner Addition/Deletion","Actvity Addition/Deletion","Transfer Ownership","Change of Directors","Change of Representatives","Change Sponsor","Capital Increase/Decrease","Change Company Period","Change Company Type","Settlement of CR for Deleted by Resolution","Settlement of CR for Deleted wothout Payment","Convert Sijilli Type","Change M&AA Only"],
-        
-        "BIC Affairs":["Original CR","CR Extract","Document Attestation","eKey Assistance"],
-    }
-
-    service_type = st.selectbox("Select Service Type", ["None"] + list(service_data.keys()))
-    if service_type != "None":
-       service = st.selectbox("Select Service", ["None"] + service_data[service_type])
+def generation_controls(current_input, button_label, document_label, success_message, signature=None):
+    """Generate button, job progress and download buttons shared by all templates."""
+    session_id = st.session_state.setdefault("session_id", uuid.uuid4().hex)
+    fresh = st.checkbox("Issue a new reference number", value=False,
+                        help="Unchanged fields otherwise return the document issued before, with its reference.")
+    if st.button(button_label):
+        # Submitting returns at once; an identical in-flight request is reused
+        job = get_job_manager().submit(
+            session_id, input_key(current_input) + ("-fresh" if fresh else ""), run_generation,
+            current_input["template"], current_input, fresh=fresh,
+            variants=current_input["outputs"], signature=signature,
+        )
+        st.session_state["current_input"] = current_input
+        st.session_state["job_id"] = job.id
+
+    if options_changed():
+        st.session_state.pop("job_id", None)
+        return
+
+    job = get_job_manager().get(st.session_state.get("job_id"))
+    if job is None:
+        return
+    if job.active:
+        st.progress(job.progress, text=job.stage)
+        time.sleep(0.5)
+        st.rerun()
+    elif job.status == FAILED:
+        st.error(f"Error: {job.error}")
     else:
-       service = "None"
-    
-    # Input Fields for Invoice
-    invoice_date = st.date_input("Date", datetime.today())
-    client_name = st.text_input("Client Name")
-    reference_number=st.text_input("Service Agreement Reference Number")
-    remark=st.text_area("Remarks in Website")
-    attention = st.text_input("Attention (Atten)")
-    cost = st.text_input("Cost (in BHD)")
-    total_in_words = st.text_input("Total Amount (in words)")
-    total_amount = st.text_input("Total Amount (in BHD)")
-
-
-    current_input = {
-        "template": template_option,
-        "invoice_date": invoice_date,
-        "client_name": client_name,
-        "attention": attention,
-        "cost": cost,
-        "total_in_words": total_in_words,
-        "total_amount": total_amount,
-        "reference_number":reference_number,
-        "service": service,
-        "service_type": service_type,
-        "remark":remark,
+        files = get_output_store().get(job.id)
+        if files is None:
+            st.warning("The generated files have expired. Please generate the document again.")
+            return
+        st.success(success_message)
+        unfilled = job.result.get("unfilled")
+        if unfilled:
+            st.warning(f"These placeholders were left unfilled: {', '.join(unfilled)}")
+        stem = output_stem(current_input["template"], current_input)
+        labels = {Variant.parse(spec).filename(stem): Variant.parse(spec).describe() for spec in current_input["outputs"]}
+        for name, data in files.items():
+            st.download_button(f"Download {document_label} ({labels.get(name, name)})", data, file_name=name,
+                               key=f"download-{name}")
+
+def field_widgets(schema):
+    """Render the widgets of a template's fields and return {field key: value}."""
+    values = {}
+    for field in schema.fields:
+        if not field.has_widget:
+            continue
+        if field.type == "date":
+            values[field.key] = st.date_input(field.label, datetime.today())
+        elif field.type == "textarea":
+            values[field.key] = st.text_area(field.label)
+        elif field.type == "percent":
+            values[field.key] = st.number_input(field.label, min_value=0, max_value=100, step=1)
+        elif field.type == "money":
+            values[field.key] = st.number_input(field.label, min_value=0.0, step=0.01)
+        elif field.type == "choice":
+            parent = values.get(field.depends_on)
+            if field.depends_on is not None and parent in (None, NO_CHOICE):
+                values[field.key] = NO_CHOICE
+            else:
+                values[field.key] = st.selectbox(field.label, [NO_CHOICE] + field.choices(values))
+        else:
+            values[field.key] = st.text_input(field.label)
+    return values
+
+def output_options():
+    """Signature upload and output variants; returns (render plan, signature bytes or None)."""
+    signature_file = st.file_uploader("Upload Signature Image (optional)", type=["png", "jpg", "jpeg"])
+    # PDF/A is only offered when the PDF backend can write it
+    labels = [label for label, fmt in OUTPUT_FORMATS.items() if fmt != "pdfa" or supports_pdfa()]
+    formats = st.multiselect("Outputs", labels, default=["Word", "PDF"])
+    draft = st.checkbox("Watermark as DRAFT", value=False)
+    signature = signature_file.getvalue() if signature_file is not None else None
+    options = ("+signature" if signature else "") + ("+draft" if draft else "")
+    return [OUTPUT_FORMATS[label] + options for label in formats], signature
+
+def archive_browser(archive):
+    """Search form, paginated results and downloads of the document archive."""
+    col1, col2, col3 = st.columns(3)
+    filters = {
+        "text": col1.text_input("Search (any field)", key="archive_text"),
+        "reference": col2.text_input("Reference number", key="archive_reference"),
+        "client": col3.text_input("Client", key="archive_client"),
     }
+    col1, col2, col3 = st.columns(3)
+    template = col1.selectbox("Template", [ANY] + list(TEMPLATES), key="archive_template")
+    service_type = col2.selectbox("Service type", [ANY] + list(SERVICE_CATALOGUE), key="archive_service_type")
+    dates = col3.date_input("Document date", value=(), key="archive_dates")
+    filters["template"] = None if template == ANY else template
+    filters["service_type"] = None if service_type == ANY else service_type
+    if len(dates) == 2:
+        filters["date_from"], filters["date_to"] = dates
+
+    # Keyset pagination: a stack of "before" cursors, reset when the filters change
+    if st.session_state.get("archive_filters") != filters:
+        st.session_state["archive_filters"] = filters
+        st.session_state["archive_cursors"] = [None]
+    cursors = st.session_state["archive_cursors"]
+    try:
+        page = archive.search(limit=ARCHIVE_PAGE_SIZE, before=cursors[-1], **filters)
+        total = archive.count(**filters)
+    except ValueError as e:
+        st.warning(f"Cannot search the archive: {e}")
+        return
+    st.caption(f"{total} document(s); page {len(cursors)} of {max(1, -(-total // ARCHIVE_PAGE_SIZE))}")
+    if not page["documents"]:
+        st.info("No documents match.")
+        return
+    st.dataframe(
+        [{key: doc[key] for key in ("id", "reference", "template", "client", "service_type", "amount",
+                                    "document_date", "created_at")} for doc in page["documents"]],
+        hide_index=True,
+    )
+    col1, col2 = st.columns(2)
+    if col1.button("Previous page", disabled=len(cursors) == 1):
+        cursors.pop()
+        st.rerun()
+    if col2.button("Next page", disabled=page["next"] is None):
+        cursors.append(page["next"])
+        st.rerun()
+
+    labels = {doc["id"]: f"{doc['reference']} - {doc['client'] or doc['template']}" for doc in page["documents"]}
+    document_id = st.selectbox("Document", list(labels), format_func=labels.get, key="archive_document")
+    document = archive.get(document_id)
+    with st.expander("Placeholder values"):
+        st.json(document["placeholders"])
+    files = archive.files(document_id)
+    if not files:
+        st.caption("The files of this document were not archived.")
+    for name, data in files.items():
+        st.download_button(f"Download {name}", data, file_name=name, key=f"archive-{document_id}-{name}")
+
+@st.cache_resource
+def startup():
+    """Validate the templates, then warm the PDF backend in the background; returns the TemplateSchemaError or None."""
+    # Runs once per server process; reruns and new sessions reuse the outcome
+    try:
+        validate_templates()
+    except TemplateSchemaError as e:
+        return e
+    # With a shared job queue worker.py converts; a web replica keeps no idle soffice pool
+    if not isinstance(get_job_manager(), QueuedJobManager):
+        start_warmup(templates=False)
+    return None
+
+template_error = startup()
+if template_error is not None:
+    st.error(f"Template configuration error: {template_error}")
+    st.stop()
 
-    if st.button("Generate Invoice"):
-        
-            try:
-                invoice_number=generate_unique_reference();
-                placeholders = {
-                    "<<Date>>": invoice_date.strftime("%d-%m-%Y"),
-                    "<<Invoice Number>>": invoice_number,
-                    "<<Client Name>>": client_name,
-                    "<<Atten>>": attention,
-                    "<<Service Agreement Ref Number>>": reference_number,
-                    "<<Cost>>": cost,
-                    "<<Service>>": service if service != "None" else " ",
-                    "<<Total In Words>>": total_in_words,
-                    "<<Total Amount>>": total_amount,
-                    "<<Service Type>>": service_type if service_type != "None" else " ",
-                    "<<Remark>>":remark,
-                }
-
-                template_path = "SAMPLE -Invoice BKR2024CF158 - first payment.docx"
-                if not os.path.exists(template_path):
-                    st.error(f"Template file not found: {template_path}")
-                    raise FileNotFoundError(f"Template file not found: {template_path}")
-
-                doc = Document(template_path)
-                doc = replace_placeholders(doc, placeholders)
-
-                word_output = f"Invoice {client_name}.docx"
-                pdf_output = word_output.replace(".docx", ".pdf")
-
-                doc.save(word_output)
-                convert_to_pdf(word_output, pdf_output)
-
-                st.success("Invoice generated successfully!")
-                st.session_state["current_input"] = current_input
-                st.session_state["word_output"] = word_output
-                st.session_state["pdf_output"] = pdf_output
+st.title("Generator")
 
-            except Exception as e:
-                st.error(f"Error: {e}")
+with st.sidebar.expander("Statistics"):
+    st.caption("Result cache")
+    st.json(get_result_cache().stats())
+    st.caption("Output store")
+    st.json(get_output_store().stats())
+    st.caption("Jobs")
+    st.json(get_job_manager().stats())
+
+generator_tab, batch_tab, archive_tab = st.tabs(["Generator", "Batch", "Archive"])
+
+with generator_tab:
+    template_option = st.selectbox("Select Template", list(TEMPLATES))
+    schema = TEMPLATES[template_option]
+    current_input = {"template": template_option, **field_widgets(schema)}
+    plan, signature = output_options()
+    # The signature's hash (not its bytes) identifies the request
+    current_input["outputs"] = plan
+    current_input["signature"] = hashlib.sha256(signature).hexdigest() if signature else None
+    generation_controls(current_input, schema.button_label, schema.document_label, schema.success_message, signature)
+
+
+with batch_tab:
+    st.write("Upload a CSV or JSON file with one row per document. Columns use the field names "
+             "of the selected template (e.g. client_name, invoice_date, cost); a 'template' column "
+             "overrides the selection per row.")
+    batch_template = st.selectbox("Template", list(TEMPLATES), key="batch_template")
+    batch_file = st.file_uploader("Rows (CSV or JSON)", type=["csv", "json"])
+    batch_pdf = st.checkbox("Convert to PDF", value=True)
+
+    if batch_file is not None and st.button("Generate Batch"):
+        try:
+            rows = load_rows(batch_file)
+            zip_buffer = io.BytesIO()
+            with st.spinner(f"Generating {len(rows)} documents..."):
+                report = run_batch(rows, zip_buffer, batch_template, pdf=batch_pdf)
+            st.session_state["batch_zip"] = zip_buffer.getvalue()
+            st.session_state["batch_report"] = report
+            failed = sum(entry["status"] != "ok" for entry in report)
+            if failed:
+                st.warning(f"{len(report) - failed} of {len(report)} rows generated; see the report for errors.")
+            else:
+                st.success(f"{len(report)} documents generated successfully!")
+        except Exception as e:
+            st.error(f"Error: {e}")
 
-    # Display download buttons if options haven't changed
-    if not options_changed() and "word_output" in st.session_state and "pdf_output" in st.session_state:
-        with open(st.session_state["word_output"], "rb") as word_file:
-            st.download_button("Download Invoice (Word)", word_file, file_name=os.path.basename(st.session_state["word_output"]))
-        with open(st.session_state["pdf_output"], "rb") as pdf_file:
-            st.download_button("Download Invoice (PDF)", pdf_file, file_name=os.path.basename(st.session_state["pdf_output"]))
+    if "batch_zip" in st.session_state:
+        st.dataframe(st.session_state["batch_report"])
+        st.download_button("Download Batch (ZIP)", st.session_state["batch_zip"],
+                           file_name=f"{batch_template} batch.zip", mime="application/zip")
 
-    elif options_changed():
-        st.session_state.pop("word_output", None)
-        st.session_state.pop("pdf_output", None)
\ No newline at end of file
+with archive_tab:
+    document_archive = get_document_archive()
+    if document_archive is None:
+        st.info("The document archive is disabled (ARCHIVE_DB=off).")
+    else:
+        archive_browser(document_archive)
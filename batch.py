@@ -0,0 +1,243 @@
+"""
+Batch generation: fill one template per row of a CSV/JSON file and bundle the results.
+
+Rows are validated and given their reference numbers in the parent process (so they
+stay unique across the whole batch), rendered to .docx across a process pool, then
+converted to PDF in batched LibreOffice calls. A failing row is recorded in
+``report.csv`` inside the ZIP instead of aborting the run. Generated documents are
+recorded in the document archive in one transaction.
+
+Usage:
+
+    python batch.py rows.csv --template Invoice -o invoices.zip
+    python batch.py rows.json -o - > documents.zip
+
+Column names are the field keys used in documents.py (``client_name``,
+``invoice_date``, ``cost``...). An optional ``template`` column selects the template
+per row and overrides ``--template``.
+"""
+import argparse
+import concurrent.futures
+import csv
+import io
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import zipfile
+
+from document_archive import get_document_archive
+from documents import (
+    TEMPLATES, build_document, build_placeholders, compiled_template, get_template_spec, output_stem,
+    validate_templates,
+)
+from pdf_converter import convert_many_to_pdf
+from references import generate_reference_number, reserve_serial_numbers
+
+REPORT_FIELDS = ["row", "template", "client_name", "reference", "status", "files", "unfilled", "error"]
+ARCHIVE_CHUNK = 100
+
+
+def load_rows(source, fmt=None):
+    """
+    Read rows from a path or binary file object.
+
+    ``fmt`` is "csv" or "json"; when omitted it is taken from the file extension.
+    JSON input is a list of objects, or an object with a "rows" list.
+    """
+    name = source if isinstance(source, str) else getattr(source, "name", "")
+    fmt = fmt or os.path.splitext(name)[1].lstrip(".").lower()
+    if isinstance(source, str):
+        with open(source, "rb") as f:
+            data = f.read()
+    else:
+        data = source.read()
+    text = data.decode("utf-8-sig")
+    if fmt == "json":
+        rows = json.loads(text)
+        if isinstance(rows, dict):
+            rows = rows.get("rows", [])
+        if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+            raise ValueError("JSON input must be a list of objects or {\"rows\": [...]}")
+        return rows
+    if fmt == "csv":
+        return list(csv.DictReader(io.StringIO(text)))
+    raise ValueError(f"Unsupported batch format {fmt!r}; use .csv or .json")
+
+
+def _render_row(template_name, placeholders, word_path):
+    """Process pool task: fill a template and save it. Runs in a worker process."""
+    build_document(template_name, placeholders).save(word_path)
+    return word_path
+
+
+def _unique_name(name, used):
+    stem, ext = os.path.splitext(name)
+    candidate, n = name, 2
+    while candidate in used:
+        candidate = f"{stem} ({n}){ext}"
+        n += 1
+    used.add(candidate)
+    return candidate
+
+
+def prepare_rows(rows, template_name=None):
+    """
+    Validate rows and issue one reference number per valid row.
+
+    Returns a list of dicts with the row's report entry and, for valid rows, the
+    template name and filled placeholders.
+    """
+    prepared = []
+    for number, fields in enumerate(rows, start=1):
+        name = fields.get("template") or template_name
+        entry = {"row": number, "template": name, "client_name": fields.get("client_name", ""),
+                 "reference": "", "status": "ok", "files": "", "unfilled": "", "error": ""}
+        item = {"report": entry, "template": name, "fields": fields, "placeholders": None, "spec": None}
+        prepared.append(item)
+        try:
+            item["spec"] = get_template_spec(name)
+            # Validate before issuing numbers so bad rows do not consume serials
+            build_placeholders(name, fields, "")
+        except Exception as e:
+            entry["status"] = "error"
+            entry["error"] = str(e)
+
+    valid = [item for item in prepared if item["spec"] is not None and item["report"]["status"] == "ok"]
+    # CR serials for the whole batch come from one reserved block
+    serial_rows = [item for item in valid if item["spec"].reference is generate_reference_number]
+    serials = iter(reserve_serial_numbers(len(serial_rows)) if serial_rows else ())
+    issued = set()
+    for item in valid:
+        entry = item["report"]
+        if item["spec"].reference is generate_reference_number:
+            reference = generate_reference_number(serial_number=next(serials))
+        else:
+            reference = item["spec"].reference()
+        if reference in issued:
+            # Time-based numbers repeat within the same second
+            reference = f"{reference}-{entry['row']:03d}"
+        issued.add(reference)
+        entry["reference"] = reference
+        item["placeholders"] = build_placeholders(item["template"], item["fields"], reference)
+        entry["unfilled"] = ";".join(sorted(compiled_template(item["template"]).unfilled(item["placeholders"])))
+    return prepared
+
+
+def run_batch(rows, out, template_name=None, workers=None, pdf=True):
+    """
+    Generate every row and write a ZIP of the documents plus report.csv to ``out``.
+
+    ``out`` is a path or a writable binary file object. Returns the report rows.
+    """
+    prepared = prepare_rows(rows, template_name)
+    valid = [item for item in prepared if item["placeholders"] is not None]
+
+    with tempfile.TemporaryDirectory(prefix="batch-") as work_dir:
+        used = set()
+        for item in valid:
+            stem = output_stem(item["template"], item["fields"])
+            item["word_name"] = _unique_name(f"{stem}.docx", used)
+            item["word_path"] = os.path.join(work_dir, item["word_name"])
+
+        workers = workers or os.cpu_count() or 1
+        if len(valid) > 1 and workers > 1:
+            context = multiprocessing.get_context("spawn")
+            with concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+                futures = {
+                    pool.submit(_render_row, item["template"], item["placeholders"], item["word_path"]): item
+                    for item in valid
+                }
+                for future in concurrent.futures.as_completed(futures):
+                    try:
+                        future.result()
+                    except Exception as e:
+                        futures[future]["report"].update(status="error", error=str(e))
+        else:
+            for item in valid:
+                try:
+                    _render_row(item["template"], item["placeholders"], item["word_path"])
+                except Exception as e:
+                    item["report"].update(status="error", error=str(e))
+
+        rendered = [item for item in valid if item["report"]["status"] == "ok"]
+        pdf_errors = {}
+        if pdf and rendered:
+            pairs = [(item["word_path"], item["word_path"][:-len(".docx")] + ".pdf") for item in rendered]
+            try:
+                pdf_errors = convert_many_to_pdf(pairs)
+            except Exception as e:
+                pdf_errors = {os.path.abspath(doc): e for doc, _ in pairs}
+
+        with zipfile.ZipFile(out, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+            for item in rendered:
+                item["files"] = {item["word_name"]: item["word_path"]}
+                if pdf:
+                    error = pdf_errors.get(os.path.abspath(item["word_path"]))
+                    if error is None:
+                        pdf_name = item["word_name"][:-len(".docx")] + ".pdf"
+                        item["files"][pdf_name] = item["word_path"][:-len(".docx")] + ".pdf"
+                    else:
+                        item["report"].update(status="pdf_error", error=str(error))
+                for name, path in item["files"].items():
+                    archive.write(path, name)
+                item["report"]["files"] = ";".join(item["files"])
+
+            report = [item["report"] for item in prepared]
+            buffer = io.StringIO()
+            writer = csv.DictWriter(buffer, fieldnames=REPORT_FIELDS)
+            writer.writeheader()
+            writer.writerows(report)
+            archive.writestr("report.csv", buffer.getvalue())
+        record_documents(rendered)
+    return report
+
+
+def record_documents(items):
+    """Add the rendered rows and their files to the document archive, if enabled."""
+    archive = get_document_archive()
+    if archive is None or not items:
+        return
+    # In chunks, so a large batch is not read into memory at once
+    for start in range(0, len(items), ARCHIVE_CHUNK):
+        entries = []
+        for item in items[start:start + ARCHIVE_CHUNK]:
+            files = {}
+            for name, path in item["files"].items():
+                with open(path, "rb") as f:
+                    files[name] = f.read()
+            entries.append({
+                "reference": item["report"]["reference"], "template": item["template"], "fields": item["fields"],
+                "placeholders": item["placeholders"], "files": files,
+                "metadata": item["spec"].metadata(item["fields"]),
+            })
+        archive.record_many(entries)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate documents in bulk from a CSV or JSON file.")
+    parser.add_argument("input", help="CSV or JSON file with one row per document")
+    parser.add_argument("-t", "--template", choices=list(TEMPLATES),
+                        help="template for rows without a 'template' column")
+    parser.add_argument("-o", "--output", default="batch.zip", help="ZIP file to write, or '-' for stdout")
+    parser.add_argument("--format", choices=["csv", "json"], help="input format (default: from extension)")
+    parser.add_argument("--workers", type=int, help="processes used to fill templates (default: CPU count)")
+    parser.add_argument("--no-pdf", action="store_true", help="only produce .docx files")
+    args = parser.parse_args(argv)
+    validate_templates()
+
+    rows = load_rows(args.input, args.format)
+    if args.output == "-":
+        report = run_batch(rows, sys.stdout.buffer, args.template, args.workers, not args.no_pdf)
+    else:
+        report = run_batch(rows, args.output, args.template, args.workers, not args.no_pdf)
+    failed = [entry for entry in report if entry["status"] != "ok"]
+    print(f"{len(report) - len(failed)} of {len(report)} rows generated", file=sys.stderr)
+    for entry in failed:
+        print(f"row {entry['row']}: {entry['status']}: {entry['error']}", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,95 @@
+"""
+Lookup latency of the document archive at scale.
+
+Fills a temporary archive with ``--documents`` synthetic records (metadata and
+placeholder values only; file blobs do not affect the lookups) and times the queries
+behind the UI's Archive tab and the API: exact and prefix reference, client prefix,
+service type, date range, full text, a deep page of the listing and a filtered count.
+
+    python benchmarks/bench_archive.py --documents 300000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from document_archive import DocumentArchive  # noqa: E402
+from template_schema import SERVICE_CATALOGUE  # noqa: E402
+
+WORDS = ("trading", "holding", "services", "logistics", "consulting", "contracting", "foods", "technologies")
+
+
+def populate(archive, count, chunk=5000):
+    random.seed(1)
+    service_types = list(SERVICE_CATALOGUE)
+    start = date(2020, 1, 1)
+    for first in range(0, count, chunk):
+        entries = []
+        for i in range(first, min(count, first + chunk)):
+            client = f"{random.choice(WORDS).title()} {i % 20000} W.L.L."
+            service_type = random.choice(service_types)
+            day = start + timedelta(days=i * 1800 // count)
+            entries.append({
+                "reference": f"BKR{day.month:02d}-{day.year}-CR{1000 + i}",
+                "template": "Invoice",
+                "fields": {"client_name": client},
+                "placeholders": {"<<Client Name>>": client, "<<Service Type>>": service_type,
+                                 "<<Remark>>": f"{random.choice(WORDS)} {random.choice(WORDS)}"},
+                "files": {},
+                "metadata": {"client": client, "service_type": service_type,
+                             "service": random.choice(SERVICE_CATALOGUE[service_type]),
+                             "amount": round(random.uniform(10, 5000), 3), "document_date": day},
+            })
+        archive.record_many(entries)
+
+
+def timeit(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time document archive lookups.")
+    parser.add_argument("--documents", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="bench-archive-") as tmp:
+        archive = DocumentArchive(os.path.join(tmp, "archive.db"), store_files=False)
+        started = time.perf_counter()
+        populate(archive, args.documents)
+        print(f"inserted {args.documents} documents in {time.perf_counter() - started:.1f}s")
+
+        middle = 1000 + args.documents // 2
+        page = archive.search(limit=50)
+        for _ in range(20):
+            page = archive.search(limit=50, before=page["next"])
+        queries = {
+            "reference (exact)": lambda: archive.by_reference(f"BKR01-2022-CR{middle}"),
+            "reference (prefix)": lambda: archive.search(reference="BKR01-2022"),
+            "client (prefix)": lambda: archive.search(client="trading 1234"),
+            "service type": lambda: archive.search(service_type="CIO Affairs"),
+            "date range": lambda: archive.search(date_from="2022-03-01", date_to="2022-03-31"),
+            "full text": lambda: archive.search(text="logistics consulting"),
+            "page 21 (keyset)": lambda: archive.search(limit=50, before=page["next"]),
+            "count (service type + dates)": lambda: archive.count(service_type="CIO Affairs", date_from="2022-01-01",
+                                                                  date_to="2022-12-31"),
+        }
+        for name, query in queries.items():
+            print(f"{name:<30} {timeit(query, args.repeat) * 1000:8.2f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
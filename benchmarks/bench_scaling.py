@@ -0,0 +1,134 @@
+"""
+Shared-state backends under several processes (see shared_state.py).
+
+For the ``local`` (SQLite/files) and ``redis`` backends - the latter against the
+in-memory stand-in from resp_server.py:
+
+* ``serials`` - ``--processes`` processes draw ``--serials`` reference serials each at
+  the same time; every number must be unique;
+* ``jobs`` - ``--workers`` worker.py processes run ``--jobs`` generations queued by two
+  independent job managers (two "web replicas"), alternating a CR-serial template
+  and the Invoice (time-based numbers); every job must finish, its files must be
+  readable from the shared output store and its reference must be unique.
+
+    python benchmarks/bench_scaling.py --processes 8 --workers 3 --jobs 40
+
+Serial numbers, outputs and jobs live in temporary locations; PDFs are rendered by
+the native backend so LibreOffice is not needed.
+"""
+import argparse
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import resp_server  # noqa: E402
+from jobs import DONE, FAILED, QueuedJobManager, RedisJobQueue, SqliteJobQueue  # noqa: E402
+from output_store import FileOutputStore, RedisOutputStore  # noqa: E402
+from resp_client import RespClient  # noqa: E402
+from serial_allocator import RedisSerialAllocator, SerialAllocator  # noqa: E402
+
+# One template per reference scheme: CR serials and time-based invoice numbers
+TEMPLATES = ("Service Agreement", "Invoice")
+
+
+def make_allocator(backend, state_dir, redis_url):
+    path = os.path.join(state_dir, "serial_data.db")
+    if backend == "redis":
+        return RedisSerialAllocator(RespClient(redis_url), seed_db=path, seed_file=None)
+    return SerialAllocator(path, seed_file=None)
+
+
+def draw_serials(args):
+    backend, state_dir, redis_url, count = args
+    allocator = make_allocator(backend, state_dir, redis_url)
+    return [allocator.next() for _ in range(count)]
+
+
+def bench_serials(backend, state_dir, redis_url, processes, count):
+    started = time.perf_counter()
+    with multiprocessing.get_context("spawn").Pool(processes) as pool:
+        drawn = pool.map(draw_serials, [(backend, state_dir, redis_url, count)] * processes)
+    elapsed = time.perf_counter() - started
+    numbers = [number for chunk in drawn for number in chunk]
+    unique = len(set(numbers)) == len(numbers)
+    print(f"{backend:<6} serials  {len(numbers)} drawn by {processes} processes in {elapsed:.2f}s "
+          f"({len(numbers) / elapsed:,.0f}/s), {'all unique' if unique else 'DUPLICATES'}")
+    return unique
+
+
+def bench_jobs(backend, state_dir, redis_url, workers, count):
+    from documents import run_generation
+
+    env = {**os.environ, "STATE_BACKEND": backend, "STATE_DIR": state_dir, "REDIS_URL": redis_url,
+           "SERIAL_DB": os.path.join(state_dir, "serial_data.db"), "PDF_BACKEND": "native",
+           "ARCHIVE_DB": "off", "GENERATION_LOG": "off"}
+    processes = [subprocess.Popen([sys.executable, os.path.join(ROOT, "worker.py"), "--threads", "2"],
+                                  cwd=ROOT, env=env, stderr=subprocess.DEVNULL) for _ in range(workers)]
+    try:
+        if backend == "redis":
+            replicas = [QueuedJobManager(RedisJobQueue(RespClient(redis_url))) for _ in range(2)]
+            store = RedisOutputStore(RespClient(redis_url))
+        else:
+            replicas = [QueuedJobManager(SqliteJobQueue(os.path.join(state_dir, "jobs.db"))) for _ in range(2)]
+            store = FileOutputStore(os.path.join(state_dir, "outputs"))
+        started = time.perf_counter()
+        jobs = [replicas[i % 2].submit(f"session-{i}", "bench", run_generation, TEMPLATES[i // 2 % 2],
+                                       {"client_name": f"Client {i}"}, fresh=True)
+                for i in range(count)]
+        # Poll through the other replica, as a load balancer might route it
+        pending = {job.id: replicas[(i + 1) % 2] for i, job in enumerate(jobs)}
+        finished = {}
+        while pending and time.perf_counter() - started < 300:
+            for job_id, replica in list(pending.items()):
+                job = replica.get(job_id)
+                if job.status in (DONE, FAILED):
+                    finished[job_id] = job
+                    del pending[job_id]
+            time.sleep(0.05)
+        elapsed = time.perf_counter() - started
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait(30)
+    done = [job for job in finished.values() if job.status == DONE]
+    references = [job.result["reference"] for job in done]
+    with_files = sum(store.get(job.id) is not None for job in done)
+    ok = len(done) == count and len(set(references)) == count and with_files == count
+    print(f"{backend:<6} jobs     {len(done)}/{count} done by {workers} workers in {elapsed:.2f}s "
+          f"({count / elapsed:.1f}/s), {with_files} with files, "
+          f"{'references unique' if len(set(references)) == len(references) else 'DUPLICATE references'}")
+    for job in finished.values():
+        if job.status == FAILED:
+            print(f"       failed: {job.error}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check and time the shared-state backends.")
+    parser.add_argument("--backend", choices=["local", "redis"], action="append")
+    parser.add_argument("--processes", type=int, default=8)
+    parser.add_argument("--serials", type=int, default=500, help="serials drawn per process")
+    parser.add_argument("--workers", type=int, default=3)
+    parser.add_argument("--jobs", type=int, default=30)
+    args = parser.parse_args()
+
+    server = resp_server.start()
+    redis_url = f"redis://127.0.0.1:{server.server_address[1]}/0"
+    ok = True
+    for backend in args.backend or ["local", "redis"]:
+        with tempfile.TemporaryDirectory(prefix=f"bench-scaling-{backend}-") as state_dir:
+            ok &= bench_serials(backend, state_dir, redis_url, args.processes, args.serials)
+            ok &= bench_jobs(backend, state_dir, redis_url, args.workers, args.jobs)
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,127 @@
+"""
+Start-up benchmark for the Streamlit app and the HTTP API.
+
+Each measurement runs in a fresh interpreter so nothing is already imported:
+
+* ``import/<module>`` - time to import documents.py, api.py and batch.py;
+* ``app/first_run`` - first run of app.py in Streamlit's AppTest harness, the page a
+  new container serves to its first visitor (Streamlit import included);
+* ``app/rerun`` - a later rerun of the same session, paid on every widget change;
+* ``app/warmup`` - how long the background warm-up (template compile, PDF backend)
+  took to finish.
+
+Results use the JSON layout of run_benchmarks.py, so ``--output``/``--baseline`` work
+the same way:
+
+    python benchmarks/bench_startup.py --repeat 5 --output startup.json
+    python benchmarks/bench_startup.py --baseline startup.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULES = ("documents", "api", "batch")
+
+
+def child_import(module):
+    sys.path.insert(0, ROOT)
+    started = time.perf_counter()
+    __import__(module)
+    return {"seconds": time.perf_counter() - started}
+
+
+def child_app(reruns):
+    sys.path.insert(0, ROOT)
+    from streamlit.testing.v1 import AppTest
+
+    started = time.perf_counter()
+    at = AppTest.from_file(os.path.join(ROOT, "app.py"), default_timeout=120)
+    at.run()
+    first_run = time.perf_counter() - started
+    rerun_times = []
+    for _ in range(reruns):
+        started = time.perf_counter()
+        at.run()
+        rerun_times.append(time.perf_counter() - started)
+    # The warm-up thread is the cached resource created by the first run
+    from documents import Warmup
+
+    warmups = [thread for thread in threading.enumerate() if isinstance(thread, Warmup)]
+    for thread in warmups:
+        thread.join(120)
+    warmup = warmups[0].duration if warmups else None
+    return {"first_run": first_run, "rerun": statistics.median(rerun_times), "warmup": warmup}
+
+
+def run_child(*args):
+    """Run this script in a fresh interpreter and return its JSON result."""
+    env = {**os.environ, "GENERATION_LOG": "off"}
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", *args],
+        check=True, capture_output=True, text=True, cwd=ROOT, env=env,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def summary(values):
+    values = [v for v in values if v is not None]
+    if not values:
+        return None
+    return {"median": statistics.median(values), "min": min(values), "max": max(values), "runs": len(values)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure cold start and rerun latency.")
+    parser.add_argument("--repeat", type=int, default=3, help="fresh interpreters per measurement")
+    parser.add_argument("--reruns", type=int, default=5, help="reruns timed per app session")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--baseline", help="compare with a JSON file written by --output")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--child", nargs="+", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        kind, *rest = args.child
+        result = child_import(rest[0]) if kind == "import" else child_app(int(rest[0]))
+        print(json.dumps(result))
+        return 0
+
+    timings = {"import": {}, "app": {}}
+    for module in MODULES:
+        runs = [run_child("import", module)["seconds"] for _ in range(args.repeat)]
+        timings["import"][module] = summary(runs)
+        print(f"import {module:<12} {timings['import'][module]['median'] * 1000:8.1f} ms")
+
+    runs = [run_child("app", str(args.reruns)) for _ in range(args.repeat)]
+    for key in ("first_run", "rerun", "warmup"):
+        timings["app"][key] = summary([run[key] for run in runs])
+        if timings["app"][key] is None:
+            del timings["app"][key]
+            continue
+        print(f"app {key:<15} {timings['app'][key]['median'] * 1000:8.1f} ms")
+
+    results = {"environment": {"python": sys.version.split()[0], "repeat": args.repeat}, "timings": timings}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        from run_benchmarks import compare
+
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} metric(s) slower than the baseline by more than {args.tolerance:.0%}")
+            return 1
+        print("\nNo regressions")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
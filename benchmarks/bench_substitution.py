@@ -0,0 +1,85 @@
+"""
+Micro-benchmark: legacy placeholder replacement vs the single-pass engine.
+
+Runs each strategy on fresh copies of the three bundled templates and prints the
+median time per document. Usage (from the repository root):
+
+    python benchmarks/bench_substitution.py [--repeat 50]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from placeholders import fill_placeholders  # noqa: E402
+from template_cache import get_template  # noqa: E402
+
+TEMPLATES = [
+    "SAMPLE VAT registration and VAT filling -SME package.docx",
+    "SAMPLE Service Agreement -Company formation -Bahrain - Filled.docx",
+    "SAMPLE -Invoice BKR2024CF158 - first payment.docx",
+]
+
+
+def legacy_replace_placeholders(doc, placeholders):
+    """The keys x paragraphs implementation app.py used before the engine."""
+
+    def replace_in_paragraph(paragraph, key, value):
+        full_text = "".join(run.text for run in paragraph.runs)
+        if key in full_text:
+            full_text = full_text.replace(key, value)
+            for run in paragraph.runs:
+                run.text = ""
+            paragraph.runs[0].text = full_text
+
+    for para in doc.paragraphs:
+        for key, value in placeholders.items():
+            replace_in_paragraph(para, key, value)
+    for table in doc.tables:
+        for row in table.rows:
+            for cell in row.cells:
+                for para in cell.paragraphs:
+                    for key, value in placeholders.items():
+                        replace_in_paragraph(para, key, value)
+    return doc
+
+
+def time_strategy(template, placeholders, strategy, repeat):
+    timings = []
+    for _ in range(repeat):
+        doc = template.new_document()
+        started = time.perf_counter()
+        strategy(doc, placeholders)
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    strategies = [
+        ("legacy", lambda template: legacy_replace_placeholders),
+        ("engine, full scan", lambda template: fill_placeholders),
+        ("engine, indexed", lambda template: lambda doc, values: fill_placeholders(
+            doc, values, template.placeholder_paragraphs(doc))),
+    ]
+
+    print(f"{'template':<40} {'strategy':<18} {'median ms':>10} {'speedup':>8}")
+    for path in TEMPLATES:
+        template = get_template(os.path.join(ROOT, path))
+        placeholders = {token: f"Sample value {i}" for i, token in enumerate(sorted(template.tokens))}
+        baseline = None
+        for name, make in strategies:
+            elapsed = time_strategy(template, placeholders, make(template), args.repeat)
+            baseline = baseline or elapsed
+            print(f"{path[:40]:<40} {name:<18} {elapsed * 1000:>10.2f} {baseline / elapsed:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
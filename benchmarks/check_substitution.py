@@ -0,0 +1,145 @@
+"""
+Correctness check for the single-pass substitution engine (placeholders.py).
+
+* bundled templates - fills each one with the engine (indexed and full scan)
+  and with the legacy implementation; every body and table paragraph must read the
+  same, no ``<<...>>`` token may be left anywhere in the document and tabs and line
+  breaks of the values must become w:tab/w:br elements;
+* split runs - fills a small generated document whose placeholders are split across
+  differently formatted runs, with values containing tabs, line breaks and edge
+  spaces; the text around each placeholder must keep its run and formatting, and the
+  value must take the formatting of the run the placeholder starts in.
+
+Exits non-zero on the first failing document. Usage (from the repository root):
+
+    python benchmarks/check_substitution.py
+"""
+import io
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from docx import Document  # noqa: E402
+
+from bench_substitution import TEMPLATES, legacy_replace_placeholders  # noqa: E402
+from placeholders import fill_placeholders, unfilled_placeholders  # noqa: E402
+from template_cache import get_template, iter_paragraphs, text_nodes  # noqa: E402
+
+
+class CheckFailed(Exception):
+    pass
+
+
+def expect(condition, message):
+    if not condition:
+        raise CheckFailed(message)
+
+
+def reload(doc):
+    """Save and re-open ``doc``, so the checks see what a user downloads."""
+    buffer = io.BytesIO()
+    doc.save(buffer)
+    buffer.seek(0)
+    return Document(buffer)
+
+
+def raw_specials(doc):
+    """Text nodes holding a literal tab or newline, which Word shows as a space instead of a w:tab/w:br."""
+    return [t.text for _, p in iter_paragraphs(doc) for t in text_nodes(p)
+            if t.text and ("\t" in t.text or "\n" in t.text)]
+
+
+def legacy_paragraphs(doc):
+    """Text of the paragraphs the legacy implementation visited: the body and top-level tables."""
+    texts = [para.text for para in doc.paragraphs]
+    for table in doc.tables:
+        for row in table.rows:
+            for cell in row.cells:
+                texts.extend(para.text for para in cell.paragraphs)
+    return texts
+
+
+def check_template(path):
+    template = get_template(os.path.join(ROOT, path))
+    # Values with the characters Word stores as elements, and edge spaces
+    placeholders = {token: f"Value {i}\twith tab" if i % 3 == 0 else f" Line {i}\nbreak " if i % 3 == 1
+                    else f"Plain {i}" for i, token in enumerate(sorted(template.tokens))}
+    expected = legacy_paragraphs(reload(legacy_replace_placeholders(template.new_document(), placeholders)))
+    strategies = {
+        "indexed": lambda doc: fill_placeholders(doc, placeholders, template.placeholder_paragraphs(doc)),
+        "full scan": lambda doc: fill_placeholders(doc, placeholders),
+    }
+    for name, fill in strategies.items():
+        doc = reload(fill(template.new_document()))
+        actual = legacy_paragraphs(doc)
+        expect(len(actual) == len(expected), f"{name}: {len(actual)} paragraphs, legacy has {len(expected)}")
+        for index, (got, want) in enumerate(zip(actual, expected)):
+            expect(got == want, f"{name}: paragraph {index} reads {got!r}, legacy {want!r}")
+        left = unfilled_placeholders(doc)
+        expect(not left, f"{name}: placeholders left unfilled: {left}")
+        expect(not raw_specials(doc), f"{name}: tabs or line breaks kept as text: {raw_specials(doc)}")
+    return len(placeholders)
+
+
+def formatted(paragraph, *runs):
+    """Add ``runs``, (text, {"bold": True, ...}) pairs, to ``paragraph``."""
+    for text, style in runs:
+        run = paragraph.add_run(text)
+        for attribute, value in style.items():
+            setattr(run, attribute, value)
+
+
+def run_summary(paragraph):
+    return [(run.text, bool(run.bold), bool(run.italic), bool(run.underline)) for run in paragraph.runs]
+
+
+def check_runs():
+    doc = Document()
+    # A placeholder split over two runs with different formatting
+    formatted(doc.add_paragraph(), ("Dear ", {}), ("<<Cli", {"bold": True}), ("ent>>", {"italic": True}),
+              (", welcome", {"underline": True}))
+    # Two placeholders inside one run, and one spanning three runs
+    formatted(doc.add_paragraph(), ("Ref <<Ref>> / <<Ref>>", {"bold": True}), (" for <<", {}),
+              ("Ser", {"italic": True}), ("vice>>.", {"underline": True}))
+    placeholders = {"<<Client>>": "Acme\tHolding\nBranch", "<<Ref>>": " CR42 ", "<<Service>>": "Audit"}
+    fill_placeholders(doc, placeholders)
+    doc = reload(doc)
+    first, second = doc.paragraphs
+
+    expect(first.text == "Dear Acme\tHolding\nBranch, welcome", f"split placeholder: {first.text!r}")
+    expect(run_summary(first) == [
+        ("Dear ", False, False, False),
+        ("Acme\tHolding\nBranch", True, False, False),
+        ("", False, True, False),
+        (", welcome", False, False, True),
+    ], f"split placeholder runs: {run_summary(first)}")
+    expect(second.text == "Ref  CR42  /  CR42  for Audit.", f"placeholders in one run: {second.text!r}")
+    expect(run_summary(second) == [
+        ("Ref  CR42  /  CR42 ", True, False, False),
+        (" for Audit", False, False, False),
+        ("", False, True, False),
+        (".", False, False, True),
+    ], f"placeholders in one run: {run_summary(second)}")
+    expect(not unfilled_placeholders(doc), "synthetic document: placeholders left unfilled")
+    expect(not raw_specials(doc), f"synthetic document: tabs or line breaks kept as text: {raw_specials(doc)}")
+    return len(placeholders)
+
+
+def main():
+    checks = [(os.path.basename(path), lambda path=path: check_template(path)) for path in TEMPLATES]
+    checks.append(("split runs, tabs and line breaks", check_runs))
+    for name, check in checks:
+        try:
+            count = check()
+        except CheckFailed as e:
+            print(f"FAIL {name}: {e}")
+            return 1
+        print(f"ok   {name} ({count} placeholders)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
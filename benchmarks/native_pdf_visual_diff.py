@@ -0,0 +1,141 @@
+"""
+Visual regression check: native_pdf.py against LibreOffice.
+
+Fills every bundled template with sample values, renders it with the "libreoffice"
+backend and with native_pdf.render_docx (not the native backend, which falls back to
+LibreOffice for text it cannot show), rasterises the pages with ``pdftoppm`` and
+compares them pixel by pixel. A template fails when the native renderer refuses it,
+when the page counts differ or when more than ``--threshold`` of the pixels on any
+page differ. Render times of both backends are printed as well.
+
+    python benchmarks/native_pdf_visual_diff.py [--dpi 50] [--threshold 0.06] [--keep out/]
+
+Needs LibreOffice and poppler-utils (pdftoppm); exits with status 0 and a notice
+when either is missing.
+"""
+import argparse
+import io
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import native_pdf  # noqa: E402
+from documents import TEMPLATES, build_document, compiled_template  # noqa: E402
+from pdf_converter import docx_bytes_to_pdf, find_soffice, get_pool  # noqa: E402
+
+# Pixels whose grey levels differ by less than this are considered equal (antialiasing)
+TOLERANCE = 48
+
+
+def sample_docx(template_name):
+    """The template with every placeholder replaced by a sample value of similar length."""
+    tokens = compiled_template(template_name).tokens
+    placeholders = {token: "Sample " + token.strip("<> ") for token in tokens}
+    buffer = io.BytesIO()
+    build_document(template_name, placeholders).save(buffer)
+    return buffer.getvalue()
+
+
+def rasterise(pdf, dpi, directory, prefix):
+    """Render ``pdf`` bytes to greyscale pages; returns [(width, height, pixels)]."""
+    path = os.path.join(directory, f"{prefix}.pdf")
+    with open(path, "wb") as f:
+        f.write(pdf)
+    subprocess.run(["pdftoppm", "-gray", "-r", str(dpi), path, os.path.join(directory, prefix)], check=True)
+    pages = sorted(name for name in os.listdir(directory) if name.startswith(prefix + "-") and name.endswith(".pgm"))
+    return [read_pgm(os.path.join(directory, name)) for name in pages]
+
+
+def read_pgm(path):
+    """Parse a binary (P5) PGM file with 8-bit samples."""
+    with open(path, "rb") as f:
+        data = f.read()
+    fields = []
+    pos = 0
+    while len(fields) < 4:
+        while data[pos:pos + 1].isspace():
+            pos += 1
+        if data[pos:pos + 1] == b"#":
+            pos = data.index(b"\n", pos)
+            continue
+        end = pos
+        while not data[end:end + 1].isspace():
+            end += 1
+        fields.append(data[pos:end])
+        pos = end
+    if fields[0] != b"P5":
+        raise ValueError(f"{path} is not a binary PGM file")
+    width, height = int(fields[1]), int(fields[2])
+    return width, height, data[pos + 1:pos + 1 + width * height]
+
+
+def page_difference(a, b):
+    """Fraction of pixels that differ noticeably between two pages (sizes may differ slightly)."""
+    width, height = min(a[0], b[0]), min(a[1], b[1])
+    different = 0
+    for y in range(height):
+        row_a = a[2][y * a[0]:y * a[0] + width]
+        row_b = b[2][y * b[0]:y * b[0] + width]
+        different += sum(1 for pa, pb in zip(row_a, row_b) if abs(pa - pb) > TOLERANCE)
+    return different / (width * height)
+
+
+def timed(fn, *args, **kwargs):
+    started = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare native PDF rendering with LibreOffice output.")
+    parser.add_argument("--dpi", type=int, default=50)
+    parser.add_argument("--threshold", type=float, default=0.06, help="max fraction of differing pixels per page")
+    parser.add_argument("--keep", help="directory to keep the rendered PDFs in")
+    args = parser.parse_args()
+
+    missing = [tool for tool, found in (("LibreOffice", find_soffice()), ("pdftoppm", shutil.which("pdftoppm"))) if not found]
+    if missing:
+        print(f"SKIP: {' and '.join(missing)} not installed")
+        return 0
+
+    failures = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        # Start the pool first so the LibreOffice time is the warm per-document cost
+        get_pool()
+        for template_name in TEMPLATES:
+            data = sample_docx(template_name)
+            stem = template_name.replace(" ", "_")
+            reference, reference_time = timed(docx_bytes_to_pdf, data, f"{stem}.docx", backend="libreoffice")
+            # The renderer itself: the native backend would hand documents it refuses to LibreOffice
+            try:
+                native, native_time = timed(native_pdf.render_docx, data)
+            except native_pdf.UnsupportedTextError as e:
+                failures += 1
+                print(f"FAIL {template_name}: the native renderer refused it: {e}")
+                continue
+            if args.keep:
+                os.makedirs(args.keep, exist_ok=True)
+                for suffix, pdf in (("libreoffice", reference), ("native", native)):
+                    with open(os.path.join(args.keep, f"{stem}.{suffix}.pdf"), "wb") as f:
+                        f.write(pdf)
+
+            expected = rasterise(reference, args.dpi, tmp, f"{stem}-lo")
+            actual = rasterise(native, args.dpi, tmp, f"{stem}-native")
+            differences = [page_difference(a, b) for a, b in zip(expected, actual)]
+            ok = len(expected) == len(actual) and all(d <= args.threshold for d in differences)
+            failures += not ok
+            print(f"{'OK  ' if ok else 'FAIL'} {template_name}: pages {len(actual)}/{len(expected)}, "
+                  f"max diff {max(differences, default=0):.1%}, "
+                  f"libreoffice {reference_time * 1000:.0f} ms, native {native_time * 1000:.0f} ms")
+    get_pool().shutdown()
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,327 @@
+"""
+In-memory stand-in for a Redis server, for trying the ``redis`` state backend locally.
+
+Speaks RESP2 and implements only the commands resp_client.py users send (strings with
+NX/EX/PX, INCRBY, hashes, blocking list pops, sorted-set ranges, key expiry). Data
+lives in this process and is lost when it exits - use a real Redis or Valkey server
+for anything beyond tests and benchmarks.
+
+    python benchmarks/resp_server.py --port 6399
+    STATE_BACKEND=redis REDIS_URL=redis://localhost:6399/0 python api.py
+"""
+import argparse
+import socketserver
+import sys
+import threading
+import time
+
+
+class Store:
+    """The keyspace: key -> value (bytes, dict, list or {member: score}) plus expiry times."""
+
+    def __init__(self):
+        self.data = {}
+        self.expires = {}
+        self.changed = threading.Condition()
+
+    def _alive(self, key):
+        expires = self.expires.get(key)
+        if expires is not None and expires <= time.monotonic():
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+        return key in self.data
+
+    def get(self, key, kind, default=None):
+        if not self._alive(key):
+            return default
+        value = self.data[key]
+        if not isinstance(value, kind):
+            raise CommandError("WRONGTYPE Operation against a key holding the wrong kind of value")
+        return value
+
+    def set(self, key, value, ttl=None):
+        self.data[key] = value
+        if ttl is None:
+            self.expires.pop(key, None)
+        else:
+            self.expires[key] = time.monotonic() + ttl
+
+    def delete(self, key):
+        existed = self._alive(key)
+        self.data.pop(key, None)
+        self.expires.pop(key, None)
+        return existed
+
+
+class CommandError(Exception):
+    pass
+
+
+def _int(value):
+    try:
+        return int(value)
+    except ValueError:
+        raise CommandError("ERR value is not an integer or out of range")
+
+
+def execute(store, args):
+    """Run one command under the store's lock and return the reply value."""
+    name = args[0].upper().decode("ascii")
+    args = args[1:]
+    if name == "BRPOP":
+        return _brpop(store, args)
+    if name == "BRPOPLPUSH":
+        return _brpoplpush(store, args)
+    with store.changed:
+        handler = COMMANDS.get(name)
+        if handler is None:
+            raise CommandError(f"ERR unknown command '{name.lower()}'")
+        reply = handler(store, *args)
+        if name in ("LPUSH",):
+            store.changed.notify_all()
+        return reply
+
+
+def _set(store, key, value, *options):
+    options = [option.upper() for option in options]
+    ttl = None
+    if b"EX" in options:
+        ttl = _int(options[options.index(b"EX") + 1])
+    elif b"PX" in options:
+        ttl = _int(options[options.index(b"PX") + 1]) / 1000
+    if b"NX" in options and store._alive(key):
+        return None
+    store.set(key, value, ttl)
+    return Status("OK")
+
+
+def _incrby(store, key, amount):
+    value = _int(store.get(key, bytes, b"0")) + _int(amount)
+    ttl = store.expires.get(key)
+    store.data[key] = str(value).encode("ascii")
+    if ttl is None:
+        store.expires.pop(key, None)
+    return value
+
+
+def _expire(store, key, seconds):
+    if not store._alive(key):
+        return 0
+    store.expires[key] = time.monotonic() + _int(seconds)
+    return 1
+
+
+def _hset(store, key, *pairs):
+    value = store.get(key, dict)
+    if value is None:
+        value = {}
+        store.set(key, value)
+    added = 0
+    for field, field_value in zip(pairs[::2], pairs[1::2]):
+        added += field not in value
+        value[field] = field_value
+    return added
+
+
+def _hdel(store, key, *fields):
+    value = store.get(key, dict, {})
+    removed = sum(value.pop(field, None) is not None for field in fields)
+    if not value:
+        store.delete(key)
+    return removed
+
+
+def _hgetall(store, key):
+    return [item for pair in store.get(key, dict, {}).items() for item in pair]
+
+
+def _lpush(store, key, *values):
+    value = store.get(key, list)
+    if value is None:
+        value = []
+        store.set(key, value)
+    value[:0] = reversed(values)
+    return len(value)
+
+
+def _brpop(store, args):
+    *keys, timeout = args
+    deadline = time.monotonic() + float(timeout) if float(timeout) > 0 else None
+    with store.changed:
+        while True:
+            for key in keys:
+                value = store.get(key, list)
+                if value:
+                    item = value.pop()
+                    if not value:
+                        store.delete(key)
+                    return [key, item]
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return NullArray()
+            store.changed.wait(remaining)
+
+
+def _brpoplpush(store, args):
+    source, destination, timeout = args
+    reply = _brpop(store, [source, timeout])
+    if isinstance(reply, NullArray):
+        return None
+    _lpush(store, destination, reply[1])
+    return reply[1]
+
+
+def _lrem(store, key, count, element):
+    value = store.get(key, list, [])
+    count = _int(count)
+    indices = [i for i, item in enumerate(value) if item == element]
+    if count < 0:
+        indices = indices[::-1]
+    indices = indices[:abs(count)] if count else indices
+    for i in sorted(indices, reverse=True):
+        del value[i]
+    if not value:
+        store.delete(key)
+    return len(indices)
+
+
+def _hincrby(store, key, field, amount):
+    value = store.get(key, dict)
+    if value is None:
+        value = {}
+        store.set(key, value)
+    value[field] = str(_int(value.get(field, b"0")) + _int(amount)).encode("ascii")
+    return int(value[field])
+
+
+def _zadd(store, key, score, member):
+    value = store.get(key, Scores)
+    if value is None:
+        value = Scores()
+        store.set(key, value)
+    added = member not in value
+    value[member] = float(score)
+    return int(added)
+
+
+def _zrevrange(store, key, start, stop):
+    members = sorted(store.get(key, Scores, Scores()).items(), key=lambda item: item[1], reverse=True)
+    return [member for member, _ in _range(members, start, stop)]
+
+
+def _range(items, start, stop):
+    stop = _int(stop)
+    return items[_int(start):None if stop == -1 else stop + 1]
+
+
+class Scores(dict):
+    pass
+
+
+class Status(str):
+    pass
+
+
+class NullArray:
+    pass
+
+
+COMMANDS = {
+    "PING": lambda store, *args: args[0] if args else Status("PONG"),
+    "AUTH": lambda store, *args: Status("OK"),
+    "SELECT": lambda store, db: Status("OK"),
+    "FLUSHALL": lambda store: (store.data.clear(), store.expires.clear(), Status("OK"))[-1],
+    "GET": lambda store, key: store.get(key, bytes),
+    "SET": _set,
+    "DEL": lambda store, *keys: sum(store.delete(key) for key in keys),
+    "EXISTS": lambda store, *keys: sum(store._alive(key) for key in keys),
+    "INCR": lambda store, key: _incrby(store, key, b"1"),
+    "INCRBY": _incrby,
+    "EXPIRE": _expire,
+    "HSET": _hset,
+    "HGET": lambda store, key, field: store.get(key, dict, {}).get(field),
+    "HMGET": lambda store, key, *fields: [store.get(key, dict, {}).get(field) for field in fields],
+    "HINCRBY": _hincrby,
+    "HDEL": _hdel,
+    "HGETALL": _hgetall,
+    "LPUSH": _lpush,
+    "LLEN": lambda store, key: len(store.get(key, list, [])),
+    "LRANGE": lambda store, key, start, stop: _range(store.get(key, list, []), start, stop),
+    "LREM": _lrem,
+    "ZADD": _zadd,
+    "ZREVRANGE": _zrevrange,
+}
+
+
+def encode(reply):
+    if isinstance(reply, Status):
+        return b"+" + reply.encode("ascii") + b"\r\n"
+    if isinstance(reply, CommandError):
+        return b"-" + str(reply).encode("utf-8") + b"\r\n"
+    if isinstance(reply, bool) or isinstance(reply, int):
+        return b":%d\r\n" % reply
+    if isinstance(reply, NullArray):
+        return b"*-1\r\n"
+    if reply is None:
+        return b"$-1\r\n"
+    if isinstance(reply, bytes):
+        return b"$%d\r\n%s\r\n" % (len(reply), reply)
+    if isinstance(reply, list):
+        return b"*%d\r\n" % len(reply) + b"".join(encode(item) for item in reply)
+    raise TypeError(f"Cannot encode {reply!r}")
+
+
+class Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            if not line.startswith(b"*"):
+                self.wfile.write(encode(CommandError("ERR only RESP arrays are supported")))
+                return
+            args = []
+            for _ in range(int(line[1:])):
+                length = int(self.rfile.readline()[1:])
+                args.append(self.rfile.read(length + 2)[:-2])
+            try:
+                reply = execute(self.server.store, args)
+            except CommandError as e:
+                reply = e
+            except (TypeError, ValueError, IndexError):
+                reply = CommandError(f"ERR wrong arguments for '{args[0].decode('ascii', 'replace').lower()}'")
+            self.wfile.write(encode(reply))
+
+
+class RespServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address):
+        super().__init__(address, Handler)
+        self.store = Store()
+
+
+def start(host="127.0.0.1", port=0):
+    """Serve on a background thread; returns the server (``server.server_address`` has the port)."""
+    server = RespServer((host, port))
+    threading.Thread(target=server.serve_forever, name="resp-server", daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="In-memory Redis stand-in for local testing.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6379)
+    args = parser.parse_args()
+    server = RespServer((args.host, args.port))
+    print(f"listening on {args.host}:{args.port}", file=sys.stderr, flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
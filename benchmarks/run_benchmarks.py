@@ -0,0 +1,268 @@
+"""
+Benchmark suite for the generation path.
+
+Times, per bundled template: python-docx ``Document()`` loading, the legacy
+paragraph-by-paragraph replacement (what ``replace_placeholders`` /
+``replace_placeholders_vat`` did) against the placeholder engine, ``doc.save`` and
+PDF conversion on a cold and on a warm backend. It then measures end-to-end
+throughput of ``generate_outputs`` at N concurrent generations and records peak RSS
+of this process and of its children (soffice).
+
+Results are written as JSON; ``--baseline`` compares them with a stored run and
+exits non-zero when a timing got slower by more than ``--tolerance``:
+
+    python benchmarks/run_benchmarks.py --output baseline.json
+    python benchmarks/run_benchmarks.py --baseline baseline.json --tolerance 0.25
+
+Serial numbers are drawn from, and generated documents archived in, temporary
+databases, so running the suite does not consume real reference numbers.
+"""
+import argparse
+import concurrent.futures
+import io
+import json
+import os
+import platform
+import resource
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+_serial_dir = tempfile.TemporaryDirectory(prefix="bench-serials-")
+os.environ["SERIAL_DB"] = os.path.join(_serial_dir.name, "serial_data.db")
+os.environ["ARCHIVE_DB"] = os.path.join(_serial_dir.name, "document_archive.db")
+
+from docx import Document  # noqa: E402
+
+from bench_substitution import legacy_replace_placeholders  # noqa: E402
+from documents import TEMPLATE_DIR, TEMPLATES, compiled_template, generate_outputs  # noqa: E402
+import pdf_converter  # noqa: E402
+from pdf_converter import ConversionPool, find_soffice, get_backend  # noqa: E402
+from placeholders import fill_placeholders  # noqa: E402
+
+# Fields for the end-to-end run; every template accepts them
+SAMPLE_FIELDS = {
+    "client_name": "Benchmark Client W.L.L.",
+    "atten": "Finance Department",
+    "attention": "Finance Department",
+    "email": "finance@example.com",
+    "agreement_date": "2024-01-15",
+    "invoice_date": "2024-01-15",
+    "company_name": "Benchmark Client",
+    "cost": "1,250.000",
+    "total_amount": "1,250.000",
+    "total_in_words": "One thousand two hundred fifty dinars",
+    "service": "Company formation",
+    "service_type": "Formation",
+    "company_formation_cost": "500",
+    "desk_rental_cost": "750",
+}
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process and of its (waited-for) children, in MB."""
+    scale = 1024 * 1024 if platform.system() == "Darwin" else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale
+    return {"self": round(own, 1), "children": round(children, 1)}
+
+
+def timeit(fn, repeat, setup=None):
+    """Median, min and max seconds of ``fn(setup())`` over ``repeat`` runs."""
+    timings = []
+    for _ in range(repeat):
+        arg = setup() if setup else None
+        started = time.perf_counter()
+        fn(arg)
+        timings.append(time.perf_counter() - started)
+    return {"median": statistics.median(timings), "min": min(timings), "max": max(timings), "runs": repeat}
+
+
+def sample_placeholders(template):
+    return {token: f"Sample value {i}" for i, token in enumerate(sorted(template.tokens))}
+
+
+def save_bytes(doc):
+    buffer = io.BytesIO()
+    doc.save(buffer)
+    return buffer.getvalue()
+
+
+def bench_template(template_name, repeat):
+    path = os.path.join(TEMPLATE_DIR, TEMPLATES[template_name].path)
+    template = compiled_template(template_name)
+    placeholders = sample_placeholders(template)
+
+    def filled(_=None):
+        doc = template.new_document()
+        return fill_placeholders(doc, placeholders, template.placeholder_paragraphs(doc))
+
+    return {
+        "load": timeit(lambda _: Document(path), repeat),
+        "copy_compiled": timeit(lambda _: template.new_document(), repeat),
+        "substitute_legacy": timeit(lambda doc: legacy_replace_placeholders(doc, placeholders), repeat,
+                                    template.new_document),
+        "substitute_engine": timeit(
+            lambda doc: fill_placeholders(doc, placeholders, template.placeholder_paragraphs(doc)),
+            repeat, template.new_document),
+        "save": timeit(save_bytes, repeat, filled),
+    }, save_bytes(filled())
+
+
+def bench_conversion(documents, backend, repeat):
+    """Cold (first conversion on a fresh backend, start-up included) and warm conversion times."""
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="bench-pdf-") as tmp:
+        pool = None
+        if backend == "libreoffice":
+            started = time.perf_counter()
+            pool = ConversionPool(workers=1)
+            convert = pool.convert
+        else:
+            started = time.perf_counter()
+            convert = get_backend(backend).convert
+        for index, (template_name, data) in enumerate(documents.items()):
+            doc_path = os.path.join(tmp, f"doc{index}.docx")
+            pdf_path = os.path.join(tmp, f"doc{index}.pdf")
+            with open(doc_path, "wb") as f:
+                f.write(data)
+            if index == 0:
+                convert(doc_path, pdf_path)
+                results["cold"] = {"seconds": time.perf_counter() - started, "template": template_name}
+            results[f"warm/{template_name}"] = timeit(lambda _: convert(doc_path, pdf_path), repeat)
+        if pool is not None:
+            pool.shutdown()
+    return results
+
+
+def bench_throughput(concurrency, count, pdf):
+    """Documents per second for ``count`` fresh generations spread over ``concurrency`` threads."""
+    names = list(TEMPLATES)
+
+    def generate(i):
+        fields = {**SAMPLE_FIELDS, "client_name": f"Benchmark Client {i}"}
+        if pdf:
+            return generate_outputs(names[i % len(names)], fields, fresh=True)
+        template_name = names[i % len(names)]
+        template = compiled_template(template_name)
+        doc = template.new_document()
+        return save_bytes(fill_placeholders(doc, sample_placeholders(template), template.placeholder_paragraphs(doc)))
+
+    started = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(generate, range(count)))
+    elapsed = time.perf_counter() - started
+    return {"documents": count, "seconds": elapsed, "per_second": count / elapsed, "pdf": pdf}
+
+
+def flatten(results, prefix=""):
+    """{"a": {"b": {"median": x}}} -> {"a/b": x}: the timings compared against a baseline."""
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            if "median" in value:
+                flat[name] = value["median"]
+            elif "seconds" in value and "per_second" not in value:
+                flat[name] = value["seconds"]
+            elif "per_second" in value:
+                # Lower is better for everything compared, so compare seconds per document
+                flat[name] = 1 / value["per_second"]
+            else:
+                flat.update(flatten(value, name + "/"))
+    return flat
+
+
+def compare(results, baseline, tolerance):
+    """Print a comparison table and return the metrics that regressed beyond ``tolerance``."""
+    current, previous = flatten(results["timings"]), flatten(baseline["timings"])
+    regressions = []
+    print(f"\n{'metric':<60} {'baseline':>10} {'current':>10} {'change':>8}")
+    for name in sorted(current):
+        if name not in previous:
+            continue
+        change = current[name] / previous[name] - 1 if previous[name] else 0.0
+        flag = ""
+        if change > tolerance:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:<60} {previous[name] * 1000:>9.2f}ms {current[name] * 1000:>9.2f}ms {change:>+7.0%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark template load, substitution, save and PDF conversion.")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--backend", help="PDF backend to time (default: PDF_BACKEND or the platform default)")
+    parser.add_argument("--no-pdf", action="store_true", help="skip conversion and time DOCX generation only")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--documents", type=int, default=24, help="documents per throughput run")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--baseline", help="compare with a JSON file written by --output")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown before failing (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    backend = get_backend(args.backend).name
+    # generate_outputs() converts with the configured backend
+    pdf_converter.PDF_BACKEND = backend
+    pdf = not args.no_pdf
+    if pdf and backend == "libreoffice" and not find_soffice():
+        print("LibreOffice not installed; skipping PDF conversion (use --backend native to time that instead)")
+        pdf = False
+
+    results = {
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "backend": backend if pdf else None,
+            "repeat": args.repeat,
+        },
+        "timings": {"templates": {}},
+        "peak_rss_mb": {},
+    }
+
+    documents = {}
+    for template_name in TEMPLATES:
+        results["timings"]["templates"][template_name], documents[template_name] = bench_template(template_name, args.repeat)
+        print(f"{template_name:<20} " + "  ".join(
+            f"{stage} {timing['median'] * 1000:.2f}ms"
+            for stage, timing in results["timings"]["templates"][template_name].items()
+        ))
+    results["peak_rss_mb"]["after_templates"] = peak_rss_mb()
+
+    if pdf:
+        results["timings"]["convert"] = bench_conversion(documents, backend, max(3, args.repeat // 4))
+        cold = results["timings"]["convert"]["cold"]["seconds"]
+        warm = statistics.median(v["median"] for k, v in results["timings"]["convert"].items() if k.startswith("warm/"))
+        print(f"{'convert':<20} cold {cold * 1000:.0f}ms  warm {warm * 1000:.0f}ms ({backend})")
+        results["peak_rss_mb"]["after_convert"] = peak_rss_mb()
+
+    results["timings"]["throughput"] = {}
+    for concurrency in args.concurrency:
+        run = bench_throughput(concurrency, args.documents, pdf)
+        results["timings"]["throughput"][f"concurrency_{concurrency}"] = run
+        print(f"{'throughput':<20} {concurrency:>2} concurrent: {run['per_second']:.1f} documents/s")
+    results["peak_rss_mb"]["final"] = peak_rss_mb()
+    print(f"peak RSS: {results['peak_rss_mb']['final']['self']} MB (children {results['peak_rss_mb']['final']['children']} MB)")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} metric(s) slower than the baseline by more than {args.tolerance:.0%}")
+            return 1
+        print("\nNo regressions")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
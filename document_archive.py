@@ -0,0 +1,308 @@
+"""
+Searchable archive of generated documents.
+
+Every generated document is recorded in an SQLite database (``ARCHIVE_DB``) with its
+reference number, template, client, service type, amount, document date and the
+placeholder values it was filled with; its output files are stored next to it as
+zlib-compressed blobs. The reference numbers from ``generate_reference_number`` and
+``generate_unique_reference`` can so be traced back to the client and amount they
+were issued for.
+
+Lookups stay fast at hundreds of thousands of rows:
+
+* reference and client use B-tree indexes (exact or prefix match);
+* template and service type use (column, id) indexes, so a filtered page is read
+  from the index in id order without sorting; the document date has its own index;
+* free text (any placeholder value) goes through an FTS5 index;
+* listings are paginated by id (keyset), so page 1000 costs the same as page 1, and
+  never read the file blobs.
+
+``ARCHIVE_DB=off`` disables recording; ``ARCHIVE_FILES=0`` keeps the metadata but not
+the files.
+"""
+import json
+import os
+import re
+import sqlite3
+import threading
+import zlib
+from datetime import date, datetime
+
+ARCHIVE_DB = os.environ.get("ARCHIVE_DB", "document_archive.db")
+ARCHIVE_FILES = os.environ.get("ARCHIVE_FILES", "1") != "0"
+ARCHIVE_COMPRESSION = int(os.environ.get("ARCHIVE_COMPRESSION", 6))
+PAGE_SIZE = 50
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    id INTEGER PRIMARY KEY,
+    reference TEXT NOT NULL,
+    template TEXT NOT NULL,
+    client TEXT,
+    client_key TEXT,
+    service_type TEXT,
+    service TEXT,
+    amount REAL,
+    document_date TEXT,
+    created_at TEXT NOT NULL,
+    fields TEXT NOT NULL,
+    placeholders TEXT NOT NULL,
+    file_names TEXT NOT NULL,
+    bytes INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS documents_reference ON documents (reference);
+CREATE INDEX IF NOT EXISTS documents_client ON documents (client_key, id);
+CREATE INDEX IF NOT EXISTS documents_template ON documents (template, id);
+CREATE INDEX IF NOT EXISTS documents_service_type ON documents (service_type, id);
+CREATE INDEX IF NOT EXISTS documents_date ON documents (document_date);
+CREATE TABLE IF NOT EXISTS files (
+    document_id INTEGER NOT NULL REFERENCES documents (id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    data BLOB NOT NULL,
+    PRIMARY KEY (document_id, name)
+);
+"""
+FTS_SCHEMA = "CREATE VIRTUAL TABLE IF NOT EXISTS documents_fts USING fts5(reference, client, body)"
+LIST_COLUMNS = ("id", "reference", "template", "client", "service_type", "service", "amount",
+                "document_date", "created_at", "file_names", "bytes")
+
+
+def _iso_date(value):
+    """A date, datetime or date string (YYYY-MM-DD or DD-MM-YYYY) as YYYY-MM-DD; None if empty."""
+    if value in (None, ""):
+        return None
+    if isinstance(value, (date, datetime)):
+        return value.strftime("%Y-%m-%d")
+    for fmt in ("%Y-%m-%d", "%d-%m-%Y", "%d/%m/%Y"):
+        try:
+            return datetime.strptime(str(value).strip(), fmt).strftime("%Y-%m-%d")
+        except ValueError:
+            continue
+    raise ArchiveQueryError(f"Unrecognised date: {value!r}")
+
+
+class ArchiveQueryError(ValueError):
+    """A search filter the archive cannot use (bad date, unusable search text)."""
+
+
+def _fts_query(text):
+    """Each word of ``text`` as a quoted prefix term, all required; empty if it has no words."""
+    return " ".join(f'"{word}"*' for word in re.findall(r"\w+", text))
+
+
+def _prefix_range(column, value):
+    # A range instead of LIKE so the index is used
+    return f"{column} >= ? AND {column} < ?", [value, value + "\uffff"]
+
+
+class DocumentArchive:
+    """SQLite store of generated documents, their metadata and their files."""
+
+    def __init__(self, path=ARCHIVE_DB, store_files=ARCHIVE_FILES, compression=ARCHIVE_COMPRESSION):
+        self.path = path
+        self.store_files = store_files
+        self.compression = compression
+        self.fts = True
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        # A connection must not be shared with a forked child
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            conn.executescript(SCHEMA)
+            try:
+                conn.execute(FTS_SCHEMA)
+            except sqlite3.OperationalError:
+                # SQLite built without FTS5: free text falls back to a scan
+                self.fts = False
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def record(self, reference, template, fields, placeholders, files, metadata=None):
+        """Store one generated document; returns its archive id."""
+        return self.record_many([{
+            "reference": reference, "template": template, "fields": fields,
+            "placeholders": placeholders, "files": files, "metadata": metadata,
+        }])[0]
+
+    def record_many(self, entries):
+        """
+        Store several documents in one transaction. Each entry is a dict with
+        ``reference``, ``template``, ``fields``, ``placeholders``, ``files`` ({name: bytes})
+        and optionally ``metadata`` (client, service_type, service, amount, document_date).
+        Returns the archive ids.
+        """
+        # Compress outside the transaction so writers hold the lock briefly
+        rows = []
+        for entry in entries:
+            files = entry["files"]
+            blobs = [(name, len(data), zlib.compress(data, self.compression)) for name, data in files.items()] \
+                if self.store_files else []
+            rows.append((entry, blobs))
+        conn = self._connection()
+        created_at = datetime.now().isoformat(timespec="seconds")
+        ids = []
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for entry, blobs in rows:
+                metadata = entry.get("metadata") or {}
+                client = metadata.get("client")
+                placeholders = entry["placeholders"]
+                cursor = conn.execute(
+                    "INSERT INTO documents (reference, template, client, client_key, service_type, service, amount, "
+                    "document_date, created_at, fields, placeholders, file_names, bytes) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        entry["reference"], entry["template"], client, client.strip().lower() if client else None,
+                        metadata.get("service_type"), metadata.get("service"), metadata.get("amount"),
+                        _iso_date(metadata.get("document_date")) or created_at[:10], created_at,
+                        json.dumps(entry["fields"], default=str, sort_keys=True),
+                        json.dumps(placeholders, sort_keys=True),
+                        json.dumps(list(entry["files"])), sum(len(data) for data in entry["files"].values()),
+                    ),
+                )
+                document_id = cursor.lastrowid
+                ids.append(document_id)
+                conn.executemany("INSERT INTO files (document_id, name, size, data) VALUES (?, ?, ?, ?)",
+                                 [(document_id, name, size, data) for name, size, data in blobs])
+                if self.fts:
+                    conn.execute(
+                        "INSERT INTO documents_fts (rowid, reference, client, body) VALUES (?, ?, ?, ?)",
+                        (document_id, entry["reference"], client or "",
+                         " ".join(str(value) for value in placeholders.values())),
+                    )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return ids
+
+    def _where(self, text=None, reference=None, client=None, template=None, service_type=None,
+               date_from=None, date_to=None):
+        clauses, params = [], []
+        if reference:
+            clause, values = _prefix_range("reference", reference.strip())
+            clauses.append(clause)
+            params += values
+        if client:
+            clause, values = _prefix_range("client_key", client.strip().lower())
+            clauses.append(clause)
+            params += values
+        if template:
+            clauses.append("template = ?")
+            params.append(template)
+        if service_type:
+            clauses.append("service_type = ?")
+            params.append(service_type)
+        if date_from:
+            clauses.append("document_date >= ?")
+            params.append(_iso_date(date_from))
+        if date_to:
+            clauses.append("document_date <= ?")
+            params.append(_iso_date(date_to))
+        if text and text.strip():
+            self._connection()
+            query = _fts_query(text)
+            if self.fts and query:
+                clauses.append("id IN (SELECT rowid FROM documents_fts WHERE documents_fts MATCH ?)")
+                params.append(query)
+            elif not self.fts:
+                clauses.append("placeholders LIKE ?")
+                params.append(f"%{text.strip()}%")
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def search(self, limit=PAGE_SIZE, before=None, **filters):
+        """
+        Newest documents first, matching every given filter: ``text`` (any placeholder
+        value), ``reference`` and ``client`` (prefix), ``template``, ``service_type``,
+        ``date_from``/``date_to`` (document date, inclusive).
+
+        Returns {"documents": [dict...], "next": cursor}; pass ``before=next`` for the
+        following page (``next`` is None on the last page).
+        """
+        if limit < 1:
+            # SQLite reads a negative LIMIT as no limit at all
+            raise ArchiveQueryError(f"The page size must be at least 1, not {limit}")
+        where, params = self._where(**filters)
+        if before is not None:
+            where += (" AND " if where else " WHERE ") + "id < ?"
+            params.append(int(before))
+        rows = self._query(
+            f"SELECT {', '.join(LIST_COLUMNS)} FROM documents{where} ORDER BY id DESC LIMIT ?",
+            params + [limit + 1],
+        )
+        documents = [self._document(row) for row in rows[:limit]]
+        return {"documents": documents, "next": documents[-1]["id"] if len(rows) > limit else None}
+
+    def count(self, **filters):
+        where, params = self._where(**filters)
+        return self._query(f"SELECT COUNT(*) FROM documents{where}", params)[0][0]
+
+    def _query(self, sql, params):
+        try:
+            return self._connection().execute(sql, params).fetchall()
+        except sqlite3.OperationalError as e:
+            # FTS5 rejects some MATCH strings; anything else is a real failure
+            if "fts5" in str(e):
+                raise ArchiveQueryError(f"Unusable search text: {e}")
+            raise
+
+    def get(self, document_id):
+        """Metadata, fields and placeholder values of one document, or None."""
+        row = self._connection().execute("SELECT * FROM documents WHERE id = ?", (document_id,)).fetchone()
+        if row is None:
+            return None
+        document = self._document(row)
+        document["fields"] = json.loads(row["fields"])
+        document["placeholders"] = json.loads(row["placeholders"])
+        del document["client_key"]
+        return document
+
+    def by_reference(self, reference):
+        """Every document issued with exactly ``reference`` (normally one)."""
+        rows = self._connection().execute(
+            f"SELECT {', '.join(LIST_COLUMNS)} FROM documents WHERE reference = ? ORDER BY id", (reference,)
+        ).fetchall()
+        return [self._document(row) for row in rows]
+
+    def files(self, document_id):
+        """The stored output files of a document as {name: bytes} (empty if not kept)."""
+        rows = self._connection().execute(
+            "SELECT name, data FROM files WHERE document_id = ? ORDER BY rowid", (document_id,)
+        ).fetchall()
+        return {row["name"]: zlib.decompress(row["data"]) for row in rows}
+
+    def stats(self):
+        documents, size = self._connection().execute(
+            "SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM documents"
+        ).fetchone()
+        return {"documents": documents, "bytes": size, "fts": self.fts}
+
+    @staticmethod
+    def _document(row):
+        document = dict(row)
+        if "file_names" in document:
+            document["file_names"] = json.loads(document["file_names"])
+        return document
+
+
+_archive = None
+_archive_lock = threading.Lock()
+
+
+def get_document_archive():
+    """Return the process-wide DocumentArchive, or None when ARCHIVE_DB is "off"."""
+    global _archive
+    if ARCHIVE_DB == "off":
+        return None
+    with _archive_lock:
+        if _archive is None:
+            _archive = DocumentArchive()
+        return _archive
@@ -0,0 +1,180 @@
+"""
+Template definitions and the document build path shared by the Streamlit UI, batch mode
+and the HTTP API.
+
+Templates are described in template_schema.py. Field dictionaries use the field keys
+declared there (``client_name``, ``agreement_date``, ``company_formation_cost``...), for
+the UI's ``current_input``, batch CSV/JSON columns and API requests alike.
+"""
+import os
+import threading
+import time
+
+from document_archive import get_document_archive
+from metrics import Trace
+from output_store import get_archive_sink, get_output_store
+from pdf_converter import get_backend
+from placeholders import fill_placeholders
+from render_plan import check_plan, parse_plan, plan_key, render_variants
+from result_cache import cache_key, get_result_cache
+from template_cache import get_template
+from template_schema import SCHEMAS, TemplateSchemaError
+
+TEMPLATE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Template name -> TemplateSchema, in the order shown in the UI
+TEMPLATES = {schema.name: schema for schema in SCHEMAS}
+
+
+def get_template_spec(template_name):
+    try:
+        return TEMPLATES[template_name]
+    except KeyError:
+        raise ValueError(f"Unknown template {template_name!r}; expected one of {', '.join(TEMPLATES)}")
+
+
+def build_placeholders(template_name, fields, reference):
+    """Placeholder dict for ``template_name`` filled from ``fields`` and its reference number."""
+    return get_template_spec(template_name).placeholders(fields, reference)
+
+
+def compiled_template(template_name):
+    """The cached CompiledTemplate for ``template_name``."""
+    return get_template(os.path.join(TEMPLATE_DIR, get_template_spec(template_name).path))
+
+
+def validate_templates():
+    """
+    Compile every template and check it against its schema.
+
+    Called once at startup; raises TemplateSchemaError listing every declared
+    placeholder that is missing from its .docx.
+    """
+    problems = []
+    for name, schema in TEMPLATES.items():
+        problems += [f"{name}: {problem}" for problem in schema.check(compiled_template(name).tokens)]
+    if problems:
+        raise TemplateSchemaError("; ".join(problems))
+
+
+class Warmup(threading.Thread):
+    """
+    Background start-up work: compile and validate the templates, then warm the PDF
+    backend (start the LibreOffice pool, or import the native renderer). Callers that
+    must not serve before the templates are known to be valid run
+    ``validate_templates()`` themselves and pass ``templates=False``.
+
+    ``error`` holds the TemplateSchemaError (or any other failure) once finished.
+    """
+
+    def __init__(self, pdf=True, templates=True):
+        super().__init__(name="warmup", daemon=True)
+        self.pdf = pdf
+        self.templates = templates
+        self.error = None
+        self.duration = None
+
+    def run(self):
+        started = time.perf_counter()
+        try:
+            if self.templates:
+                validate_templates()
+            if self.pdf:
+                get_backend().warm()
+        except Exception as e:
+            self.error = e
+        finally:
+            self.duration = time.perf_counter() - started
+
+
+def start_warmup(pdf=True, templates=True):
+    """Start a Warmup thread and return it."""
+    warmup = Warmup(pdf, templates)
+    warmup.start()
+    return warmup
+
+
+def build_document(template_name, placeholders):
+    """Return a python-docx Document of ``template_name`` with ``placeholders`` filled in."""
+    template = compiled_template(template_name)
+    doc = template.new_document()
+    return fill_placeholders(doc, placeholders, template.placeholder_paragraphs(doc))
+
+
+def output_stem(template_name, fields):
+    """File name (without extension) used for a generated document, e.g. 'Invoice ACME'."""
+    return get_template_spec(template_name).output_stem(fields)
+
+
+def generate_outputs(template_name, fields, progress=None, fresh=False, variants=None, signature=None):
+    """
+    Issue a reference number, fill the template and render it to .docx and PDF in memory.
+
+    ``variants`` is a render plan (see render_plan.py), e.g. ["docx", "pdfa+signature",
+    "pdf+draft"]; the default is the .docx and a PDF. ``signature`` is the image bytes
+    for signed variants. The template is filled once for the whole plan.
+
+    Identical requests are answered from the result cache together with the reference
+    they were first issued with; ``fresh=True`` skips the lookup and always issues a new
+    reference. ``progress(fraction, stage)`` is called between steps. Returns
+    {"reference": ..., "files": {"<name>.docx": bytes, "<name>.pdf": bytes, ...},
+    "unfilled": [...]}, where "unfilled" lists the template's ``<<...>>`` tokens that
+    no value was given for (they are left in the output as they are).
+    """
+    progress = progress or (lambda fraction, stage: None)
+    spec = get_template_spec(template_name)
+    trace = Trace(template_name)
+    # Everything except the reference number is a function of the input
+    with trace.stage("placeholders"):
+        placeholders = build_placeholders(template_name, fields, "")
+        variants = parse_plan(variants)
+        check_plan(variants, signature)
+    cache = get_result_cache()
+    key = cache_key(compiled_template(template_name).digest, placeholders, exclude=(spec.reference_placeholder,),
+                    variant=plan_key(variants, signature))
+    if not fresh:
+        with trace.stage("cache_lookup"):
+            cached = cache.get(key)
+        if cached is not None:
+            progress(1.0, "Loaded from cache")
+            trace.finish("cache_hit", reference=cached["reference"])
+            return cached
+
+    progress(0.1, "Issuing reference number")
+    with trace.stage("reference"):
+        reference = spec.reference()
+    placeholders[spec.reference_placeholder] = reference
+    progress(0.2, "Filling template")
+    template = compiled_template(template_name)
+    with trace.stage("load"):
+        doc = template.new_document()
+    with trace.stage("fill"):
+        fill_placeholders(doc, placeholders, template.placeholder_paragraphs(doc))
+
+    unfilled = sorted(template.unfilled(placeholders))
+
+    stem = output_stem(template_name, fields)
+    files = render_variants(doc, variants, stem, signature, trace, progress)
+    result = {"reference": reference, "files": files, "unfilled": unfilled}
+    archive = get_document_archive()
+    if archive is not None:
+        with trace.stage("archive"):
+            archive.record(reference, template_name, fields, placeholders, files, spec.metadata(fields))
+    trace.finish("generated", reference=reference, **({"unfilled": unfilled} if unfilled else {}))
+    cache.put(key, result)
+    return result
+
+
+def run_generation(job, template_name, fields, fresh=False, variants=None, signature=None):
+    """
+    Job function (see jobs.JobManager.submit) used by the UI and the HTTP API.
+
+    The bytes go to the bounded output store under the job id (and to the archive sink
+    when one is configured); the job itself only keeps the reference and file names.
+    """
+    result = generate_outputs(template_name, fields, job.update, fresh=fresh, variants=variants, signature=signature)
+    get_output_store().put(job.id, result["files"])
+    sink = get_archive_sink()
+    if sink is not None:
+        sink.write(job.id, result["files"])
+    return {"reference": result["reference"], "files": list(result["files"]), "unfilled": result.get("unfilled", [])}
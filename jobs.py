@@ -0,0 +1,554 @@
+"""
+Background job subsystem for document generation.
+
+Building a document and converting it to PDF used to run inside the Streamlit rerun,
+freezing the session while LibreOffice worked. ``JobManager`` runs that work on a
+thread pool instead and keeps a job table keyed by session: ``submit`` returns
+immediately, the UI polls ``get`` for status and progress, and a second submission of
+the same input from the same session while the first is still queued or running is
+answered with the in-flight job.
+
+With ``STATE_BACKEND=local`` or ``redis`` (see shared_state.py) jobs go to a shared
+queue instead - an SQLite table in ``STATE_DIR/jobs.db`` or a Redis list - and are
+run by ``worker.py`` processes. ``QueuedJobManager`` has the same ``submit``/``get``/
+``session_jobs`` interface, so web replicas and conversion workers scale separately
+and any replica can answer a status poll. The job function and its arguments are
+pickled: only processes running this code base may use the queue.
+
+A worker holds a lease on the job it runs and renews it every ``JOB_LEASE / 4``
+seconds. Workers periodically reap claims whose lease ran out (the worker died or
+hung): the job is queued again, or failed once it has been tried
+``JOB_MAX_ATTEMPTS`` times. On Redis a claimed job is moved atomically to a
+processing list, so a worker dying right after taking it cannot lose it either.
+"""
+import concurrent.futures
+import hashlib
+import json
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import uuid
+
+from shared_state import state_backend, state_path
+
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", 4))
+# Finished jobs are forgotten after this many seconds
+JOB_TTL = float(os.environ.get("JOB_TTL", 3600))
+# Seconds without a heartbeat after which a running job's worker is presumed dead
+JOB_LEASE = float(os.environ.get("JOB_LEASE", 60))
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", 2))
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+def input_key(current_input):
+    """Stable hash of a ``current_input`` dict (dates and numbers included)."""
+    payload = json.dumps(current_input, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _lost_message(attempts):
+    return f"The worker running this job stopped responding (tried {attempts} times)"
+
+
+class Job:
+    """One unit of background work and its observable state."""
+
+    def __init__(self, session_id, key):
+        self.id = uuid.uuid4().hex
+        self.session_id = session_id
+        self.key = key
+        self.status = QUEUED
+        self.progress = 0.0
+        self.stage = "Queued"
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.finished = None
+
+    def update(self, progress, stage):
+        """Called by the job function to report progress (0.0 - 1.0)."""
+        self.progress = progress
+        self.stage = stage
+
+    @property
+    def active(self):
+        return self.status in (QUEUED, RUNNING)
+
+
+class JobManager:
+    """Thread pool plus a job table indexed by id and by (session, input key)."""
+
+    def __init__(self, workers=JOB_WORKERS, ttl=JOB_TTL):
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._by_key = {}
+        self.ttl = ttl
+
+    def submit(self, session_id, key, fn, *args, **kwargs):
+        """
+        Run ``fn(job, *args, **kwargs)`` in the background and return its Job.
+
+        If the session already has an active job for ``key`` that job is returned and
+        ``fn`` is not scheduled again.
+        """
+        with self._lock:
+            self._prune()
+            existing = self._jobs.get(self._by_key.get((session_id, key)))
+            if existing is not None and existing.active:
+                return existing
+            job = Job(session_id, key)
+            self._jobs[job.id] = job
+            self._by_key[(session_id, key)] = job.id
+        self._executor.submit(self._run, job, fn, args, kwargs)
+        return job
+
+    def _run(self, job, fn, args, kwargs):
+        job.status = RUNNING
+        job.update(0.0, "Starting")
+        try:
+            job.result = fn(job, *args, **kwargs)
+            job.update(1.0, "Done")
+            job.status = DONE
+        except Exception as e:
+            job.error = e
+            job.status = FAILED
+        finally:
+            job.finished = time.time()
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def session_jobs(self, session_id):
+        """All jobs of a session, newest first."""
+        with self._lock:
+            jobs = [job for job in self._jobs.values() if job.session_id == session_id]
+        return sorted(jobs, key=lambda job: job.created, reverse=True)
+
+    def stats(self):
+        with self._lock:
+            statuses = [job.status for job in self._jobs.values()]
+        return {"backend": "memory", **{status: statuses.count(status) for status in set(statuses)}}
+
+    def _prune(self):
+        cutoff = time.time() - self.ttl
+        for job_id, job in list(self._jobs.items()):
+            if job.finished is not None and job.finished < cutoff:
+                del self._jobs[job_id]
+                if self._by_key.get((job.session_id, job.key)) == job_id:
+                    del self._by_key[(job.session_id, job.key)]
+
+
+class JobError(Exception):
+    """The error of a job that failed in another process (only its message is kept)."""
+
+
+STATE_FIELDS = ("id", "session_id", "key", "status", "progress", "stage", "error", "created", "finished")
+
+
+class QueuedJob(Job):
+    """A Job whose state lives in a shared queue, so any process can observe it."""
+
+    def __init__(self, queue, state):
+        self.queue = queue
+        for field in STATE_FIELDS:
+            setattr(self, field, state.get(field))
+        self.result = state.get("result")
+        if self.error is not None:
+            self.error = JobError(self.error)
+
+    def update(self, progress, stage):
+        super().update(progress, stage)
+        self.queue.update(self.id, progress=progress, stage=stage)
+
+
+class SqliteJobQueue:
+    """Job table plus queue in one SQLite database, for processes on one host."""
+
+    def __init__(self, path, poll_interval=0.2):
+        self.path = path
+        self.poll_interval = poll_interval
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        # A connection must not be shared with a forked child
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, session_id TEXT, key TEXT, status TEXT NOT NULL, progress REAL, stage TEXT, "
+                "task BLOB, result BLOB, error TEXT, created REAL NOT NULL, finished REAL, "
+                "heartbeat REAL, attempts INTEGER NOT NULL DEFAULT 0);"
+                "CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created);"
+                "CREATE INDEX IF NOT EXISTS jobs_session ON jobs (session_id, key);"
+            )
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+            if "heartbeat" not in columns:
+                # Queues created before leases
+                conn.executescript("ALTER TABLE jobs ADD COLUMN heartbeat REAL;"
+                                   "ALTER TABLE jobs ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0;")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @staticmethod
+    def _state(row):
+        state = dict(row)
+        for internal in ("task", "heartbeat", "attempts"):
+            state.pop(internal, None)
+        if state.get("result") is not None:
+            state["result"] = pickle.loads(state["result"])
+        return state
+
+    def create(self, state, task):
+        """Queue a new job unless its session has an active one for the same key; returns the job's state."""
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE session_id = ? AND key = ? AND status IN (?, ?)",
+                (state["session_id"], state["key"], QUEUED, RUNNING),
+            ).fetchone()
+            if row is None:
+                conn.execute(
+                    "INSERT INTO jobs (id, session_id, key, status, progress, stage, task, created) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (state["id"], state["session_id"], state["key"], state["status"], state["progress"],
+                     state["stage"], task, state["created"]),
+                )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return self._state(row) if row is not None else state
+
+    def claim(self, timeout):
+        """Mark the oldest queued job running and return (job id, task), or None after ``timeout`` seconds."""
+        deadline = time.monotonic() + timeout
+        conn = self._connection()
+        while True:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT id, task FROM jobs WHERE status = ? ORDER BY created LIMIT 1", (QUEUED,)
+                ).fetchone()
+                if row is not None:
+                    # The task stays until the job finishes, so a reaped claim can be run again
+                    conn.execute("UPDATE jobs SET status = ?, heartbeat = ?, attempts = attempts + 1 WHERE id = ?",
+                                 (RUNNING, time.time(), row["id"]))
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            if row is not None:
+                return row["id"], row["task"]
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(self.poll_interval)
+
+    def update(self, job_id, **fields):
+        if "result" in fields:
+            fields["result"] = pickle.dumps(fields["result"], protocol=pickle.HIGHEST_PROTOCOL)
+        if "finished" in fields:
+            fields["task"] = None
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        self._connection().execute(f"UPDATE jobs SET {assignments} WHERE id = ?", [*fields.values(), job_id])
+
+    def load(self, job_id):
+        row = self._connection().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._state(row) if row is not None else None
+
+    def session(self, session_id):
+        rows = self._connection().execute(
+            "SELECT * FROM jobs WHERE session_id = ? ORDER BY created DESC", (session_id,)
+        ).fetchall()
+        return [self._state(row) for row in rows]
+
+    def reap(self, lease, max_attempts):
+        """Requeue (or fail, after ``max_attempts``) running jobs whose heartbeat is older than ``lease``."""
+        conn = self._connection()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            stale = conn.execute("SELECT id, attempts FROM jobs WHERE status = ? AND heartbeat < ?",
+                                 (RUNNING, now - lease)).fetchall()
+            for row in stale:
+                if row["attempts"] >= max_attempts:
+                    conn.execute("UPDATE jobs SET status = ?, error = ?, finished = ?, task = NULL WHERE id = ?",
+                                 (FAILED, _lost_message(row["attempts"]), now, row["id"]))
+                else:
+                    conn.execute("UPDATE jobs SET status = ?, progress = 0, stage = ? WHERE id = ?",
+                                 (QUEUED, "Queued (retrying)", row["id"]))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return len(stale)
+
+    def prune(self, ttl):
+        # Jobs still unfinished after ``ttl`` (e.g. their worker died) go as well
+        cutoff = time.time() - ttl
+        self._connection().execute("DELETE FROM jobs WHERE finished < ? OR created < ?", (cutoff, cutoff))
+
+    def stats(self):
+        rows = self._connection().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {"backend": "local", **{status: count for status, count in rows}}
+
+
+class RedisJobQueue:
+    """
+    Job table plus queue in a Redis-protocol server: a hash per job, a list as the
+    queue, a list of the claimed jobs and a key per (session, input) pointing at its
+    latest job.
+    """
+
+    def __init__(self, client, ttl=JOB_TTL, prefix="jobs:"):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+        self._processing = f"{prefix}processing"
+        self._suspects = set()
+
+    def _job_key(self, job_id):
+        return f"{self.prefix}job:{job_id}"
+
+    def _active_key(self, session_id, key):
+        return f"{self.prefix}active:" + hashlib.sha256(f"{session_id}\0{key}".encode("utf-8")).hexdigest()
+
+    def create(self, state, task):
+        """Queue a new job unless its session has an active one for the same key; returns the job's state."""
+        active_key = self._active_key(state["session_id"], state["key"])
+        ttl = int(self.ttl)
+        # SET NX claims the (session, key) slot; a stale slot is taken over
+        while not self.client.execute("SET", active_key, state["id"], "NX", "EX", ttl):
+            existing_id = self.client.execute("GET", active_key)
+            existing = self.load(existing_id.decode("ascii")) if existing_id is not None else None
+            if existing is not None and existing["status"] in (QUEUED, RUNNING):
+                return existing
+            self.client.execute("DEL", active_key)
+        fields = []
+        for field in STATE_FIELDS:
+            if state.get(field) is not None:
+                fields += [field, state[field]]
+        job_key = self._job_key(state["id"])
+        session_key = f"{self.prefix}session:{state['session_id']}"
+        self.client.pipeline(
+            ("HSET", job_key, "task", task, *fields),
+            ("EXPIRE", job_key, ttl),
+            ("ZADD", session_key, state["created"], state["id"]),
+            ("EXPIRE", session_key, ttl),
+            ("LPUSH", f"{self.prefix}queue", state["id"]),
+        )
+        return state
+
+    def claim(self, timeout):
+        """Take the oldest queued job, mark it running and return (job id, task), or None after ``timeout`` seconds."""
+        # The id moves to the processing list atomically, so a worker dying now cannot lose the job
+        reply = self.client.execute("BRPOPLPUSH", f"{self.prefix}queue", self._processing, max(1, int(timeout)))
+        if reply is None:
+            return None
+        job_id = reply.decode("ascii")
+        job_key = self._job_key(job_id)
+        task = self.client.execute("HGET", job_key, "task")
+        if task is None:
+            # Expired while it was queued; writing to it would recreate the key without a TTL
+            self.client.execute("LREM", self._processing, 1, job_id)
+            return None
+        self.client.pipeline(("HSET", job_key, "status", RUNNING, "heartbeat", time.time()),
+                             ("HINCRBY", job_key, "attempts", 1), ("EXPIRE", job_key, int(self.ttl)))
+        return job_id, task
+
+    def update(self, job_id, **fields):
+        if "result" in fields:
+            fields["result"] = pickle.dumps(fields["result"], protocol=pickle.HIGHEST_PROTOCOL)
+        args = []
+        for name, value in fields.items():
+            args += [name, value]
+        job_key = self._job_key(job_id)
+        # Every write renews the TTL, so no job key is ever left without one
+        commands = [("HSET", job_key, *args), ("EXPIRE", job_key, int(self.ttl))]
+        if "finished" in fields:
+            commands += [("HDEL", job_key, "task"), ("LREM", self._processing, 1, job_id)]
+        self.client.pipeline(*commands)
+
+    def reap(self, lease, max_attempts):
+        """Requeue (or fail, after ``max_attempts``) claimed jobs whose heartbeat is older than ``lease``."""
+        now = time.time()
+        suspects = set()
+        reaped = 0
+        for raw_id in self.client.execute("LRANGE", self._processing, 0, -1):
+            job_id = raw_id.decode("ascii")
+            job_key = self._job_key(job_id)
+            status, heartbeat, attempts = self.client.execute("HMGET", job_key, "status", "heartbeat", "attempts")
+            status = status.decode("ascii") if status is not None else None
+            if status not in (QUEUED, RUNNING):
+                # Expired, or finished by a worker that died before removing it
+                self.client.execute("LREM", self._processing, 1, job_id)
+                continue
+            if status == QUEUED:
+                # Taken but not marked running yet: give the claim until the next pass
+                if job_id not in self._suspects:
+                    suspects.add(job_id)
+                    continue
+            elif float(heartbeat or 0) >= now - lease:
+                continue
+            # Whoever removes the entry owns the job; another reaper may have been faster
+            if not self.client.execute("LREM", self._processing, 1, job_id):
+                continue
+            attempts = int(attempts or 0)
+            if attempts >= max_attempts:
+                self.client.pipeline(("HSET", job_key, "status", FAILED, "error", _lost_message(attempts),
+                                      "finished", now),
+                                     ("HDEL", job_key, "task"), ("EXPIRE", job_key, int(self.ttl)))
+            else:
+                self.client.pipeline(("HSET", job_key, "status", QUEUED, "progress", 0, "stage", "Queued (retrying)"),
+                                     ("EXPIRE", job_key, int(self.ttl)), ("LPUSH", f"{self.prefix}queue", job_id))
+            reaped += 1
+        self._suspects = suspects
+        return reaped
+
+    def load(self, job_id):
+        reply = self.client.execute("HGETALL", self._job_key(job_id))
+        if not reply:
+            return None
+        raw = dict(zip(reply[::2], reply[1::2]))
+        state = {}
+        for field in STATE_FIELDS:
+            value = raw.get(field.encode("ascii"))
+            if value is not None:
+                value = value.decode("utf-8")
+                state[field] = float(value) if field in ("progress", "created", "finished") else value
+        state["result"] = pickle.loads(raw[b"result"]) if b"result" in raw else None
+        return state
+
+    def session(self, session_id):
+        ids = self.client.execute("ZREVRANGE", f"{self.prefix}session:{session_id}", 0, -1)
+        states = [self.load(job_id.decode("ascii")) for job_id in ids]
+        return [state for state in states if state is not None]
+
+    def prune(self, ttl):
+        # Keys expire on the server
+        pass
+
+    def stats(self):
+        queued, running = self.client.pipeline(("LLEN", f"{self.prefix}queue"), ("LLEN", self._processing))
+        return {"backend": "redis", "queued": queued, "running": running}
+
+
+class QueuedJobManager:
+    """JobManager interface over a shared queue; the jobs are run by ``work`` (see worker.py)."""
+
+    def __init__(self, queue, ttl=JOB_TTL, lease=JOB_LEASE, max_attempts=JOB_MAX_ATTEMPTS):
+        self.queue = queue
+        self.ttl = ttl
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self._next_reap = 0.0
+        self._reap_lock = threading.Lock()
+
+    def submit(self, session_id, key, fn, *args, **kwargs):
+        """
+        Queue ``fn(job, *args, **kwargs)`` and return its Job; ``fn`` must be importable
+        by the workers. An active job of the session for ``key`` is returned instead.
+        """
+        self.queue.prune(self.ttl)
+        self.reap()
+        job = Job(session_id, key)
+        state = {field: getattr(job, field) for field in STATE_FIELDS}
+        task = pickle.dumps((fn, args, kwargs), protocol=pickle.HIGHEST_PROTOCOL)
+        return QueuedJob(self.queue, self.queue.create(state, task))
+
+    def get(self, job_id):
+        if not job_id:
+            return None
+        state = self.queue.load(job_id)
+        return QueuedJob(self.queue, state) if state is not None else None
+
+    def session_jobs(self, session_id):
+        """All jobs of a session, newest first."""
+        return [QueuedJob(self.queue, state) for state in self.queue.session(session_id)]
+
+    def work(self, timeout=5):
+        """Run the next queued job, waiting up to ``timeout`` seconds for one. Returns the Job or None."""
+        self.reap()
+        claimed = self.queue.claim(timeout)
+        if claimed is None:
+            return None
+        job_id, task = claimed
+        job = self.get(job_id)
+        job.status = RUNNING
+        stop = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(job_id, stop), name="job-heartbeat", daemon=True)
+        heartbeat.start()
+        try:
+            fn, args, kwargs = pickle.loads(task)
+            job.update(0.0, "Starting")
+            job.result = fn(job, *args, **kwargs)
+            job.status = DONE
+            job.finished = time.time()
+            self.queue.update(job.id, status=DONE, progress=1.0, stage="Done", result=job.result,
+                              finished=job.finished)
+        except Exception as e:
+            job.error = e
+            job.status = FAILED
+            job.finished = time.time()
+            self.queue.update(job.id, status=FAILED, error=str(e) or type(e).__name__, finished=job.finished)
+        finally:
+            stop.set()
+            heartbeat.join()
+        return job
+
+    def _heartbeat(self, job_id, stop):
+        # Renew the lease while the job runs; a missed beat or two is covered by the lease
+        while not stop.wait(self.lease / 4):
+            try:
+                self.queue.update(job_id, heartbeat=time.time())
+            except (OSError, sqlite3.Error):
+                pass
+
+    def reap(self):
+        """Requeue or fail jobs whose worker stopped renewing its lease; runs at most every ``lease / 2`` seconds."""
+        with self._reap_lock:
+            now = time.monotonic()
+            if now < self._next_reap:
+                return 0
+            self._next_reap = now + self.lease / 2
+        return self.queue.reap(self.lease, self.max_attempts)
+
+    def stats(self):
+        return self.queue.stats()
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_job_manager():
+    """
+    Return the process-wide job manager (shared by all Streamlit sessions): a
+    JobManager, or a QueuedJobManager when STATE_BACKEND is "local" or "redis".
+    """
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            backend = state_backend()
+            if backend == "local":
+                _manager = QueuedJobManager(SqliteJobQueue(state_path("jobs.db")))
+            elif backend == "redis":
+                from resp_client import get_resp_client
+
+                _manager = QueuedJobManager(RedisJobQueue(get_resp_client()))
+            else:
+                _manager = JobManager()
+        return _manager
@@ -0,0 +1,203 @@
+"""
+Per-stage timing of document generation.
+
+``generate_outputs`` wraps each step (reference number, template copy, placeholder
+fill, save, PDF conversion) in a ``Trace``. When the document is finished the trace
+
+* logs one structured JSON line on the ``generation`` logger with the stage durations,
+  output sizes and outcome (to stderr, or to the file named by ``GENERATION_LOG``), and
+* adds the durations to Prometheus histograms kept in memory.
+
+The histograms are served by the HTTP API at ``/metrics/prometheus`` and, when
+``METRICS_FILE`` is set, written to that file at most every ``METRICS_FILE_INTERVAL``
+seconds (for node_exporter's textfile collector). Recording a document costs a few
+``perf_counter`` calls and one lock acquisition, so this stays on in production.
+"""
+import collections
+import json
+import logging
+import os
+import threading
+import time
+
+# "stderr" (default), a file path, or "off"
+GENERATION_LOG = os.environ.get("GENERATION_LOG", "stderr")
+METRICS_FILE = os.environ.get("METRICS_FILE")
+METRICS_FILE_INTERVAL = float(os.environ.get("METRICS_FILE_INTERVAL", 10))
+# Histogram buckets in seconds; LibreOffice conversions land in the upper ones
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+logger = logging.getLogger("generation")
+
+
+def _configure_logger():
+    if logger.handlers or GENERATION_LOG == "off":
+        return
+    handler = logging.StreamHandler() if GENERATION_LOG == "stderr" else logging.FileHandler(GENERATION_LOG)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    # Streamlit and uvicorn configure the root logger differently; keep one format
+    logger.propagate = False
+
+
+_configure_logger()
+
+
+class Trace:
+    """Stage timings, sizes and outcome of one generated document."""
+
+    def __init__(self, template, registry=None):
+        self.template = template
+        self.registry = registry
+        self.stages = {}
+        self.sizes = {}
+        self.outcome = None
+        self.fields = {}
+        self._started = time.perf_counter()
+
+    def stage(self, name):
+        return _Stage(self, name)
+
+    def size(self, kind, data):
+        """Add the length of ``data`` to the bytes recorded for ``kind`` (e.g. "pdf")."""
+        self.sizes[kind] = self.sizes.get(kind, 0) + len(data)
+
+    def finish(self, outcome, **fields):
+        """Record the document; ``fields`` (e.g. reference) are added to the log line."""
+        self.outcome = outcome
+        self.fields.update(fields)
+        total = time.perf_counter() - self._started
+        record = {
+            "event": "document_generated",
+            "template": self.template,
+            "outcome": outcome,
+            "total_ms": round(total * 1000, 2),
+            "stages_ms": {name: round(seconds * 1000, 2) for name, seconds in self.stages.items()},
+            "bytes": self.sizes,
+            **self.fields,
+        }
+        logger.info(json.dumps(record, default=str))
+        (self.registry or get_registry()).observe(self, total)
+
+
+class _Stage:
+    def __init__(self, trace, name):
+        self.trace = trace
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.trace.stages[self.name] = time.perf_counter() - self.started
+        if exc_type is not None:
+            self.trace.finish("error", failed_stage=self.name, error=f"{exc_type.__name__}: {exc}")
+        return False
+
+
+class _Histogram:
+    def __init__(self):
+        self.buckets = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.buckets[i] += 1
+
+
+class Registry:
+    """Prometheus counters and histograms for generated documents."""
+
+    def __init__(self, path=METRICS_FILE, interval=METRICS_FILE_INTERVAL):
+        self.path = path
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._stages = collections.defaultdict(_Histogram)
+        self._totals = collections.defaultdict(_Histogram)
+        self._documents = collections.Counter()
+        self._bytes = collections.Counter()
+        self._written = 0.0
+
+    def observe(self, trace, total):
+        with self._lock:
+            self._documents[(trace.template, trace.outcome)] += 1
+            self._totals[(trace.template, trace.outcome)].observe(total)
+            for stage, seconds in trace.stages.items():
+                self._stages[(trace.template, stage)].observe(seconds)
+            for kind, size in trace.sizes.items():
+                self._bytes[(trace.template, kind)] += size
+            due = self.path and time.monotonic() - self._written >= self.interval
+            if due:
+                self._written = time.monotonic()
+        if due:
+            self.write()
+
+    def render(self):
+        """The metrics in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            lines += [
+                "# HELP generation_documents_total Documents generated, by template and outcome.",
+                "# TYPE generation_documents_total counter",
+            ]
+            for (template, outcome), count in sorted(self._documents.items()):
+                lines.append(f"generation_documents_total{_labels(template=template, outcome=outcome)} {count}")
+            lines += _histogram_lines(
+                "generation_seconds", "End-to-end generation time, by template and outcome.",
+                {_labels(template=t, outcome=o): h for (t, o), h in sorted(self._totals.items())},
+            )
+            lines += _histogram_lines(
+                "generation_stage_seconds", "Time spent per generation stage.",
+                {_labels(template=t, stage=s): h for (t, s), h in sorted(self._stages.items())},
+            )
+            lines += [
+                "# HELP generation_output_bytes_total Bytes of generated files, by template and file type.",
+                "# TYPE generation_output_bytes_total counter",
+            ]
+            for (template, kind), size in sorted(self._bytes.items()):
+                lines.append(f"generation_output_bytes_total{_labels(template=template, kind=kind)} {size}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path=None):
+        """Atomically write the metrics to ``path`` (default ``METRICS_FILE``)."""
+        path = path or self.path
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(self.render())
+        os.replace(tmp_path, path)
+
+
+def _labels(**labels):
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for value in labels.values())
+    return "{" + ",".join(f'{key}="{value}"' for key, value in zip(labels, escaped)) + "}"
+
+
+def _histogram_lines(name, help_text, series):
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+    for labels, histogram in series.items():
+        inner = labels[1:-1]
+        for bound, count in zip(BUCKETS, histogram.buckets):
+            lines.append(f'{name}_bucket{{{inner},le="{bound}"}} {count}')
+        lines.append(f'{name}_bucket{{{inner},le="+Inf"}} {histogram.count}')
+        lines.append(f"{name}_sum{labels} {histogram.sum:.6f}")
+        lines.append(f"{name}_count{labels} {histogram.count}")
+    return lines
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry():
+    """Return the process-wide Registry."""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = Registry()
+        return _registry
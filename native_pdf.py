@@ -0,0 +1,933 @@
+"""
+Pure-Python DOCX -> PDF renderer for the bundled templates.
+
+LibreOffice is the largest part of the container image and of the per-document
+latency. The three templates only use a small part of WordprocessingML: paragraphs
+with bold/italic/size/colour runs, tabs, bullet and decimal numbering, tables with
+grid/cell borders and shading, a full-page JPEG letterhead anchored in the header,
+inline signature images and the VML text watermark added by render_plan.py.
+This module lays those out with the standard Helvetica fonts (no embedding) and writes
+the PDF directly, which takes tens of milliseconds.
+
+It is not a general Word layout engine: fonts are substituted, justified text is set
+ragged-right and unsupported content (text boxes, charts, floating tables...) is
+skipped. benchmarks/native_pdf_visual_diff.py compares its output with LibreOffice's.
+
+The standard fonts only cover Windows-1252 (Western European) characters. Text
+outside it - Arabic client names, for instance - raises UnsupportedTextError rather
+than being printed as "?"; pdf_converter's native backend then hands the document to
+LibreOffice if it is installed, and fails otherwise. Invisible format characters
+(zero-width spaces and joiners, byte order marks...) are dropped first.
+"""
+import functools
+import io
+import math
+import re
+import struct
+import unicodedata
+import zlib
+
+from docx import Document
+from docx.oxml import ns
+from docx.shared import Emu
+
+# Clark names are looked up tens of thousands of times per document
+qn = functools.lru_cache(maxsize=None)(ns.qn)
+
+# Advance widths (1/1000 em) of printable ASCII in the standard Helvetica AFM metrics
+_HELVETICA = (
+    "278 278 355 556 556 889 667 191 333 333 389 584 278 333 278 278 556 556 556 556 556 556 556 556 556 556 "
+    "278 278 584 584 584 556 1015 667 667 722 722 667 611 778 722 278 500 667 556 833 722 778 667 778 722 667 "
+    "611 722 667 944 667 667 611 278 278 278 469 556 333 556 556 500 556 556 278 556 556 222 222 500 222 833 "
+    "556 556 556 556 333 500 278 556 500 722 500 500 500 334 260 334 584"
+)
+_HELVETICA_BOLD = (
+    "278 333 474 556 556 889 722 238 333 333 389 584 278 333 278 278 556 556 556 556 556 556 556 556 556 556 "
+    "333 333 584 584 584 611 975 722 722 722 722 667 611 778 722 278 556 722 611 833 722 778 667 778 722 667 "
+    "611 722 667 944 667 667 611 333 278 333 584 556 333 556 611 556 611 556 333 611 611 278 278 556 278 889 "
+    "611 611 611 611 389 556 333 611 556 778 556 556 500 389 280 389 584"
+)
+WIDTHS = {
+    False: dict(zip(map(chr, range(32, 127)), map(int, _HELVETICA.split()))),
+    True: dict(zip(map(chr, range(32, 127)), map(int, _HELVETICA_BOLD.split()))),
+}
+FONTS = {
+    (False, False): ("F1", "Helvetica"),
+    (True, False): ("F2", "Helvetica-Bold"),
+    (False, True): ("F3", "Helvetica-Oblique"),
+    (True, True): ("F4", "Helvetica-BoldOblique"),
+}
+
+TWIP = 1 / 20  # points
+DEFAULT_FONT_SIZE = 11.0
+DEFAULT_TAB_STOP = 36.0
+CELL_PADDING = 5.4
+# Bullet glyphs from Symbol/Wingdings fonts are drawn as a WinAnsi bullet
+BULLET = "•"
+VML_TEXTPATH = "{urn:schemas-microsoft-com:vml}textpath"
+WATERMARK_GRAY = 0.8
+
+
+def text_width(text, size, bold=False):
+    widths = WIDTHS[bool(bold)]
+    return sum(widths.get(ch, 556) for ch in text) * size / 1000
+
+
+def _visible(text):
+    """``text`` without format characters (Unicode category Cf, e.g. U+2060 WORD JOINER), which have no glyph."""
+    if text.isascii():
+        return text
+    return "".join(char for char in text if unicodedata.category(char) != "Cf")
+
+
+def _twips(value, default=None):
+    return int(value) * TWIP if value not in (None, "") else default
+
+
+def _val(element, tag, attr="w:val"):
+    child = element.find(qn(tag)) if element is not None else None
+    return None if child is None else child.get(qn(attr))
+
+
+def _on(element, tag):
+    """Value of an on/off property (w:b, w:i...): True, False or None when not set."""
+    child = element.find(qn(tag)) if element is not None else None
+    if child is None:
+        return None
+    return child.get(qn("w:val"), "true") not in ("0", "false", "off", "none")
+
+
+class Box:
+    """A laid-out unit (one line of text or one table row) with ops relative to its top-left."""
+
+    def __init__(self, height, ops=None, page_break_before=False):
+        self.height = height
+        self.ops = ops or []
+        self.page_break_before = page_break_before
+
+
+class Properties:
+    """Resolves paragraph and run properties through direct formatting, styles and docDefaults."""
+
+    def __init__(self, doc):
+        styles = doc.styles.element
+        self.styles = {s.get(qn("w:styleId")): s for s in styles.findall(qn("w:style"))}
+        defaults = styles.find(qn("w:docDefaults"))
+        self.default_rpr = defaults.find(f"{qn('w:rPrDefault')}/{qn('w:rPr')}") if defaults is not None else None
+        self.default_ppr = defaults.find(f"{qn('w:pPrDefault')}/{qn('w:pPr')}") if defaults is not None else None
+        self.default_paragraph_style = next(
+            (s.get(qn("w:styleId")) for s in styles.findall(qn("w:style"))
+             if s.get(qn("w:type")) == "paragraph" and s.get(qn("w:default")) in ("1", "true")),
+            None,
+        )
+
+    def chain(self, style_id):
+        """Style elements from ``style_id`` up through its basedOn ancestors."""
+        seen = set()
+        while style_id and style_id in self.styles and style_id not in seen:
+            seen.add(style_id)
+            style = self.styles[style_id]
+            yield style
+            style_id = _val(style, "w:basedOn")
+
+    def paragraph_pprs(self, p, table_style=None):
+        """pPr elements that apply to paragraph ``p``, most specific first."""
+        ppr = p.find(qn("w:pPr"))
+        style_id = _val(ppr, "w:pStyle") or self.default_paragraph_style
+        styles = [s.find(qn("w:pPr")) for s in self.chain(style_id)]
+        result = [ppr]
+        if table_style is not None and style_id == self.default_paragraph_style:
+            # Table style formatting beats the default paragraph style inside tables
+            result += [s.find(qn("w:pPr")) for s in self.chain(table_style)]
+        result += styles + [self.default_ppr]
+        return [element for element in result if element is not None]
+
+    def run_rprs(self, r, p, table_style=None):
+        """rPr elements that apply to run ``r`` in paragraph ``p``, most specific first."""
+        rpr = r.find(qn("w:rPr")) if r is not None else None
+        result = [rpr]
+        char_style = _val(rpr, "w:rStyle")
+        result += [s.find(qn("w:rPr")) for s in self.chain(char_style)]
+        ppr = p.find(qn("w:pPr"))
+        style_id = _val(ppr, "w:pStyle") or self.default_paragraph_style
+        if table_style is not None and style_id == self.default_paragraph_style:
+            result += [s.find(qn("w:rPr")) for s in self.chain(table_style)]
+        result += [s.find(qn("w:rPr")) for s in self.chain(style_id)] + [self.default_rpr]
+        return [element for element in result if element is not None]
+
+    @staticmethod
+    def first(elements, getter, default=None):
+        for element in elements:
+            value = getter(element)
+            if value is not None:
+                return value
+        return default
+
+
+class Numbering:
+    """Computes list labels ("1.", bullet...) and indents from numbering.xml."""
+
+    def __init__(self, doc):
+        self.nums = {}
+        self.abstracts = {}
+        self.counters = {}
+        try:
+            root = doc.part.numbering_part.element
+        except (KeyError, NotImplementedError):
+            return
+        for abstract in root.findall(qn("w:abstractNum")):
+            self.abstracts[abstract.get(qn("w:abstractNumId"))] = abstract
+        for num in root.findall(qn("w:num")):
+            self.nums[num.get(qn("w:numId"))] = _val(num, "w:abstractNumId")
+
+    def level(self, num_id, ilvl):
+        abstract = self.abstracts.get(self.nums.get(num_id))
+        if abstract is None:
+            return None
+        for lvl in abstract.findall(qn("w:lvl")):
+            if lvl.get(qn("w:ilvl")) == str(ilvl):
+                return lvl
+        return None
+
+    def label(self, num_id, ilvl):
+        """Return (label text, left indent, hanging indent) and advance the counter."""
+        lvl = self.level(num_id, ilvl)
+        if lvl is None:
+            return None
+        fmt = _val(lvl, "w:numFmt") or "decimal"
+        text = _val(lvl, "w:lvlText") or ""
+        start = int(_val(lvl, "w:start") or 1)
+        counters = self.counters.setdefault(num_id, {})
+        counters[ilvl] = counters.get(ilvl, start - 1) + 1
+        for deeper in [level for level in counters if level > ilvl]:
+            del counters[deeper]
+        if fmt == "bullet":
+            label = BULLET
+        elif fmt == "none":
+            label = ""
+        else:
+            label = text
+            for level, value in counters.items():
+                label = label.replace(f"%{level + 1}", self._format(value, fmt))
+        ind = lvl.find(f"{qn('w:pPr')}/{qn('w:ind')}")
+        left = _twips(ind.get(qn("w:left")) or ind.get(qn("w:start")), 0) if ind is not None else 0
+        hanging = _twips(ind.get(qn("w:hanging")), 0) if ind is not None else 0
+        return label, left, hanging
+
+    @staticmethod
+    def _format(value, fmt):
+        if fmt == "lowerLetter":
+            return chr(ord("a") + (value - 1) % 26)
+        if fmt == "upperLetter":
+            return chr(ord("A") + (value - 1) % 26)
+        if fmt in ("lowerRoman", "upperRoman"):
+            numerals = [(1000, "m"), (900, "cm"), (500, "d"), (400, "cd"), (100, "c"), (90, "xc"),
+                        (50, "l"), (40, "xl"), (10, "x"), (9, "ix"), (5, "v"), (4, "iv"), (1, "i")]
+            out = ""
+            for number, numeral in numerals:
+                while value >= number:
+                    out += numeral
+                    value -= number
+            return out.upper() if fmt == "upperRoman" else out
+        return str(value)
+
+
+class Image:
+    """
+    An image XObject: JPEG passes through as DCTDecode, PNGs as FlateDecode. An 8-bit
+    PNG alpha channel becomes a soft mask (``mask``).
+    """
+
+    def __init__(self, blob):
+        self.blob = blob
+        self.width = self.height = 0
+        self.params = None
+        self.mask = None
+        if blob[:2] == b"\xff\xd8":
+            self._parse_jpeg()
+        elif blob[:8] == b"\x89PNG\r\n\x1a\n":
+            self._parse_png()
+
+    @property
+    def supported(self):
+        return self.params is not None
+
+    def _parse_jpeg(self):
+        i = 2
+        while i < len(self.blob) - 9:
+            if self.blob[i] != 0xFF:
+                i += 1
+                continue
+            marker = self.blob[i + 1]
+            length = struct.unpack(">H", self.blob[i + 2:i + 4])[0]
+            if marker in (0xC0, 0xC1, 0xC2):
+                height, width = struct.unpack(">HH", self.blob[i + 5:i + 9])
+                components = self.blob[i + 9]
+                space = {1: "/DeviceGray", 3: "/DeviceRGB", 4: "/DeviceCMYK"}.get(components, "/DeviceRGB")
+                self.width, self.height = width, height
+                self.params = (f"/ColorSpace {space} /BitsPerComponent 8 /Filter /DCTDecode", self.blob)
+                return
+            i += 2 + length
+
+    def _parse_png(self):
+        pos, data, palette = 8, b"", None
+        header = None
+        while pos < len(self.blob):
+            length, kind = struct.unpack(">I4s", self.blob[pos:pos + 8])
+            chunk = self.blob[pos + 8:pos + 8 + length]
+            if kind == b"IHDR":
+                header = struct.unpack(">IIBBBBB", chunk)
+            elif kind == b"PLTE":
+                palette = chunk
+            elif kind == b"IDAT":
+                data += chunk
+            pos += 12 + length
+        if header is None:
+            return
+        width, height, depth, color_type, _, _, interlace = header
+        if interlace:
+            return
+        if color_type in (4, 6):
+            self._split_alpha(zlib.decompress(data), width, height, depth, color_type)
+            return
+        colors = {0: 1, 2: 3, 3: 1}[color_type]
+        if color_type == 3:
+            space = f"[/Indexed /DeviceRGB {len(palette) // 3 - 1} <{palette.hex()}>]"
+        else:
+            space = "/DeviceGray" if colors == 1 else "/DeviceRGB"
+        self.width, self.height = width, height
+        self.params = (
+            f"/ColorSpace {space} /BitsPerComponent {depth} /Filter /FlateDecode "
+            f"/DecodeParms << /Predictor 15 /Colors {colors} /BitsPerComponent {depth} /Columns {width} >>",
+            data,
+        )
+
+    def _split_alpha(self, data, width, height, depth, color_type):
+        # PDF has no alpha channel: unfilter the rows and split colour and alpha
+        if depth != 8:
+            return
+        bpp = 4 if color_type == 6 else 2
+        raw = _unfilter_png(data, width, height, bpp)
+        colors = bpp - 1
+        color = bytearray(width * height * colors)
+        for channel in range(colors):
+            color[channel::colors] = raw[channel::bpp]
+        space = "/DeviceRGB" if colors == 3 else "/DeviceGray"
+        self.width, self.height = width, height
+        self.params = (f"/ColorSpace {space} /BitsPerComponent 8 /Filter /FlateDecode", zlib.compress(bytes(color)))
+        self.mask = zlib.compress(bytes(raw[bpp - 1::bpp]))
+
+
+def _unfilter_png(data, width, height, bpp):
+    """Undo the per-row PNG filters of 8-bit image ``data``; returns the raw pixels."""
+    stride = width * bpp
+    out = bytearray()
+    previous = bytearray(stride)
+    pos = 0
+    for _ in range(height):
+        kind = data[pos]
+        row = bytearray(data[pos + 1:pos + 1 + stride])
+        pos += stride + 1
+        if kind == 1:
+            for i in range(bpp, stride):
+                row[i] = (row[i] + row[i - bpp]) & 0xFF
+        elif kind == 2:
+            for i in range(stride):
+                row[i] = (row[i] + previous[i]) & 0xFF
+        elif kind == 3:
+            for i in range(stride):
+                left = row[i - bpp] if i >= bpp else 0
+                row[i] = (row[i] + ((left + previous[i]) >> 1)) & 0xFF
+        elif kind == 4:
+            for i in range(stride):
+                a = row[i - bpp] if i >= bpp else 0
+                b = previous[i]
+                c = previous[i - bpp] if i >= bpp else 0
+                pa, pb, pc = abs(b - c), abs(a - c), abs(a + b - 2 * c)
+                row[i] = (row[i] + (a if pa <= pb and pa <= pc else b if pb <= pc else c)) & 0xFF
+        out += row
+        previous = row
+    return out
+
+
+class Renderer:
+    """Lays out one python-docx Document and serialises it as PDF."""
+
+    def __init__(self, doc):
+        self.doc = doc
+        self.props = Properties(doc)
+        self.numbering = Numbering(doc)
+        self.images = []
+        self._image_ids = {}
+        section = doc.sections[-1]
+        self.page_width = section.page_width.pt
+        self.page_height = section.page_height.pt
+        self.left = section.left_margin.pt
+        self.right = section.right_margin.pt
+        self.top = section.top_margin.pt
+        self.bottom = section.bottom_margin.pt
+        self.header_distance = section.header_distance.pt
+        self.footer_distance = section.footer_distance.pt
+        self.section = section
+        settings = doc.settings.element
+        self.default_tab = _twips(_val(settings, "w:defaultTabStop"), DEFAULT_TAB_STOP)
+
+    # -- inline content -------------------------------------------------
+
+    def _image(self, part, rid):
+        key = (id(part), rid)
+        if key not in self._image_ids:
+            try:
+                image = Image(part.related_parts[rid].blob)
+            except KeyError:
+                image = None
+            if image is None or not image.supported:
+                self._image_ids[key] = None
+            else:
+                self.images.append(image)
+                self._image_ids[key] = len(self.images) - 1
+        return self._image_ids[key]
+
+    def _drawing(self, drawing, part):
+        """Return ("inline", w, h, image) or ("anchor", spec) for a w:drawing element."""
+        blip = drawing.find(".//" + qn("a:blip"))
+        if blip is None:
+            return None
+        image = self._image(part, blip.get(qn("r:embed")))
+        if image is None:
+            return None
+        container = drawing[0]
+        extent = container.find(qn("wp:extent"))
+        width = Emu(int(extent.get("cx"))).pt
+        height = Emu(int(extent.get("cy"))).pt
+        if container.tag == qn("wp:inline"):
+            return ("inline", width, height, image)
+
+        def position(tag):
+            element = container.find(qn(tag))
+            if element is None:
+                return ("page", "offset", 0.0)
+            offset = element.find(qn("wp:posOffset"))
+            if offset is not None:
+                return (element.get("relativeFrom"), "offset", Emu(int(offset.text)).pt)
+            return (element.get("relativeFrom"), "align", element.findtext(qn("wp:align")))
+
+        behind = container.get("behindDoc") in ("1", "true")
+        return ("anchor", position("wp:positionH"), position("wp:positionV"), width, height, image, behind)
+
+    def _runs(self, p, part, table_style):
+        """
+        Yield layout items for a paragraph: ("text", str, style), ("tab",), ("br",), ("page",),
+        drawings and ("watermark", text) for VML text shapes.
+        """
+        for r in p.iter(qn("w:r")):
+            rprs = self.props.run_rprs(r, p, table_style)
+            if Properties.first(rprs, lambda e: _on(e, "w:vanish"), False):
+                continue
+            style = {
+                "bold": Properties.first(rprs, lambda e: _on(e, "w:b"), False),
+                "italic": Properties.first(rprs, lambda e: _on(e, "w:i"), False),
+                "size": Properties.first(rprs, lambda e: _val(e, "w:sz"), None),
+                "color": Properties.first(rprs, lambda e: _val(e, "w:color"), None),
+                "underline": Properties.first(rprs, lambda e: _val(e, "w:u"), None),
+                "caps": Properties.first(rprs, lambda e: _on(e, "w:caps"), False),
+            }
+            style["size"] = int(style["size"]) / 2 if style["size"] else DEFAULT_FONT_SIZE
+            if style["underline"] in ("none", None):
+                style["underline"] = None
+            for child in r:
+                tag = child.tag
+                if tag == qn("w:t"):
+                    text = _visible(child.text or "")
+                    yield ("text", text.upper() if style["caps"] else text, style)
+                elif tag == qn("w:tab"):
+                    yield ("tab", style)
+                elif tag == qn("w:br"):
+                    yield ("page",) if child.get(qn("w:type")) == "page" else ("br", style)
+                elif tag in (qn("w:cr"),):
+                    yield ("br", style)
+                elif tag == qn("w:noBreakHyphen"):
+                    yield ("text", "-", style)
+                elif tag == qn("w:drawing"):
+                    drawing = self._drawing(child, part)
+                    if drawing is not None:
+                        yield drawing
+                elif tag == qn("w:pict"):
+                    # The shape's textpath carries the text; its shapetype's does not
+                    for textpath in child.iter(VML_TEXTPATH):
+                        if textpath.get("string"):
+                            yield ("watermark", _visible(textpath.get("string")))
+                            break
+
+    # -- paragraphs -----------------------------------------------------
+
+    def layout_paragraph(self, p, width, part, table_style=None):
+        """Lay out paragraph ``p`` in a column ``width`` wide. Returns a list of Boxes."""
+        pprs = self.props.paragraph_pprs(p, table_style)
+        first = Properties.first
+
+        def spacing(attr):
+            return first(pprs, lambda e: _val(e, "w:spacing", attr))
+
+        def indent(*attrs):
+            for attr in attrs:
+                value = first(pprs, lambda e: _val(e, "w:ind", attr))
+                if value is not None:
+                    return _twips(value, 0)
+            return None
+
+        space_before = _twips(spacing("w:before"), 0)
+        space_after = _twips(spacing("w:after"), 0)
+        line_value = spacing("w:line")
+        line_rule = spacing("w:lineRule") or "auto"
+        align = first(pprs, lambda e: _val(e, "w:jc"), "left")
+        page_break_before = bool(first(pprs, lambda e: _on(e, "w:pageBreakBefore"), False))
+
+        left = indent("w:left", "w:start") or 0.0
+        right = indent("w:right", "w:end") or 0.0
+        first_line = indent("w:firstLine") or 0.0
+        hanging = indent("w:hanging")
+        if hanging:
+            first_line = -hanging
+
+        items = []
+        num_id = first(pprs, lambda e: _val(e.find(qn("w:numPr")), "w:numId") if e.find(qn("w:numPr")) is not None else None)
+        if num_id and num_id != "0":
+            ilvl = int(first(pprs, lambda e: _val(e.find(qn("w:numPr")), "w:ilvl") if e.find(qn("w:numPr")) is not None else None, "0") or 0)
+            numbered = self.numbering.label(num_id, ilvl)
+            if numbered is not None:
+                label, num_left, num_hanging = numbered
+                if indent("w:left", "w:start") is None:
+                    left = num_left
+                if hanging is None and indent("w:firstLine") is None:
+                    first_line = -num_hanging
+                mark_rprs = self.props.run_rprs(None, p, table_style)
+                size = first(mark_rprs, lambda e: _val(e, "w:sz"))
+                label_style = {"bold": False, "italic": False, "color": None, "underline": None,
+                               "size": int(size) / 2 if size else DEFAULT_FONT_SIZE}
+                items += [("text", label, label_style), ("tab", label_style)]
+
+        items += list(self._runs(p, part, table_style))
+        mark_size = first(self.props.run_rprs(None, p, table_style), lambda e: _val(e, "w:sz"))
+        mark_size = int(mark_size) / 2 if mark_size else DEFAULT_FONT_SIZE
+
+        tabs = sorted(
+            _twips(tab.get(qn("w:pos")), 0)
+            for ppr in pprs[:1] for tab in ppr.findall(f"{qn('w:tabs')}/{qn('w:tab')}")
+            if tab.get(qn("w:val")) not in ("clear", None)
+        )
+
+        lines = self._break_lines(items, width - left - right, first_line, left, tabs)
+        boxes = []
+        anchors = [item for item in items if item[0] in ("anchor", "watermark")]
+        for index, (line, line_width, line_left, forced_page) in enumerate(lines):
+            sizes = [item[2]["size"] for item in line if item[0] == "text"] or [mark_size]
+            inline_heights = [item[3] for item in line if item[0] == "inline"]
+            size = max(sizes)
+            if line_rule == "auto" and line_value:
+                natural = size * 1.22 * int(line_value) / 240
+            elif line_rule == "exact" and line_value:
+                natural = _twips(line_value)
+            elif line_value:
+                natural = max(size * 1.22, _twips(line_value))
+            else:
+                natural = size * 1.22
+            height = max([natural] + [h + size * 0.3 for h in inline_heights])
+            baseline = height - size * 0.22 - (natural - size * 1.22 if line_rule == "auto" and natural > size * 1.22 else 0)
+
+            available = width - left - right - (line_left - left)
+            if align in ("center",):
+                shift = (available - line_width) / 2
+            elif align in ("right", "end"):
+                shift = available - line_width
+            else:
+                shift = 0
+            ops = []
+            for item in line:
+                kind = item[0]
+                x = line_left + shift + item[-1]
+                if kind == "text":
+                    ops.append(("text", x, baseline, item[1], item[2]))
+                elif kind == "inline":
+                    ops.append(("image", x, baseline - item[2], item[1], item[2], item[3]))
+            if index == 0:
+                ops += anchors
+            box = Box(height, ops, page_break_before=forced_page or (index == 0 and page_break_before))
+            boxes.append(box)
+        if boxes:
+            boxes[0].space_before = space_before
+        boxes.append(Box(space_after))
+        if boxes and space_before:
+            boxes.insert(0, Box(space_before))
+        return boxes
+
+    def _break_lines(self, items, width, first_line, left, tabs):
+        """Greedy line breaking. Returns [(placed items, line width, line x, page break before)]."""
+        lines = []
+        line, x, forced = [], 0.0, False
+        line_left = left + first_line
+
+        def finish():
+            nonlocal line, x, forced, line_left
+            # Trailing spaces do not count towards alignment
+            while line and line[-1][0] == "text" and not line[-1][1].strip():
+                line.pop()
+            used = 0.0
+            if line:
+                last = line[-1]
+                used = last[-1] + (text_width(last[1].rstrip(), last[2]["size"], last[2]["bold"]) if last[0] == "text"
+                                   else last[1] if last[0] == "inline" else 0)
+            lines.append((line, used, line_left, forced))
+            line, x, forced = [], 0.0, False
+            line_left = left
+
+        limit = lambda: width - (line_left - left)  # noqa: E731
+        for item in items:
+            kind = item[0]
+            if kind == "text":
+                style = item[2]
+                for token in re.findall(r"\S+\s*|\s+", item[1]):
+                    w = text_width(token, style["size"], style["bold"])
+                    if x + text_width(token.rstrip(), style["size"], style["bold"]) > limit() and x > 0:
+                        finish()
+                        if not token.strip():
+                            continue
+                    line.append(("text", token, style, x))
+                    x += w
+            elif kind == "tab":
+                absolute = line_left - left + x
+                # A hanging indent acts as an implicit tab stop at the left indent
+                implicit = [0.0] if first_line < 0 else []
+                stops = [stop - (line_left - left) for stop in sorted(tabs + implicit) if stop > absolute + 0.5]
+                target = stops[0] if stops else (int(absolute / self.default_tab) + 1) * self.default_tab - (line_left - left)
+                if target > limit():
+                    finish()
+                    target = 0.0
+                line.append(("tab", item[1], x))
+                x = target
+            elif kind == "br":
+                finish()
+            elif kind == "page":
+                finish()
+                forced = True
+            elif kind == "inline":
+                if x + item[1] > limit() and x > 0:
+                    finish()
+                line.append((*item, x))
+                x += item[1]
+        finish()
+        return lines
+
+    # -- tables ---------------------------------------------------------
+
+    def _borders(self, tbl):
+        """Table-level border spec {edge: (val, width)} from the table style and tblPr."""
+        borders = {}
+        style_id = _val(tbl.find(qn("w:tblPr")), "w:tblStyle")
+        sources = [s.find(f"{qn('w:tblPr')}/{qn('w:tblBorders')}") for s in reversed(list(self.props.chain(style_id)))]
+        sources.append(tbl.find(f"{qn('w:tblPr')}/{qn('w:tblBorders')}"))
+        for source in sources:
+            if source is None:
+                continue
+            for edge in source:
+                borders[edge.tag.split("}")[1]] = (edge.get(qn("w:val")), int(edge.get(qn("w:sz")) or 4) / 8)
+        return borders, style_id
+
+    def layout_table(self, tbl, width, part):
+        """Lay out a table, one Box per row."""
+        grid = [_twips(col.get(qn("w:w")), 0) for col in tbl.iter(qn("w:gridCol"))]
+        if not grid or not sum(grid):
+            return []
+        scale = min(1.0, width / sum(grid))
+        grid = [w * scale for w in grid]
+        borders, table_style = self._borders(tbl)
+        rows = tbl.findall(qn("w:tr"))
+        boxes = []
+        for row_index, tr in enumerate(rows):
+            cells = []
+            column = 0
+            for tc in tr.findall(qn("w:tc")):
+                tcpr = tc.find(qn("w:tcPr"))
+                span = int(_val(tcpr, "w:gridSpan") or 1)
+                x = sum(grid[:column])
+                cell_width = sum(grid[column:column + span])
+                continued = tcpr is not None and tcpr.find(qn("w:vMerge")) is not None and _val(tcpr, "w:vMerge") in (None, "continue")
+                content = [] if continued else self.layout_blocks(tc, cell_width - 2 * CELL_PADDING, part, table_style)
+                height = sum(box.height for box in content)
+                cells.append((tc, tcpr, x, cell_width, column, span, content, height, continued))
+                column += span
+            height_rule = _val(tr.find(qn("w:trPr")), "w:trHeight", "w:hRule")
+            min_height = _twips(_val(tr.find(qn("w:trPr")), "w:trHeight"), 0)
+            row_height = max([c[7] for c in cells] + [min_height])
+            if height_rule == "exact" and min_height:
+                row_height = min_height
+
+            ops = []
+            for tc, tcpr, x, cell_width, column, span, content, _, continued in cells:
+                fill = _val(tcpr, "w:shd", "w:fill")
+                if fill and fill not in ("auto", "FFFFFF"):
+                    ops.append(("rect", x, 0, cell_width, row_height, fill))
+                dark = bool(fill) and fill != "auto" and sum(_rgb(fill)) < 1.5
+                free = row_height - sum(box.height for box in content)
+                y = {"center": free / 2, "bottom": free}.get(_val(tcpr, "w:vAlign"), 0.0)
+                for box in content:
+                    for op in box.ops:
+                        if dark and op[0] == "text" and op[4]["color"] in (None, "auto"):
+                            # Automatic text colour turns white on dark shading
+                            op = op[:4] + ({**op[4], "color": "FFFFFF"},)
+                        ops.append(_offset(op, x + CELL_PADDING, y))
+                    y += box.height
+                cell_borders = tcpr.find(qn("w:tcBorders")) if tcpr is not None else None
+                edges = {
+                    "top": ("top" if row_index == 0 else "insideH", (x, 0, x + cell_width, 0)),
+                    "bottom": ("bottom" if row_index == len(rows) - 1 else "insideH", (x, row_height, x + cell_width, row_height)),
+                    "left": ("left" if column == 0 else "insideV", (x, 0, x, row_height)),
+                    "right": ("right" if column + span >= len(grid) else "insideV", (x + cell_width, 0, x + cell_width, row_height)),
+                }
+                for edge, (table_edge, line) in edges.items():
+                    spec = borders.get(table_edge) or borders.get({"left": "start", "right": "end"}.get(table_edge, ""))
+                    own = cell_borders.find(qn(f"w:{edge}")) if cell_borders is not None else None
+                    if own is None and cell_borders is not None and edge in ("left", "right"):
+                        own = cell_borders.find(qn("w:start" if edge == "left" else "w:end"))
+                    if own is not None:
+                        spec = (own.get(qn("w:val")), int(own.get(qn("w:sz")) or 4) / 8)
+                    if continued and edge == "top":
+                        continue
+                    if spec and spec[0] not in ("nil", "none"):
+                        ops.append(("line",) + line + (spec[1],))
+            boxes.append(Box(row_height, ops))
+        return boxes
+
+    # -- block containers -----------------------------------------------
+
+    def layout_blocks(self, container, width, part, table_style=None):
+        """Lay out the paragraphs and tables of a body, cell, header or footer."""
+        boxes = []
+        for child in container.iterchildren():
+            if child.tag == qn("w:p"):
+                boxes += self.layout_paragraph(child, width, part, table_style)
+            elif child.tag == qn("w:tbl"):
+                boxes += self.layout_table(child, width, part)
+            elif child.tag == qn("w:sdt"):
+                content = child.find(qn("w:sdtContent"))
+                if content is not None:
+                    boxes += self.layout_blocks(content, width, part, table_style)
+        return boxes
+
+    # -- pages ----------------------------------------------------------
+
+    def render(self):
+        width = self.page_width - self.left - self.right
+        body = self.layout_blocks(self.doc.element.body, width, self.doc.part)
+
+        header = self.section.header
+        footer = self.section.footer
+        header_boxes = [] if header.is_linked_to_previous and len(self.doc.sections) == 1 and not header._has_definition else \
+            self.layout_blocks(header._element, width, header.part)
+        footer_boxes = [] if not footer._has_definition else self.layout_blocks(footer._element, width, footer.part)
+        header_height = sum(box.height for box in header_boxes)
+        footer_height = sum(box.height for box in footer_boxes)
+        content_top = max(self.top, self.header_distance + header_height)
+        content_bottom = self.page_height - max(self.bottom, self.footer_distance + footer_height)
+
+        pages = []
+
+        def new_page():
+            page = {"background": [], "ops": []}
+            y = self.header_distance
+            for box in header_boxes:
+                self._place(page, box, self.left, y)
+                y += box.height
+            y = self.page_height - self.footer_distance - footer_height
+            for box in footer_boxes:
+                self._place(page, box, self.left, y)
+                y += box.height
+            pages.append(page)
+            return page
+
+        page = new_page()
+        y = content_top
+        for box in body:
+            at_top = y <= content_top + 0.01
+            if (box.page_break_before and not at_top) or (y + box.height > content_bottom and not at_top and box.ops):
+                page = new_page()
+                y = content_top
+                if not box.ops:
+                    continue
+            self._place(page, box, self.left, y)
+            y += box.height
+        return self._write(pages)
+
+    def _place(self, page, box, x0, y0):
+        for op in box.ops:
+            if op[0] == "anchor":
+                (h_rel, h_mode, h_value), (v_rel, v_mode, v_value), w, h, image, behind = op[1:]
+                if h_mode == "align":
+                    base, span = (0, self.page_width) if h_rel == "page" else (self.left, self.page_width - self.left - self.right)
+                    x = base + {"center": (span - w) / 2, "right": span - w}.get(h_value, 0)
+                else:
+                    x = {"page": 0, "margin": self.left, "leftMargin": 0}.get(h_rel, x0) + h_value
+                if v_mode == "align":
+                    base, span = (0, self.page_height) if v_rel == "page" else (self.top, self.page_height - self.top - self.bottom)
+                    y = base + {"center": (span - h) / 2, "bottom": span - h}.get(v_value, 0)
+                else:
+                    y = {"page": 0, "margin": self.top, "topMargin": 0}.get(v_rel, y0) + v_value
+                (page["background"] if behind else page["ops"]).append(("image", x, y, w, h, image))
+            elif op[0] == "watermark":
+                page["background"].append(op)
+            else:
+                page["ops"].append(_offset(op, x0, y0))
+
+    # -- PDF serialisation ----------------------------------------------
+
+    def _content(self, page):
+        out = []
+        height = self.page_height
+        for op in page["background"] + page["ops"]:
+            kind = op[0]
+            if kind == "text":
+                _, x, y, text, style = op
+                if not text.strip():
+                    continue
+                font, _ = FONTS[(bool(style["bold"]), bool(style["italic"]))]
+                color = style.get("color")
+                rgb = _rgb(color) if color and color != "auto" else (0, 0, 0)
+                out.append(f"{rgb[0]:.3f} {rgb[1]:.3f} {rgb[2]:.3f} rg BT /{font} {style['size']:.2f} Tf "
+                           f"{x:.2f} {height - y:.2f} Td ({_pdf_string(text)}) Tj ET")
+                if style.get("underline"):
+                    w = text_width(text.rstrip(), style["size"], style["bold"])
+                    uy = height - y - style["size"] * 0.12
+                    out.append(f"{rgb[0]:.3f} {rgb[1]:.3f} {rgb[2]:.3f} RG 0.5 w {x:.2f} {uy:.2f} m {x + w:.2f} {uy:.2f} l S")
+            elif kind == "line":
+                _, x1, y1, x2, y2, w = op
+                out.append(f"0 0 0 RG {w:.2f} w {x1:.2f} {height - y1:.2f} m {x2:.2f} {height - y2:.2f} l S")
+            elif kind == "rect":
+                _, x, y, w, h, fill = op
+                r, g, b = _rgb(fill)
+                out.append(f"{r:.3f} {g:.3f} {b:.3f} rg {x:.2f} {height - y - h:.2f} {w:.2f} {h:.2f} re f")
+            elif kind == "image":
+                _, x, y, w, h, image = op
+                out.append(f"q {w:.2f} 0 0 {h:.2f} {x:.2f} {height - y - h:.2f} cm /Im{image} Do Q")
+            elif kind == "watermark":
+                out.append(self._watermark(op[1]))
+        return "\n".join(out).encode("latin-1")
+
+    def _watermark(self, text):
+        """Large grey text along the page diagonal, behind the content."""
+        angle = math.atan2(self.page_height, self.page_width)
+        diagonal = math.hypot(self.page_width, self.page_height)
+        size = min(diagonal * 0.6 / max(text_width(text, 1, True), 0.01), 160)
+        cos, sin = math.cos(angle), math.sin(angle)
+        # Start so that the text (cap height ~0.72 em) is centred on the page
+        offset, rise = text_width(text, size, True) / 2, size * 0.36
+        x = self.page_width / 2 - offset * cos + rise * sin
+        y = self.page_height / 2 - offset * sin - rise * cos
+        return (f"{WATERMARK_GRAY} g BT /F2 {size:.2f} Tf {cos:.4f} {sin:.4f} {-sin:.4f} {cos:.4f} "
+                f"{x:.2f} {y:.2f} Tm ({_pdf_string(text)}) Tj ET")
+
+    def _write(self, pages):
+        objects = []
+
+        def add(body):
+            objects.append(body)
+            return len(objects)
+
+        catalog = add(None)
+        page_tree = add(None)
+        fonts = {name: add(f"<< /Type /Font /Subtype /Type1 /BaseFont /{base} /Encoding /WinAnsiEncoding >>".encode())
+                 for name, base in FONTS.values()}
+        images = []
+        for image in self.images:
+            params, data = image.params
+            if image.mask is not None:
+                mask = add(
+                    f"<< /Type /XObject /Subtype /Image /Width {image.width} /Height {image.height} "
+                    f"/ColorSpace /DeviceGray /BitsPerComponent 8 /Filter /FlateDecode "
+                    f"/Length {len(image.mask)} >>\nstream\n".encode() + image.mask + b"\nendstream"
+                )
+                params += f" /SMask {mask} 0 R"
+            images.append(add(
+                f"<< /Type /XObject /Subtype /Image /Width {image.width} /Height {image.height} {params} "
+                f"/Length {len(data)} >>\nstream\n".encode() + data + b"\nendstream"
+            ))
+        resources = (
+            "<< /Font << " + " ".join(f"/{name} {number} 0 R" for name, number in fonts.items()) + " >> "
+            "/XObject << " + " ".join(f"/Im{i} {number} 0 R" for i, number in enumerate(images)) + " >> >>"
+        )
+        page_numbers = []
+        for page in pages:
+            content = zlib.compress(self._content(page))
+            stream = add(f"<< /Length {len(content)} /Filter /FlateDecode >>\nstream\n".encode() + content + b"\nendstream")
+            page_numbers.append(add(
+                f"<< /Type /Page /Parent {page_tree} 0 R /MediaBox [0 0 {self.page_width:.2f} {self.page_height:.2f}] "
+                f"/Resources {resources} /Contents {stream} 0 R >>".encode()
+            ))
+        objects[catalog - 1] = f"<< /Type /Catalog /Pages {page_tree} 0 R >>".encode()
+        objects[page_tree - 1] = (
+            f"<< /Type /Pages /Count {len(page_numbers)} /Kids [" + " ".join(f"{n} 0 R" for n in page_numbers) + "] >>"
+        ).encode()
+
+        out = io.BytesIO()
+        out.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        offsets = []
+        for number, body in enumerate(objects, start=1):
+            offsets.append(out.tell())
+            out.write(f"{number} 0 obj\n".encode() + body + b"\nendobj\n")
+        xref = out.tell()
+        out.write(f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode())
+        for offset in offsets:
+            out.write(f"{offset:010d} 00000 n \n".encode())
+        out.write(f"trailer\n<< /Size {len(objects) + 1} /Root {catalog} 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode())
+        return out.getvalue()
+
+
+def _offset(op, dx, dy):
+    kind = op[0]
+    if kind == "text":
+        return ("text", op[1] + dx, op[2] + dy, op[3], op[4])
+    if kind == "image":
+        return ("image", op[1] + dx, op[2] + dy) + op[3:]
+    if kind == "line":
+        return ("line", op[1] + dx, op[2] + dy, op[3] + dx, op[4] + dy, op[5])
+    if kind == "rect":
+        return ("rect", op[1] + dx, op[2] + dy) + op[3:]
+    return op
+
+
+def _rgb(hex_color):
+    try:
+        return tuple(int(hex_color[i:i + 2], 16) / 255 for i in (0, 2, 4))
+    except (TypeError, ValueError):
+        return (0, 0, 0)
+
+
+class UnsupportedTextError(ValueError):
+    """Text the standard PDF fonts cannot show (outside Windows-1252)."""
+
+
+def _pdf_string(text):
+    try:
+        data = text.replace("\t", " ").encode("cp1252").decode("latin-1")
+    except UnicodeEncodeError:
+        unsupported = "".join(sorted({c for c in text if not _encodable(c)}))
+        raise UnsupportedTextError(f"Characters not supported by the standard PDF fonts: {unsupported!r} "
+                                   f"in {text.strip()!r}") from None
+    return data.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def _encodable(char):
+    try:
+        char.encode("cp1252")
+        return True
+    except UnicodeEncodeError:
+        return False
+
+
+def render_document(doc):
+    """Render a python-docx Document to PDF bytes."""
+    return Renderer(doc).render()
+
+
+def render_docx(data):
+    """Render .docx bytes to PDF bytes."""
+    return render_document(Document(io.BytesIO(data)))
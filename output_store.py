@@ -0,0 +1,224 @@
+"""
+In-memory store for generated documents.
+
+Generated .docx/.pdf bytes are kept here keyed by job id instead of being written into
+the working directory, where clients with the same name overwrote each other's files
+and old outputs piled up. The store is bounded by total size (``OUTPUT_CACHE_BYTES``)
+and entries expire after ``OUTPUT_TTL`` seconds; the least recently used entries are
+evicted first.
+
+With several processes (``STATE_BACKEND``, see shared_state.py) the entries have to
+be visible to all of them: ``FileOutputStore`` keeps each entry as one file under
+``STATE_DIR/outputs`` (``local``) and ``RedisOutputStore`` as one key with a TTL
+(``redis``). Both have the same ``put``/``get``/``stats`` interface.
+
+Writing outputs to disk is an optional, separate sink: set ``ARCHIVE_DIR`` and every
+generated file is also copied to ``ARCHIVE_DIR/<YYYY-MM-DD>/<key>/``.
+"""
+import collections
+import os
+import pickle
+import re
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+from shared_state import state_backend, state_path
+
+OUTPUT_CACHE_BYTES = int(os.environ.get("OUTPUT_CACHE_BYTES", 256 * 1024 * 1024))
+OUTPUT_TTL = float(os.environ.get("OUTPUT_TTL", 3600))
+ARCHIVE_DIR = os.environ.get("ARCHIVE_DIR")
+
+
+class OutputStore:
+    """Size-bounded, TTL-evicted mapping of key -> {file name: bytes}."""
+
+    def __init__(self, max_bytes=OUTPUT_CACHE_BYTES, ttl=OUTPUT_TTL):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.size = 0
+
+    def put(self, key, files):
+        size = sum(len(data) for data in files.values())
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl, size, dict(files))
+            self.size += size
+            self._evict()
+
+    def get(self, key):
+        """Return the files stored under ``key``, or None if missing or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[2]
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry[1]
+
+    def _evict(self):
+        now = time.monotonic()
+        for key, (expires, _, _) in list(self._entries.items()):
+            if expires < now:
+                self._remove(key)
+        # Oldest first, but never drop the entry that was just added
+        while self.size > self.max_bytes and len(self._entries) > 1:
+            self._remove(next(iter(self._entries)))
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self.size, "max_bytes": self.max_bytes}
+
+
+def _check_key(key):
+    # Keys become file names and Redis keys
+    if not re.fullmatch(r"[\w.-]+", key):
+        raise ValueError(f"Invalid output key {key!r}")
+    return key
+
+
+class FileOutputStore:
+    """
+    OutputStore on a directory shared by the processes of one host (or a shared volume).
+
+    Each entry is a single file written atomically, so readers never see a partial
+    one. Expired entries, and the oldest ones beyond ``max_bytes``, are removed by a
+    sweep at most every ``sweep_interval`` seconds.
+    """
+
+    def __init__(self, root, max_bytes=OUTPUT_CACHE_BYTES, ttl=OUTPUT_TTL, sweep_interval=60):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        self._last_sweep = 0.0
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.root, _check_key(key) + ".pickle")
+
+    def put(self, key, files):
+        fd, tmp = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(dict(files), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, self._path(key))
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        if time.time() - self._last_sweep > self.sweep_interval:
+            self._sweep()
+
+    def get(self, key):
+        """Return the files stored under ``key``, or None if missing or expired."""
+        path = self._path(key)
+        try:
+            if os.path.getmtime(path) + self.ttl < time.time():
+                return None
+            with open(path, "rb") as f:
+                return pickle.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _entries(self):
+        entries = []
+        for entry in os.scandir(self.root):
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return sorted(entries)
+
+    def _sweep(self):
+        self._last_sweep = time.time()
+        cutoff = time.time() - self.ttl
+        entries = self._entries()
+        size = sum(entry[1] for entry in entries)
+        # Oldest first; the newest entry is never dropped for size
+        for index, (mtime, entry_size, path) in enumerate(entries):
+            if mtime >= cutoff and (size <= self.max_bytes or index == len(entries) - 1):
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            size -= entry_size
+
+    def stats(self):
+        entries = [entry for entry in self._entries() if entry[2].endswith(".pickle")]
+        return {"entries": len(entries), "bytes": sum(entry[1] for entry in entries), "max_bytes": self.max_bytes,
+                "backend": "local"}
+
+
+class RedisOutputStore:
+    """OutputStore in a Redis-protocol server: one key per entry, expired by the server."""
+
+    def __init__(self, client, ttl=OUTPUT_TTL, prefix="outputs:"):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def put(self, key, files):
+        data = pickle.dumps(dict(files), protocol=pickle.HIGHEST_PROTOCOL)
+        self.client.execute("SET", self.prefix + _check_key(key), data, "PX", int(self.ttl * 1000))
+
+    def get(self, key):
+        """Return the files stored under ``key``, or None if missing or expired."""
+        data = self.client.execute("GET", self.prefix + _check_key(key))
+        return None if data is None else pickle.loads(data)
+
+    def stats(self):
+        # Size limits are the server's (maxmemory); nothing is counted here
+        return {"backend": "redis", "url": self.client.url.split("@")[-1]}
+
+
+class DirectorySink:
+    """Optional on-disk archive of generated files."""
+
+    def __init__(self, root):
+        self.root = root
+
+    def write(self, key, files):
+        directory = os.path.join(self.root, datetime.now().strftime("%Y-%m-%d"), key)
+        os.makedirs(directory, exist_ok=True)
+        for name, data in files.items():
+            with open(os.path.join(directory, os.path.basename(name)), "wb") as f:
+                f.write(data)
+        return directory
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_output_store():
+    """Return the process-wide output store for the configured STATE_BACKEND."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            backend = state_backend()
+            if backend == "local":
+                _store = FileOutputStore(state_path("outputs"))
+            elif backend == "redis":
+                from resp_client import get_resp_client
+
+                _store = RedisOutputStore(get_resp_client())
+            else:
+                _store = OutputStore()
+        return _store
+
+
+def get_archive_sink():
+    """Return the configured DirectorySink, or None when ARCHIVE_DIR is not set."""
+    return DirectorySink(ARCHIVE_DIR) if ARCHIVE_DIR else None
@@ -0,0 +1,562 @@
+"""
+Pool of warm LibreOffice instances for DOCX -> PDF conversion.
+
+Starting ``libreoffice --headless --convert-to pdf`` for every document costs a
+multi-second cold start, and concurrent conversions serialise on the shared user
+profile. The pool below keeps ``PDF_WORKERS`` soffice instances running, each with
+its own profile directory, and hands conversions to them through a queue.
+
+Each worker uses one of two backends:
+
+* ``UnoBackend`` - a long-lived ``soffice_worker.py`` helper (run by a Python that
+  can ``import uno``) keeps soffice loaded and converts over the UNO bridge.
+* ``SubprocessBackend`` - fallback when no UNO-capable Python is available; runs one
+  ``soffice --convert-to`` per document, but against the worker's own pre-initialised
+  profile so conversions no longer block each other.
+
+Workers that crash or exceed ``PDF_TIMEOUT`` seconds are killed and restarted.
+Conversions can ask for PDF/A (``pdfa=True``), the archival profile with embedded
+fonts, instead of a plain PDF: PDF/A-2b from LibreOffice, PDF/A-1b from Word, whose
+export offers no later part of the standard.
+
+``convert_to_pdf`` and friends dispatch to a backend chosen by ``PDF_BACKEND``: Word
+over COM, this LibreOffice pool, or the pure-Python renderer in native_pdf.py.
+"""
+import collections
+import json
+import os
+import platform
+import queue
+import select
+import shutil
+import signal
+import subprocess
+import tempfile
+import threading
+import time
+import uuid
+
+DEFAULT_WORKERS = int(os.environ.get("PDF_WORKERS", 2))
+DEFAULT_TIMEOUT = float(os.environ.get("PDF_TIMEOUT", 60))
+STARTUP_TIMEOUT = float(os.environ.get("PDF_STARTUP_TIMEOUT", 60))
+UNO_PYTHON = os.environ.get("UNO_PYTHON", "/usr/bin/python3")
+# "word", "libreoffice" or "native"; see get_backend()
+PDF_BACKEND = os.environ.get("PDF_BACKEND")
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "soffice_worker.py")
+# writer_pdf_Export with SelectPdfVersion 2 = PDF/A-2b
+PDFA_FILTER = 'pdf:writer_pdf_Export:{"SelectPdfVersion":{"type":"long","value":"2"}}'
+
+
+class ConversionError(Exception):
+    """Raised when a document could not be converted to PDF."""
+
+
+class ConversionTimeout(ConversionError):
+    """Raised when a worker did not finish a conversion within the timeout."""
+
+
+def find_soffice():
+    """Return the path of the LibreOffice binary, or None if it is not installed."""
+    for name in ("soffice", "libreoffice"):
+        path = shutil.which(name)
+        if path:
+            return path
+    return None
+
+
+def uno_available(python=UNO_PYTHON):
+    """Check whether ``python`` can import the UNO bridge."""
+    if not python or not os.path.exists(python):
+        return False
+    try:
+        subprocess.run([python, "-c", "import uno"], check=True, timeout=30,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        return True
+    except (subprocess.SubprocessError, OSError):
+        return False
+
+
+def _kill_group(proc):
+    """Kill a process started with start_new_session=True together with its children."""
+    if proc is None or proc.poll() is not None:
+        return
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        proc.kill()
+    proc.wait()
+
+
+def _profile_url(profile_dir):
+    return "file://" + os.path.abspath(profile_dir)
+
+
+class UnoBackend:
+    """Converts through a persistent soffice driven by soffice_worker.py."""
+
+    def __init__(self, soffice, profile_dir, python=UNO_PYTHON):
+        self.soffice = soffice
+        self.profile_dir = profile_dir
+        self.python = python
+        self.proc = None
+
+    def start(self):
+        pipe_name = f"docgen-{uuid.uuid4().hex}"
+        self.proc = subprocess.Popen(
+            [self.python, WORKER_SCRIPT, self.soffice, self.profile_dir, pipe_name],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            text=True,
+            start_new_session=True,
+        )
+        reply = self._read_reply(STARTUP_TIMEOUT)
+        if not reply.get("ready"):
+            raise ConversionError(f"soffice worker failed to start: {reply}")
+
+    def _read_reply(self, timeout):
+        ready, _, _ = select.select([self.proc.stdout], [], [], timeout)
+        if not ready:
+            raise ConversionTimeout(f"soffice worker did not answer within {timeout:.0f}s")
+        line = self.proc.stdout.readline()
+        if not line:
+            raise ConversionError(f"soffice worker exited with code {self.proc.poll()}")
+        return json.loads(line)
+
+    def convert(self, doc_path, pdf_path, timeout, pdfa=False):
+        self.proc.stdin.write(json.dumps({"src": doc_path, "dst": pdf_path, "pdfa": pdfa}) + "\n")
+        self.proc.stdin.flush()
+        reply = self._read_reply(timeout)
+        if not reply.get("ok"):
+            raise ConversionError(reply.get("error", "unknown LibreOffice error"))
+
+    def convert_many(self, pairs, timeout, pdfa=False):
+        # The office is already warm, so a batch is just consecutive jobs
+        errors = {}
+        for doc_path, pdf_path in pairs:
+            try:
+                self.convert(doc_path, pdf_path, timeout, pdfa)
+            except ConversionTimeout:
+                raise
+            except ConversionError as e:
+                errors[doc_path] = e
+        return errors
+
+    def alive(self):
+        return self.proc is not None and self.proc.poll() is None
+
+    def stop(self):
+        _kill_group(self.proc)
+        self.proc = None
+
+
+class SubprocessBackend:
+    """Runs one ``soffice --convert-to`` per document against a dedicated profile."""
+
+    def __init__(self, soffice, profile_dir):
+        self.soffice = soffice
+        self.profile_dir = profile_dir
+
+    def _run(self, args, timeout):
+        proc = subprocess.Popen(
+            [self.soffice, "--headless", "--norestore", "--nolockcheck",
+             f"-env:UserInstallation={_profile_url(self.profile_dir)}"] + args,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            start_new_session=True,
+        )
+        try:
+            _, stderr = proc.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            _kill_group(proc)
+            raise ConversionTimeout(f"LibreOffice did not finish within {timeout:.0f}s")
+        if proc.returncode != 0:
+            raise ConversionError(f"LibreOffice exited with code {proc.returncode}: {stderr.decode(errors='replace').strip()}")
+
+    def start(self):
+        # Populate the profile once so the first real conversion does not pay for it
+        self._run(["--terminate_after_init"], STARTUP_TIMEOUT)
+
+    def convert(self, doc_path, pdf_path, timeout, pdfa=False):
+        error = self.convert_many([(doc_path, pdf_path)], timeout, pdfa).get(doc_path)
+        if error is not None:
+            raise error
+
+    def convert_many(self, pairs, timeout, pdfa=False):
+        # One soffice call per output directory converts the whole group
+        by_dir = {}
+        for doc_path, pdf_path in pairs:
+            by_dir.setdefault(os.path.dirname(pdf_path), []).append((doc_path, pdf_path))
+        errors = {}
+        for out_dir, group in by_dir.items():
+            self._run(["--convert-to", PDFA_FILTER if pdfa else "pdf", "--outdir", out_dir] + [doc for doc, _ in group], timeout * len(group))
+            for doc_path, pdf_path in group:
+                produced = os.path.join(out_dir, os.path.splitext(os.path.basename(doc_path))[0] + ".pdf")
+                if not os.path.exists(produced):
+                    errors[doc_path] = ConversionError(f"LibreOffice did not produce {produced}")
+                elif produced != pdf_path:
+                    os.replace(produced, pdf_path)
+        return errors
+
+    def alive(self):
+        return True
+
+    def stop(self):
+        pass
+
+
+class _Job:
+    def __init__(self, pairs, timeout, pdfa=False):
+        self.pairs = pairs
+        self.timeout = timeout
+        self.pdfa = pdfa
+        self.submitted = time.monotonic()
+        self.done = threading.Event()
+        # Job-wide failure (crash, timeout) and per-document failures
+        self.error = None
+        self.errors = {}
+
+
+class _Worker(threading.Thread):
+    def __init__(self, pool, index):
+        super().__init__(name=f"pdf-worker-{index}", daemon=True)
+        self.pool = pool
+        self.profile_dir = tempfile.mkdtemp(prefix=f"soffice-profile-{index}-")
+        self.backend = None
+
+    def _new_backend(self):
+        if self.pool.use_uno:
+            return UnoBackend(self.pool.soffice, self.profile_dir)
+        return SubprocessBackend(self.pool.soffice, self.profile_dir)
+
+    def _ensure_backend(self):
+        if self.backend is not None and self.backend.alive():
+            return
+        if self.backend is not None:
+            self.backend.stop()
+            self.pool._record_restart()
+        self.backend = self._new_backend()
+        try:
+            self.backend.start()
+        except Exception:
+            self.backend.stop()
+            self.backend = None
+            raise
+
+    def _warm(self):
+        try:
+            self._ensure_backend()
+        except Exception:
+            # Retried (and reported) when the next job arrives
+            pass
+
+    def run(self):
+        while True:
+            self._warm()
+            job = self.pool._queue.get()
+            if job is None:
+                break
+            started = time.monotonic()
+            try:
+                self._ensure_backend()
+                job.errors = self.backend.convert_many(job.pairs, job.timeout, job.pdfa)
+            except Exception as e:
+                job.error = e
+                # A hung or crashed office is not reused for the next job
+                if self.backend is not None:
+                    self.backend.stop()
+                    self.backend = None
+                    self.pool._record_restart()
+            finally:
+                self.pool._record(job, started)
+                job.done.set()
+                self.pool._queue.task_done()
+        if self.backend is not None:
+            self.backend.stop()
+        shutil.rmtree(self.profile_dir, ignore_errors=True)
+
+
+class ConversionPool:
+    """Fixed-size pool of warm LibreOffice workers fed from a shared queue."""
+
+    def __init__(self, workers=DEFAULT_WORKERS, timeout=DEFAULT_TIMEOUT, soffice=None, use_uno=None):
+        self.soffice = soffice or find_soffice()
+        if self.soffice is None:
+            raise ConversionError("LibreOffice (soffice) was not found on PATH")
+        self.use_uno = uno_available() if use_uno is None else use_uno
+        self.timeout = timeout
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._latencies = collections.deque(maxlen=500)
+        self._counters = {"conversions": 0, "failures": 0, "timeouts": 0, "restarts": 0}
+        self._workers = [_Worker(self, i) for i in range(max(1, workers))]
+        for worker in self._workers:
+            worker.start()
+
+    def convert(self, doc_path, pdf_path, timeout=None, pdfa=False):
+        """Convert ``doc_path`` to ``pdf_path``, blocking until a worker has finished."""
+        error = self.convert_many([(doc_path, pdf_path)], timeout, pdfa).get(os.path.abspath(doc_path))
+        if error is not None:
+            raise error
+
+    def convert_many(self, pairs, timeout=None, pdfa=False):
+        """
+        Convert a list of (doc_path, pdf_path) pairs, spread over the workers in chunks.
+
+        Returns {doc_path: exception} for the documents that failed; an empty dict means
+        every PDF was written.
+        """
+        pairs = [(os.path.abspath(doc), os.path.abspath(pdf)) for doc, pdf in pairs]
+        chunk = max(1, -(-len(pairs) // len(self._workers)))
+        jobs = [_Job(pairs[i:i + chunk], timeout or self.timeout, pdfa) for i in range(0, len(pairs), chunk)]
+        for job in jobs:
+            self._queue.put(job)
+        errors = {}
+        for job in jobs:
+            job.done.wait()
+            if job.error is not None:
+                errors.update((doc, job.error) for doc, _ in job.pairs)
+            errors.update(job.errors)
+        return errors
+
+    def _record(self, job, started):
+        finished = time.monotonic()
+        with self._lock:
+            self._counters["conversions"] += len(job.pairs)
+            if job.error is not None:
+                self._counters["failures"] += len(job.pairs)
+                if isinstance(job.error, ConversionTimeout):
+                    self._counters["timeouts"] += 1
+            else:
+                self._counters["failures"] += len(job.errors)
+                # Latency is tracked per document so batches do not skew it
+                per_document = (finished - started) / len(job.pairs)
+                self._latencies.append((per_document, per_document + started - job.submitted))
+
+    def _record_restart(self):
+        with self._lock:
+            self._counters["restarts"] += 1
+
+    def metrics(self):
+        """Queue depth, worker health, counters and recent per-conversion latencies (seconds)."""
+        with self._lock:
+            latencies = sorted(convert for convert, _ in self._latencies)
+            waits = sorted(total - convert for convert, total in self._latencies)
+            counters = dict(self._counters)
+
+        def percentile(values, pct):
+            if not values:
+                return None
+            return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+        return {
+            "backend": "uno" if self.use_uno else "subprocess",
+            "workers": len(self._workers),
+            "workers_alive": sum(w.is_alive() for w in self._workers),
+            "queue_depth": self._queue.qsize(),
+            **counters,
+            "latency_p50": percentile(latencies, 50),
+            "latency_p95": percentile(latencies, 95),
+            "latency_max": latencies[-1] if latencies else None,
+            "queue_wait_p50": percentile(waits, 50),
+        }
+
+    def shutdown(self):
+        for _ in self._workers:
+            self._queue.put(None)
+        for worker in self._workers:
+            worker.join()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Return the process-wide conversion pool, starting it on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConversionPool()
+        return _pool
+
+
+def pool_metrics():
+    """Metrics of the conversion pool, or None if it has not been started."""
+    pool = _pool
+    return pool.metrics() if pool is not None else None
+
+
+class WordBackend:
+    """Microsoft Word over COM (Windows only)."""
+
+    name = "word"
+    supports_pdfa = True
+
+    def convert(self, doc_path, pdf_path, pdfa=False):
+        try:
+            import comtypes.client
+            import pythoncom
+            pythoncom.CoInitialize()
+            word = comtypes.client.CreateObject("Word.Application")
+            word.Visible = False
+            doc = word.Documents.Open(doc_path)
+            if pdfa:
+                # PDF/A-1b: the only PDF/A option of Word's export
+                doc.ExportAsFixedFormat(pdf_path, 17, UseISO19005_1=True)
+            else:
+                doc.SaveAs(pdf_path, FileFormat=17)
+            doc.Close()
+            word.Quit()
+        except Exception as e:
+            raise Exception(f"Error using COM on Windows: {e}")
+
+    def convert_many(self, pairs, pdfa=False):
+        errors = {}
+        for doc_path, pdf_path in pairs:
+            try:
+                self.convert(os.path.abspath(doc_path), os.path.abspath(pdf_path), pdfa)
+            except Exception as e:
+                errors[os.path.abspath(doc_path)] = e
+        return errors
+
+    def convert_bytes(self, data, name, pdfa=False):
+        return _convert_bytes_via_files(self, data, name, pdfa)
+
+    def warm(self):
+        pass
+
+
+class LibreOfficeBackend:
+    """The warm LibreOffice pool above."""
+
+    name = "libreoffice"
+    supports_pdfa = True
+
+    def convert(self, doc_path, pdf_path, pdfa=False):
+        try:
+            get_pool().convert(doc_path, pdf_path, pdfa=pdfa)
+        except ConversionError as e:
+            raise Exception(f"Error using LibreOffice: {e}")
+
+    def convert_many(self, pairs, pdfa=False):
+        return get_pool().convert_many(pairs, pdfa=pdfa)
+
+    def convert_bytes(self, data, name, pdfa=False):
+        return _convert_bytes_via_files(self, data, name, pdfa)
+
+    def warm(self):
+        """Start the soffice workers now instead of on the first conversion."""
+        if find_soffice():
+            get_pool()
+
+
+class NativeBackend:
+    """Pure-Python renderer (native_pdf.py); no office suite needed."""
+
+    name = "native"
+    # PDF/A requires embedded fonts; the native renderer uses the standard 14
+    supports_pdfa = False
+
+    def convert(self, doc_path, pdf_path, pdfa=False):
+        with open(doc_path, "rb") as f:
+            data = f.read()
+        pdf = self.convert_bytes(data, doc_path, pdfa)
+        with open(pdf_path, "wb") as f:
+            f.write(pdf)
+
+    def convert_many(self, pairs, pdfa=False):
+        errors = {}
+        for doc_path, pdf_path in pairs:
+            try:
+                self.convert(doc_path, pdf_path, pdfa)
+            except Exception as e:
+                errors[os.path.abspath(doc_path)] = e
+        return errors
+
+    def convert_bytes(self, data, name, pdfa=False):
+        if pdfa:
+            raise ConversionError("The native backend cannot produce PDF/A; use LibreOffice or Word")
+        import native_pdf
+        try:
+            return native_pdf.render_docx(data)
+        except native_pdf.UnsupportedTextError as e:
+            # e.g. Arabic text: LibreOffice has the fonts, the standard 14 do not
+            if find_soffice():
+                return LibreOfficeBackend().convert_bytes(data, name, pdfa)
+            raise ConversionError(f"Native rendering of {os.path.basename(name)} failed: {e}; "
+                                  "install LibreOffice or use another PDF_BACKEND") from e
+        except Exception as e:
+            raise ConversionError(f"Native rendering of {os.path.basename(name)} failed: {e}") from e
+
+    def warm(self):
+        import native_pdf  # noqa: F401
+
+
+def _convert_bytes_via_files(backend, data, name, pdfa=False):
+    with tempfile.TemporaryDirectory(prefix="pdf-job-") as work_dir:
+        doc_path = os.path.join(work_dir, os.path.basename(name))
+        pdf_path = os.path.splitext(doc_path)[0] + ".pdf"
+        with open(doc_path, "wb") as f:
+            f.write(data)
+        backend.convert(doc_path, pdf_path, pdfa)
+        with open(pdf_path, "rb") as f:
+            return f.read()
+
+
+# Backends by name. A backend provides convert(doc_path, pdf_path, pdfa=False),
+# convert_many(pairs, pdfa=False) -> {doc_path: exception},
+# convert_bytes(data, name, pdfa=False) -> bytes and warm() to do its start-up work
+# ahead of the first conversion. ``pdfa=True`` asks for PDF/A output, which only
+# backends with ``supports_pdfa = True`` can write.
+BACKENDS = {
+    WordBackend.name: WordBackend,
+    LibreOfficeBackend.name: LibreOfficeBackend,
+    NativeBackend.name: NativeBackend,
+}
+
+
+def register_backend(name, backend_class):
+    """Make ``backend_class`` selectable as ``PDF_BACKEND=name``."""
+    BACKENDS[name] = backend_class
+
+
+def get_backend(name=None):
+    """
+    Return a backend instance. ``name`` defaults to ``PDF_BACKEND``, or to Word on
+    Windows and LibreOffice elsewhere when that is not set.
+    """
+    name = name or PDF_BACKEND or ("word" if platform.system() == "Windows" else "libreoffice")
+    try:
+        return BACKENDS[name]()
+    except KeyError:
+        raise ValueError(f"Unknown PDF backend {name!r}; expected one of {', '.join(BACKENDS)}")
+
+
+def supports_pdfa(backend=None):
+    """Whether ``backend`` (a name, default ``PDF_BACKEND``) can write PDF/A."""
+    return getattr(get_backend(backend), "supports_pdfa", True)
+
+
+def convert_to_pdf(doc_path, pdf_path, backend=None, pdfa=False):
+    doc_path = os.path.abspath(doc_path)
+    pdf_path = os.path.abspath(pdf_path)
+
+    if not os.path.exists(doc_path):
+        raise FileNotFoundError(f"Word document not found at {doc_path}")
+
+    get_backend(backend).convert(doc_path, pdf_path, pdfa)
+
+
+def convert_many_to_pdf(pairs, backend=None, pdfa=False):
+    """
+    Convert several (doc_path, pdf_path) pairs in as few LibreOffice calls as possible.
+
+    Returns {doc_path: exception} for failed documents instead of raising, so one bad
+    document does not abort a batch.
+    """
+    return get_backend(backend).convert_many(pairs, pdfa)
+
+
+def docx_bytes_to_pdf(data, name="document.docx", backend=None, pdfa=False):
+    """Convert .docx bytes to PDF bytes (through a private temporary directory where needed)."""
+    return get_backend(backend).convert_bytes(data, name, pdfa)
@@ -0,0 +1,128 @@
+"""
+Single-pass placeholder substitution.
+
+The previous ``replace_placeholders`` joined every paragraph's runs once per key
+(O(keys x paragraphs x runs)) and collapsed all runs into the first one, losing their
+formatting. ``fill_placeholders`` instead compiles all keys into one alternation,
+tokenises each paragraph once and only rewrites the text nodes a match actually spans:
+the replacement value takes the formatting of the run the placeholder starts in, and
+the text around the placeholder stays in its original runs.
+
+Paragraphs are handled as lists of ``w:t`` elements (see template_cache.text_nodes),
+so headers, footers, footnotes, text boxes and content controls are filled the same
+way as the body.
+"""
+import functools
+import re
+
+from template_cache import PLACEHOLDER_PATTERN, W, iter_paragraphs, text_nodes
+
+XML_SPACE = "{http://www.w3.org/XML/1998/namespace}space"
+# Characters of a value that Word keeps as elements rather than text
+SPECIAL = re.compile(r"([\t\n])")
+SPECIAL_TAGS = {"\t": W + "tab", "\n": W + "br"}
+
+
+@functools.lru_cache(maxsize=64)
+def _compile(keys):
+    # Longest first so that a key is never shadowed by one of its prefixes
+    return re.compile("|".join(re.escape(key) for key in sorted(keys, key=len, reverse=True)))
+
+
+def compile_placeholders(placeholders):
+    """Return the compiled pattern matching every key of ``placeholders``."""
+    return _compile(tuple(sorted(placeholders)))
+
+
+def _set_text(t, text):
+    """Set the text of the w:t element ``t``; tabs and line breaks become w:tab/w:br siblings."""
+    pieces = SPECIAL.split(text)
+    t.text = pieces[0]
+    if t.text != t.text.strip():
+        t.set(XML_SPACE, "preserve")
+    previous = t
+    for piece in pieces[1:]:
+        if piece in SPECIAL_TAGS:
+            element = t.makeelement(SPECIAL_TAGS[piece], {})
+        elif piece:
+            element = t.makeelement(t.tag, {XML_SPACE: "preserve"})
+            element.text = piece
+        else:
+            continue
+        previous.addnext(element)
+        previous = element
+
+
+def fill_paragraph(nodes, placeholders, pattern):
+    """
+    Substitute every placeholder in one paragraph, given as its list of w:t elements.
+    Returns the number of replacements.
+    """
+    if not nodes:
+        return 0
+    texts = [t.text or "" for t in nodes]
+    full_text = "".join(texts)
+    matches = list(pattern.finditer(full_text))
+    if not matches:
+        return 0
+
+    m = 0
+    start = 0
+    for t, text in zip(nodes, texts):
+        end = start + len(text)
+        # Skip nodes that no match touches
+        while m < len(matches) and matches[m].end() <= start:
+            m += 1
+        if m == len(matches) or matches[m].start() >= end:
+            start = end
+            continue
+
+        pieces = []
+        position = start
+        k = m
+        while k < len(matches) and matches[k].start() < end:
+            match = matches[k]
+            if match.start() >= position:
+                pieces.append(full_text[position:match.start()])
+                # The value lives in the node where its placeholder begins
+                pieces.append(str(placeholders[match.group()]))
+            position = max(position, min(match.end(), end))
+            k += 1
+        pieces.append(full_text[position:end])
+        _set_text(t, "".join(pieces))
+        start = end
+    return len(matches)
+
+
+def fill_placeholders(doc, placeholders, paragraphs=None):
+    """
+    Replace ``placeholders`` (a {"<<Key>>": value} dict) in ``doc`` in a single pass.
+
+    ``paragraphs`` restricts the work to the given paragraphs (lists of w:t elements),
+    e.g. the ones indexed by CompiledTemplate.placeholder_paragraphs; by default every
+    paragraph of every text part is visited.
+    """
+    if not placeholders:
+        return doc
+    pattern = compile_placeholders(placeholders)
+    if paragraphs is None:
+        # Collected first: filling may add elements to the tree being walked
+        paragraphs = [text_nodes(p) for _, p in iter_paragraphs(doc)]
+    for para in paragraphs:
+        fill_paragraph(para, placeholders, pattern)
+    return doc
+
+
+def unfilled_placeholders(doc):
+    """
+    ``<<...>>`` tokens still present in ``doc`` as {token: [part names]}, e.g. after
+    filling a document whose template has tokens the schema does not know about.
+    """
+    found = {}
+    for partname, p in iter_paragraphs(doc):
+        text = "".join(t.text or "" for t in text_nodes(p))
+        for token in PLACEHOLDER_PATTERN.findall(text):
+            parts = found.setdefault(token, [])
+            if partname not in parts:
+                parts.append(partname)
+    return found
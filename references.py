@@ -0,0 +1,31 @@
+from datetime import datetime
+
+from serial_allocator import get_allocator
+
+def get_serial_number():
+    # Atomic across threads and processes; see serial_allocator.py
+    return get_allocator().next()
+
+def reserve_serial_numbers(count):
+    """Reserve ``count`` consecutive serial numbers in one step (for batch jobs)."""
+    return get_allocator().reserve(count)
+
+def generate_reference_number(company_name="BKR", serial_number=None):
+    """
+    Generate the full reference number in the format: BKRMM-YYYY-CR<serial>.
+    """
+    current_month = datetime.now().strftime("%m")
+    current_year = datetime.now().strftime("%Y")
+    if serial_number is None:
+        serial_number = get_serial_number()
+    return f"{company_name}{current_month}-{current_year}-CR{serial_number}"
+
+def generate_unique_reference():
+    """
+    Generate a unique reference number based on the current date and time in the format:
+    DDMMYYYYHHMMSS. Further numbers issued in the same second (by any process sharing
+    the serial allocator) get a suffix: DDMMYYYYHHMMSS-2, -3...
+    """
+    reference = datetime.now().strftime("%d%m%Y%H%M%S")
+    count = get_allocator().sequence(f"invoice:{reference}")
+    return reference if count == 1 else f"{reference}-{count}"
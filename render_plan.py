@@ -0,0 +1,269 @@
+"""
+Render plans: several output variants of one generated document in a single pass.
+
+A plan is a list of ``Variant``s, written as strings such as ``"docx"``, ``"pdf"``,
+``"pdfa"`` (archival PDF/A), ``"pdf+signature"`` or ``"docx+draft"``. The template is
+filled and the reference number issued once; each distinct DOCX (plain, signed,
+watermarked...) is saved once from the same filled Document and shared by every
+variant that needs it, and all PDFs of one kind go to the backend in a single
+``convert_many`` call (one batch for the LibreOffice pool instead of one per file).
+
+Signatures and watermarks are applied to the filled Document, saved and removed
+again, so the template is never re-parsed or copied per variant.
+"""
+import contextlib
+import hashlib
+import io
+import os
+import tempfile
+from dataclasses import dataclass
+from xml.sax.saxutils import quoteattr
+
+from pdf_converter import ConversionError, convert_many_to_pdf, docx_bytes_to_pdf, supports_pdfa
+
+FORMATS = ("docx", "pdf", "pdfa")
+DEFAULT_PLAN = ("docx", "pdf")
+DRAFT = "DRAFT"
+# Inches; python-docx is imported when a signature is first added, not with this module
+SIGNATURE_WIDTH = 1.75
+
+XML_NAMESPACES = (
+    'xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main" '
+    'xmlns:v="urn:schemas-microsoft-com:vml" xmlns:o="urn:schemas-microsoft-com:office:office"'
+)
+# Word's own "PowerPlusWaterMarkObject": WordArt text centred on the page behind the text
+WATERMARK_XML = (
+    f'<w:r {XML_NAMESPACES}>'
+    '<w:rPr><w:noProof/></w:rPr>'
+    '<w:pict>'
+    '<v:shapetype id="_x0000_t136" coordsize="21600,21600" o:spt="136" adj="10800" '
+    'path="m@7,l@8,m@5,21600l@6,21600e">'
+    '<v:formulas>'
+    '<v:f eqn="sum #0 0 10800"/><v:f eqn="prod #0 2 1"/><v:f eqn="sum 21600 0 @1"/>'
+    '<v:f eqn="sum 0 0 @2"/><v:f eqn="sum 21600 0 @3"/><v:f eqn="if @0 @3 0"/>'
+    '<v:f eqn="if @0 21600 @1"/><v:f eqn="if @0 0 @2"/><v:f eqn="if @0 @4 21600"/>'
+    '<v:f eqn="mid @5 @6"/><v:f eqn="mid @8 @5"/><v:f eqn="mid @7 @8"/>'
+    '<v:f eqn="mid @6 @7"/><v:f eqn="sum @6 0 @5"/>'
+    '</v:formulas>'
+    '<v:path textpathok="t" o:connecttype="custom" o:connectlocs="@9,0;@10,10800;@11,21600;@12,10800" '
+    'o:connectangles="270,180,90,0"/>'
+    '<v:textpath on="t" fitshape="t"/>'
+    '<o:lock v:ext="edit" text="t" shapetype="t"/>'
+    '</v:shapetype>'
+    '<v:shape id="PowerPlusWaterMarkObject1" o:spid="_x0000_s2049" type="#_x0000_t136" '
+    'style="position:absolute;margin-left:0;margin-top:0;width:468pt;height:156pt;rotation:315;'
+    'z-index:-251657216;mso-position-horizontal:center;mso-position-horizontal-relative:margin;'
+    'mso-position-vertical:center;mso-position-vertical-relative:margin" '
+    'o:allowincell="f" fillcolor="silver" stroked="f">'
+    '<v:fill opacity=".5"/>'
+    '<v:textpath style="font-family:&quot;Calibri&quot;;font-size:1pt" string={text}/>'
+    '</v:shape>'
+    '</w:pict>'
+    '</w:r>'
+)
+
+
+@dataclass(frozen=True)
+class Variant:
+    format: str
+    signature: bool = False
+    watermark: str = None
+
+    @classmethod
+    def parse(cls, spec):
+        """'pdfa+signature+draft' -> Variant("pdfa", signature=True, watermark="DRAFT")."""
+        if isinstance(spec, cls):
+            return spec
+        fmt, *options = [part.strip().lower() for part in str(spec).split("+")]
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown output format {fmt!r}; expected one of {', '.join(FORMATS)}")
+        unknown = set(options) - {"signature", "draft"}
+        if unknown:
+            raise ValueError(f"Unknown output option(s) {sorted(unknown)} in {spec!r}; expected signature or draft")
+        return cls(fmt, "signature" in options, DRAFT if "draft" in options else None)
+
+    @property
+    def name(self):
+        return "+".join([self.format] + ["signature"] * self.signature + ["draft"] * bool(self.watermark))
+
+    @property
+    def extension(self):
+        return ".docx" if self.format == "docx" else ".pdf"
+
+    def filename(self, stem):
+        """'Invoice ACME (PDF-A, signed, DRAFT).pdf'; plain docx/pdf keep the historical names."""
+        notes = ["PDF-A"] * (self.format == "pdfa") + ["signed"] * self.signature + [self.watermark] * bool(self.watermark)
+        return f"{stem} ({', '.join(notes)}){self.extension}" if notes else f"{stem}{self.extension}"
+
+    def describe(self):
+        """Label for download buttons: 'PDF/A, signed'."""
+        kind = {"docx": "Word", "pdf": "PDF", "pdfa": "PDF/A"}[self.format]
+        return ", ".join([kind] + ["signed"] * self.signature + [self.watermark] * bool(self.watermark))
+
+
+def parse_plan(plan=None):
+    """A list of Variants from strings/Variants (or a comma-separated string); duplicates dropped."""
+    if plan is None:
+        plan = DEFAULT_PLAN
+    if isinstance(plan, str):
+        plan = [part for part in plan.split(",") if part.strip()]
+    variants = list(dict.fromkeys(Variant.parse(spec) for spec in plan))
+    if not variants:
+        raise ValueError("The render plan has no outputs")
+    return variants
+
+
+def check_plan(variants, signature=None, backend=None):
+    """
+    Raise ValueError if signed variants are requested without a signature image, or
+    PDF/A from a PDF backend that cannot write it.
+    """
+    if signature is None and any(variant.signature for variant in variants):
+        raise ValueError("A signed output was requested without a signature image")
+    if any(variant.format == "pdfa" for variant in variants) and not supports_pdfa(backend):
+        raise ValueError("PDF/A output is not available with this PDF backend; use LibreOffice or Word")
+
+
+def plan_key(variants, signature=None):
+    """
+    Identifies a plan and signature image for the result cache; None for the default
+    plan, so cache keys of plain docx+pdf results stay unchanged.
+    """
+    names = [variant.name for variant in variants]
+    if names == list(DEFAULT_PLAN) and signature is None:
+        return None
+    digest = hashlib.sha256(signature).hexdigest() if signature is not None else None
+    return {"variants": names, "signature": digest}
+
+
+def add_signature(doc, image, width=SIGNATURE_WIDTH):
+    """Append ``image`` (PNG/JPEG bytes, ``width`` inches wide) at the end of the body; returns an undo function."""
+    from docx.shared import Inches
+
+    paragraph = doc.add_paragraph()
+    shape = paragraph.add_run().add_picture(io.BytesIO(image), width=Inches(width))
+    rid = shape._inline.graphic.graphicData.pic.blipFill.blip.embed
+
+    def undo():
+        paragraph._p.getparent().remove(paragraph._p)
+        # The image part goes with its last relationship
+        doc.part.drop_rel(rid)
+
+    return undo
+
+
+def add_watermark(doc, text=DRAFT):
+    """Put a diagonal text watermark in every section's header; returns an undo function."""
+    from docx.oxml import parse_xml
+
+    added, created = [], []
+    for index, section in enumerate(doc.sections):
+        header = section.header
+        if header.is_linked_to_previous:
+            if index > 0:
+                # Shows the previous section's header, which is watermarked already
+                continue
+            header.is_linked_to_previous = False
+            created.append(header)
+        paragraphs = header.paragraphs or [header.add_paragraph()]
+        run = parse_xml(WATERMARK_XML.format(text=quoteattr(text)))
+        paragraphs[0]._p.append(run)
+        added.append(run)
+
+    def undo():
+        for run in added:
+            run.getparent().remove(run)
+        for header in created:
+            header.is_linked_to_previous = True
+
+    return undo
+
+
+def _save(doc):
+    buffer = io.BytesIO()
+    doc.save(buffer)
+    return buffer.getvalue()
+
+
+def render_variants(doc, variants, stem, signature=None, trace=None, progress=None, backend=None):
+    """
+    Render ``variants`` of the filled Document ``doc``. Returns {file name: bytes}.
+
+    ``signature`` is the image for variants with ``signature=True``. ``trace`` (a
+    metrics.Trace) gets a "save" and a "convert" stage and the output sizes.
+    """
+    progress = progress or (lambda fraction, stage: None)
+    check_plan(variants, signature, backend)
+    stage = trace.stage if trace is not None else (lambda name: contextlib.nullcontext())
+
+    # One DOCX per distinct (signature, watermark) combination
+    docx_files = {}
+    progress(0.4, "Saving document")
+    with stage("save"):
+        for key in dict.fromkeys((variant.signature, variant.watermark) for variant in variants):
+            signed, watermark = key
+            undo = []
+            if signed:
+                undo.append(add_signature(doc, signature))
+            if watermark:
+                undo.append(add_watermark(doc, watermark))
+            try:
+                docx_files[key] = _save(doc)
+            finally:
+                for step in reversed(undo):
+                    step()
+
+    files = {}
+    for variant in variants:
+        if variant.format == "docx":
+            files[variant.filename(stem)] = docx_files[(variant.signature, variant.watermark)]
+    if any(variant.format != "docx" for variant in variants):
+        progress(0.5, "Converting to PDF")
+    with stage("convert"):
+        pdfs = _convert(variants, docx_files, stem, backend)
+    for variant in variants:
+        if variant.format != "docx":
+            files[variant.filename(stem)] = pdfs[variant]
+    if trace is not None:
+        for variant in variants:
+            trace.size(variant.format, files[variant.filename(stem)])
+    # Files in the order the plan listed them
+    return {variant.filename(stem): files[variant.filename(stem)] for variant in variants}
+
+
+def _convert(variants, docx_files, stem, backend):
+    """PDFs for the pdf/pdfa variants: one backend batch per PDF kind."""
+    wanted = [variant for variant in variants if variant.format != "docx"]
+    if not wanted:
+        return {}
+    if len(wanted) == 1:
+        # A single PDF needs no batch (and the native backend no files)
+        variant = wanted[0]
+        data = docx_files[(variant.signature, variant.watermark)]
+        return {variant: docx_bytes_to_pdf(data, f"{stem}.docx", backend, variant.format == "pdfa")}
+    pdfs = {}
+    with tempfile.TemporaryDirectory(prefix="render-plan-") as work_dir:
+        doc_paths = {}
+        for index, key in enumerate(dict.fromkeys((v.signature, v.watermark) for v in wanted)):
+            doc_paths[key] = os.path.join(work_dir, f"variant{index}.docx")
+            with open(doc_paths[key], "wb") as f:
+                f.write(docx_files[key])
+        for pdfa in (False, True):
+            group = [variant for variant in wanted if (variant.format == "pdfa") == pdfa]
+            if not group:
+                continue
+            out_dir = os.path.join(work_dir, "pdfa" if pdfa else "pdf")
+            os.makedirs(out_dir, exist_ok=True)
+            pairs = {}
+            for variant in group:
+                doc_path = doc_paths[(variant.signature, variant.watermark)]
+                pairs[variant] = (doc_path, os.path.join(out_dir, os.path.splitext(os.path.basename(doc_path))[0] + ".pdf"))
+            errors = convert_many_to_pdf(list(pairs.values()), backend, pdfa)
+            for variant, (doc_path, pdf_path) in pairs.items():
+                error = errors.get(os.path.abspath(doc_path))
+                if error is not None:
+                    raise error if isinstance(error, ConversionError) else ConversionError(str(error))
+                with open(pdf_path, "rb") as f:
+                    pdfs[variant] = f.read()
+    return pdfs
+
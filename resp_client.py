@@ -0,0 +1,149 @@
+"""
+Minimal client for the Redis protocol (RESP2).
+
+Only what the shared-state backends need: one blocking connection per thread, every
+command sent as an array of bulk strings and the reply parsed into Python values
+(bytes, int, list or None). Works with Redis, Valkey, KeyDB and the stand-in server
+in ``benchmarks/resp_server.py``; no third-party package is required.
+
+    client = RespClient("redis://:secret@cache:6379/0")
+    client.execute("INCRBY", "serial:reference", 10)
+"""
+import os
+import socket
+import threading
+import urllib.parse
+
+REDIS_URL = os.environ.get("REDIS_URL", "redis://localhost:6379/0")
+SOCKET_TIMEOUT = float(os.environ.get("REDIS_TIMEOUT", 30))
+
+
+class RespError(Exception):
+    """An error reply from the server."""
+
+
+class _Connection:
+    def __init__(self, host, port, timeout):
+        self.sock = socket.create_connection((host, port), timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.file = self.sock.makefile("rb")
+
+    def send(self, args):
+        parts = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            if isinstance(arg, str):
+                arg = arg.encode("utf-8")
+            elif not isinstance(arg, (bytes, bytearray)):
+                arg = str(arg).encode("ascii")
+            parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+        self.sock.sendall(b"".join(parts))
+
+    def read(self):
+        line = self.file.readline()
+        if not line.endswith(b"\r\n"):
+            raise ConnectionError("Connection closed by the server")
+        kind, payload = line[:1], line[1:-2]
+        if kind == b"+":
+            return payload
+        if kind == b"-":
+            return RespError(payload.decode("utf-8", "replace"))
+        if kind == b":":
+            return int(payload)
+        if kind == b"$":
+            length = int(payload)
+            if length < 0:
+                return None
+            data = self.file.read(length + 2)
+            return data[:-2]
+        if kind == b"*":
+            length = int(payload)
+            return None if length < 0 else [self.read() for _ in range(length)]
+        raise ConnectionError(f"Unexpected reply {line[:20]!r}")
+
+    def close(self):
+        try:
+            self.file.close()
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class RespClient:
+    """Thread-safe client: each thread (and each forked process) gets its own connection."""
+
+    def __init__(self, url=REDIS_URL, timeout=SOCKET_TIMEOUT):
+        parsed = urllib.parse.urlparse(url)
+        if parsed.scheme != "redis":
+            raise ValueError(f"Unsupported URL {url!r}; expected redis://[:password@]host[:port][/db]")
+        self.url = url
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = urllib.parse.unquote(parsed.password) if parsed.password else None
+        self.username = urllib.parse.unquote(parsed.username) if parsed.username else None
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        # A connection must not be shared with a forked child
+        if conn is None or self._local.pid != os.getpid():
+            conn = _Connection(self.host, self.port, self.timeout)
+            setup = []
+            if self.password is not None:
+                setup.append(("AUTH", self.username, self.password) if self.username else ("AUTH", self.password))
+            if self.db:
+                setup.append(("SELECT", self.db))
+            for command in setup:
+                conn.send(command)
+                reply = conn.read()
+                if isinstance(reply, RespError):
+                    conn.close()
+                    raise reply
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def execute(self, *args):
+        """Send one command and return its reply; raises RespError for an error reply."""
+        conn = self._connection()
+        try:
+            conn.send(args)
+            reply = conn.read()
+        except OSError:
+            # Drop the broken connection; the next call reconnects
+            conn.close()
+            self._local.conn = None
+            raise
+        if isinstance(reply, RespError):
+            raise reply
+        return reply
+
+    def pipeline(self, *commands):
+        """Send several commands in one round trip and return their replies in order."""
+        conn = self._connection()
+        try:
+            for command in commands:
+                conn.send(command)
+            replies = [conn.read() for _ in commands]
+        except OSError:
+            conn.close()
+            self._local.conn = None
+            raise
+        for reply in replies:
+            if isinstance(reply, RespError):
+                raise reply
+        return replies
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_resp_client():
+    """Return the process-wide RespClient for REDIS_URL."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = RespClient()
+        return _client
@@ -0,0 +1,173 @@
+"""
+Content-addressed cache of generated documents.
+
+Pressing Generate again with unchanged fields used to repeat the template fill and the
+LibreOffice conversion. Results are now stored under a key derived from the template's
+content hash and the filled placeholder values, so an identical request is answered
+with the stored DOCX/PDF bytes.
+
+Reference numbers are the one part of a document that is not a function of its input.
+The key is computed *without* the template's reference placeholder, and each entry
+keeps the reference it was issued with: a hit is a re-download of a document that was
+already issued (same reference), never a new issue. Callers that need a new number
+(batch jobs, "issue a new reference" in the UI) bypass the lookup with ``fresh=True``
+in documents.generate_outputs.
+
+The memory tier is an LRU bounded by ``RESULT_CACHE_BYTES``. Setting
+``RESULT_CACHE_DIR`` adds a disk tier bounded by ``RESULT_CACHE_DISK_BYTES`` that
+survives restarts.
+"""
+import collections
+import hashlib
+import io
+import json
+import os
+import tempfile
+import threading
+import zipfile
+
+RESULT_CACHE_BYTES = int(os.environ.get("RESULT_CACHE_BYTES", 128 * 1024 * 1024))
+RESULT_CACHE_DIR = os.environ.get("RESULT_CACHE_DIR")
+RESULT_CACHE_DISK_BYTES = int(os.environ.get("RESULT_CACHE_DISK_BYTES", 1024 * 1024 * 1024))
+
+
+def cache_key(template_digest, placeholders, exclude=(), variant=None):
+    """
+    Key for a template (by content hash) filled with ``placeholders`` minus ``exclude``;
+    ``variant`` (JSON-serialisable) distinguishes other outputs of the same fill.
+    """
+    content = {key: str(value) for key, value in placeholders.items() if key not in exclude}
+    parts = [template_digest, content] if variant is None else [template_digest, content, variant]
+    payload = json.dumps(parts, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _result_size(result):
+    return sum(len(data) for data in result["files"].values())
+
+
+class ResultCache:
+    """Two-tier (memory LRU + optional directory) cache of {"reference", "files"} results."""
+
+    def __init__(self, max_bytes=RESULT_CACHE_BYTES, disk_dir=RESULT_CACHE_DIR, disk_max_bytes=RESULT_CACHE_DISK_BYTES):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.size = 0
+        self.counters = {"hits": 0, "memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0}
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def get(self, key):
+        with self._lock:
+            result = self._entries.get(key)
+            if result is not None:
+                self._entries.move_to_end(key)
+                self.counters["hits"] += 1
+                self.counters["memory_hits"] += 1
+                return result
+        result = self._disk_get(key)
+        with self._lock:
+            if result is None:
+                self.counters["misses"] += 1
+                return None
+            self.counters["hits"] += 1
+            self.counters["disk_hits"] += 1
+            self._memory_put(key, result)
+            return result
+
+    def put(self, key, result):
+        with self._lock:
+            self.counters["stores"] += 1
+            self._memory_put(key, result)
+        self._disk_put(key, result)
+
+    def _memory_put(self, key, result):
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self.size -= _result_size(previous)
+        self._entries[key] = result
+        self.size += _result_size(result)
+        while self.size > self.max_bytes and len(self._entries) > 1:
+            _, evicted = self._entries.popitem(last=False)
+            self.size -= _result_size(evicted)
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.zip")
+
+    def _disk_get(self, key):
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with zipfile.ZipFile(path) as archive:
+                meta = json.loads(archive.read("meta.json"))
+                files = {name: archive.read(f"files/{name}") for name in meta["files"]}
+            os.utime(path)
+        except (FileNotFoundError, KeyError, zipfile.BadZipFile):
+            return None
+        # Entries written before unfilled placeholders were reported have none recorded
+        return {"reference": meta["reference"], "files": files, "unfilled": meta.get("unfilled", [])}
+
+    def _disk_put(self, key, result):
+        if not self.disk_dir:
+            return
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_STORED) as archive:
+            meta = {"reference": result["reference"], "files": list(result["files"]),
+                    "unfilled": result.get("unfilled", [])}
+            archive.writestr("meta.json", json.dumps(meta))
+            for name, data in result["files"].items():
+                archive.writestr(f"files/{name}", data)
+        # Write then rename so readers never see a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=self.disk_dir, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(buffer.getvalue())
+        os.replace(tmp_path, self._disk_path(key))
+        self._disk_prune()
+
+    def _disk_prune(self):
+        entries = []
+        for name in os.listdir(self.disk_dir):
+            if name.endswith(".zip"):
+                try:
+                    stat = os.stat(os.path.join(self.disk_dir, name))
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.disk_max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.disk_dir, name))
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def stats(self):
+        with self._lock:
+            lookups = self.counters["hits"] + self.counters["misses"]
+            return {
+                **self.counters,
+                "hit_rate": self.counters["hits"] / lookups if lookups else None,
+                "entries": len(self._entries),
+                "bytes": self.size,
+                "max_bytes": self.max_bytes,
+                "disk": bool(self.disk_dir),
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_result_cache():
+    """Return the process-wide ResultCache."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResultCache()
+        return _cache
@@ -0,0 +1,197 @@
+"""
+Concurrency-safe serial number allocator backed by SQLite.
+
+``get_serial_number`` used to read ``serial_data.txt``, add one and rewrite the file
+with no locking, so two simultaneous clicks could be handed the same ``CR<serial>``.
+Allocations now run as short ``BEGIN IMMEDIATE`` transactions on a WAL-mode database
+with ``synchronous=FULL``: they are atomic across threads and processes and survive a
+crash once the call has returned.
+
+``reserve(count)`` hands out a contiguous block in one transaction, which is what batch
+jobs use. Setting ``SERIAL_BLOCK_SIZE`` above 1 makes each process reserve that many
+numbers at a time and serve them from memory, so most allocations never touch the
+database; numbers still unused when a process exits are skipped, never reissued.
+
+On first use the database is seeded from the legacy ``serial_data.txt`` (``base,counter``).
+
+``sequence(key)`` counts uses of an arbitrary key (1 for the first) in the same
+store; time-based invoice numbers use it to tell apart numbers issued in the same
+second by different threads, processes or replicas. Keys are forgotten after a day.
+
+With ``STATE_BACKEND=redis`` (see shared_state.py) the counter is a single Redis key
+advanced with ``INCRBY``, so replicas on different hosts draw from one sequence. The
+key is seeded once (``SET NX``) from the local database if there is one, otherwise
+from ``serial_data.txt``, so switching backends continues the existing numbering.
+"""
+import os
+import sqlite3
+import threading
+import time
+
+from shared_state import state_backend
+
+SERIAL_DB = os.environ.get("SERIAL_DB", "serial_data.db")
+SERIAL_FILE = "serial_data.txt"
+BLOCK_SIZE = int(os.environ.get("SERIAL_BLOCK_SIZE", 1))
+SEQUENCE_TTL = 24 * 3600
+
+
+def read_seed(seed_file):
+    """Return (base_number, counter) from the legacy text file, or (0, 0) if it is missing."""
+    if seed_file is None:
+        return 0, 0
+    try:
+        with open(seed_file, "r") as f:
+            base_number, counter = map(int, f.read().strip().split(","))
+        return base_number, counter
+    except FileNotFoundError:
+        return 0, 0
+
+
+class SerialAllocator:
+    """Hands out unique, increasing serial numbers for one named counter."""
+
+    def __init__(self, path=SERIAL_DB, name="reference", seed_file=SERIAL_FILE, block_size=BLOCK_SIZE):
+        self.path = path
+        self.name = name
+        self.seed_file = seed_file
+        self.block_size = max(1, block_size)
+        self._local = threading.local()
+        self._block_lock = threading.Lock()
+        self._block = iter(())
+        self._block_pid = os.getpid()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        # A connection must not be shared with a forked child
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=FULL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS counters ("
+                "name TEXT PRIMARY KEY, base INTEGER NOT NULL, counter INTEGER NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sequences ("
+                "key TEXT PRIMARY KEY, count INTEGER NOT NULL, created REAL NOT NULL)"
+            )
+            base_number, counter = read_seed(self.seed_file)
+            conn.execute(
+                "INSERT OR IGNORE INTO counters (name, base, counter) VALUES (?, ?, ?)",
+                (self.name, base_number, counter),
+            )
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def reserve(self, count):
+        """Atomically reserve ``count`` consecutive serial numbers and return them as a range."""
+        if count < 1:
+            raise ValueError("count must be at least 1")
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            base_number, counter = conn.execute(
+                "SELECT base, counter FROM counters WHERE name = ?", (self.name,)
+            ).fetchone()
+            conn.execute("UPDATE counters SET counter = counter + ? WHERE name = ?", (count, self.name))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return range(base_number + counter, base_number + counter + count)
+
+    def next(self):
+        """Return the next serial number."""
+        if self.block_size == 1:
+            return self.reserve(1)[0]
+        with self._block_lock:
+            if self._block_pid != os.getpid():
+                # Numbers reserved by the parent process belong to the parent
+                self._block, self._block_pid = iter(()), os.getpid()
+            serial_number = next(self._block, None)
+            if serial_number is None:
+                self._block = iter(self.reserve(self.block_size))
+                serial_number = next(self._block)
+            return serial_number
+
+    def sequence(self, key):
+        """Atomically count a use of ``key`` and return the count (1 on first use)."""
+        conn = self._connection()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT count FROM sequences WHERE key = ?", (key,)).fetchone()
+            count = 1 if row is None else row[0] + 1
+            if row is None:
+                conn.execute("DELETE FROM sequences WHERE created < ?", (now - SEQUENCE_TTL,))
+                conn.execute("INSERT INTO sequences (key, count, created) VALUES (?, 1, ?)", (key, now))
+            else:
+                conn.execute("UPDATE sequences SET count = ? WHERE key = ?", (count, key))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return count
+
+    def peek(self):
+        """The number the database would hand out next (ignores blocks held in memory)."""
+        base_number, counter = self._connection().execute(
+            "SELECT base, counter FROM counters WHERE name = ?", (self.name,)
+        ).fetchone()
+        return base_number + counter
+
+
+class RedisSerialAllocator(SerialAllocator):
+    """SerialAllocator whose counter lives in a Redis-protocol server (one INCRBY per block)."""
+
+    def __init__(self, client, name="reference", seed_db=SERIAL_DB, seed_file=SERIAL_FILE, block_size=BLOCK_SIZE):
+        super().__init__(seed_db, name, seed_file, block_size)
+        self.client = client
+        self.key = f"serial:{name}"
+        self._seeded = False
+
+    def _seed(self):
+        if self._seeded:
+            return
+        if os.path.exists(self.path):
+            seed = SerialAllocator(self.path, self.name, self.seed_file).peek()
+        else:
+            seed = sum(read_seed(self.seed_file))
+        # Only the first process to get here sets the key
+        self.client.execute("SET", self.key, seed, "NX")
+        self._seeded = True
+
+    def reserve(self, count):
+        if count < 1:
+            raise ValueError("count must be at least 1")
+        self._seed()
+        end = self.client.execute("INCRBY", self.key, count)
+        return range(end - count, end)
+
+    def sequence(self, key):
+        count, _ = self.client.pipeline(("INCR", f"sequence:{key}"), ("EXPIRE", f"sequence:{key}", SEQUENCE_TTL))
+        return count
+
+    def peek(self):
+        self._seed()
+        return int(self.client.execute("GET", self.key))
+
+
+_allocator = None
+_allocator_lock = threading.Lock()
+
+
+def get_allocator():
+    """Return the process-wide allocator for reference serial numbers."""
+    global _allocator
+    with _allocator_lock:
+        if _allocator is None:
+            if state_backend() == "redis":
+                from resp_client import get_resp_client
+
+                _allocator = RedisSerialAllocator(get_resp_client())
+            else:
+                _allocator = SerialAllocator()
+        return _allocator
@@ -0,0 +1,35 @@
+"""
+Backend selection for state that several app replicas have to share.
+
+Three pieces of state decide whether more than one process can serve the app: the
+serial allocator (references must stay globally unique), the output store (a file
+generated on one replica is downloaded through another) and the job queue (a job
+submitted by a web replica is run by a conversion worker and polled from anywhere).
+``STATE_BACKEND`` picks one implementation for all three:
+
+* ``memory`` (default) - a single process: SQLite serials, outputs in memory and jobs
+  on an in-process thread pool, as before;
+* ``local`` - processes on one host or sharing a volume: SQLite serials, outputs as
+  files under ``STATE_DIR`` and an SQLite job queue in ``STATE_DIR/jobs.db`` served by
+  ``worker.py`` processes;
+* ``redis`` - replicas on any number of hosts: everything in the Redis-protocol
+  server at ``REDIS_URL`` (see resp_client.py), jobs again run by ``worker.py``.
+"""
+import os
+
+BACKENDS = ("memory", "local", "redis")
+STATE_BACKEND = os.environ.get("STATE_BACKEND", "memory")
+STATE_DIR = os.environ.get("STATE_DIR", "shared_state")
+
+
+def state_backend():
+    """The configured backend name; raises ValueError for an unknown one."""
+    if STATE_BACKEND not in BACKENDS:
+        raise ValueError(f"Unknown STATE_BACKEND {STATE_BACKEND!r}; expected one of {', '.join(BACKENDS)}")
+    return STATE_BACKEND
+
+
+def state_path(*parts):
+    """A path under STATE_DIR, creating the directory on first use."""
+    os.makedirs(STATE_DIR, exist_ok=True)
+    return os.path.join(STATE_DIR, *parts)
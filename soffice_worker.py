@@ -0,0 +1,109 @@
+"""
+Helper process that keeps one LibreOffice instance warm and converts documents over UNO.
+
+This script is started by pdf_converter.py and must run under a Python interpreter
+that can ``import uno`` (on Debian/Ubuntu that is the system ``python3`` with the
+``python3-uno`` package). It speaks a line based JSON protocol on stdin/stdout:
+
+    -> {"src": "/abs/in.docx", "dst": "/abs/out.pdf", "pdfa": false}
+    <- {"ok": true}  or  {"ok": false, "error": "..."}
+
+A single {"ready": true} line is written once soffice is accepting connections.
+"""
+import json
+import subprocess
+import sys
+import time
+
+import uno
+from com.sun.star.beans import PropertyValue
+from com.sun.star.connection import NoConnectException
+
+
+def _property(name, value):
+    prop = PropertyValue()
+    prop.Name = name
+    prop.Value = value
+    return prop
+
+
+def _reply(message):
+    sys.stdout.write(json.dumps(message) + "\n")
+    sys.stdout.flush()
+
+
+def start_office(soffice, profile_dir, pipe_name):
+    """Start a headless soffice bound to its own profile and UNO pipe."""
+    return subprocess.Popen(
+        [
+            soffice,
+            "--headless", "--invisible", "--nologo", "--norestore",
+            "--nodefault", "--nolockcheck",
+            f"-env:UserInstallation={uno.systemPathToFileUrl(profile_dir)}",
+            f"--accept=pipe,name={pipe_name};urp;StarOffice.ComponentContext",
+        ],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+def connect(pipe_name, office, attempts=120):
+    """Connect to the office over its UNO pipe, waiting for it to come up."""
+    local_context = uno.getComponentContext()
+    resolver = local_context.ServiceManager.createInstanceWithContext(
+        "com.sun.star.bridge.UnoUrlResolver", local_context
+    )
+    url = f"uno:pipe,name={pipe_name};urp;StarOffice.ComponentContext"
+    for _ in range(attempts):
+        if office.poll() is not None:
+            raise RuntimeError(f"soffice exited with code {office.returncode} during startup")
+        try:
+            context = resolver.resolve(url)
+            return context.ServiceManager.createInstanceWithContext("com.sun.star.frame.Desktop", context)
+        except NoConnectException:
+            time.sleep(0.25)
+    raise RuntimeError("Timed out waiting for soffice to accept connections")
+
+
+def convert(desktop, src, dst, pdfa=False):
+    """Load ``src`` hidden and export it to ``dst`` as PDF (PDF/A-2b with ``pdfa``)."""
+    doc = desktop.loadComponentFromURL(
+        uno.systemPathToFileUrl(src), "_blank", 0, (_property("Hidden", True),)
+    )
+    if doc is None:
+        raise RuntimeError(f"LibreOffice could not load {src}")
+    try:
+        properties = [_property("FilterName", "writer_pdf_Export")]
+        if pdfa:
+            filter_data = uno.Any("[]com.sun.star.beans.PropertyValue", (_property("SelectPdfVersion", 2),))
+            properties.append(_property("FilterData", filter_data))
+        uno.invoke(doc, "storeToURL", (uno.systemPathToFileUrl(dst), tuple(properties)))
+    finally:
+        doc.close(True)
+
+
+def main():
+    soffice, profile_dir, pipe_name = sys.argv[1:4]
+    office = start_office(soffice, profile_dir, pipe_name)
+    try:
+        desktop = connect(pipe_name, office)
+        _reply({"ready": True})
+        for line in sys.stdin:
+            if not line.strip():
+                continue
+            job = json.loads(line)
+            try:
+                convert(desktop, job["src"], job["dst"], job.get("pdfa", False))
+                _reply({"ok": True})
+            except Exception as e:
+                _reply({"ok": False, "error": str(e)})
+    finally:
+        office.terminate()
+        try:
+            office.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            office.kill()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+"""
+Compiled template cache.
+
+Parsing a SAMPLE .docx means unzipping it and building the full XML tree, and the
+placeholder functions then scan every paragraph for every key. ``TemplateRegistry``
+loads each template once per process, records where every ``<<...>>`` token sits and
+hands out fresh documents as deep copies of the parsed original.
+
+Paragraphs are found on the XML of each part rather than through python-docx's
+``paragraphs``/``tables``/``row.cells``: every ``w:p`` of the main document, headers,
+footers, footnotes and endnotes is visited exactly once, including nested tables, text
+boxes and content controls, and cells merged across rows or columns are not repeated.
+A placeholder paragraph is recorded as a path of child indexes to it and to its
+``w:t`` text nodes, so filling a copy goes straight to those nodes.
+
+Templates are re-checked on every ``get``: a changed mtime or size triggers a content
+hash, and the template is recompiled if the hash differs.
+"""
+import copy
+import hashlib
+import os
+import re
+import threading
+
+PLACEHOLDER_PATTERN = re.compile(r"<<[^<>]+>>")
+
+# Clark names, spelled out so this module does not import python-docx
+W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+W_P = W + "p"
+W_T = W + "t"
+# Parts besides the main document whose text is shown in the output
+TEXT_PART_TYPES = tuple(
+    f"application/vnd.openxmlformats-officedocument.wordprocessingml.{kind}+xml"
+    for kind in ("header", "footer", "footnotes", "endnotes")
+)
+
+
+def _register_note_parts():
+    # python-docx loads footnotes/endnotes as opaque blobs; parse them like headers so
+    # they are searched, filled and deep-copied as XML
+    from docx.opc.constants import CONTENT_TYPE as CT
+    from docx.opc.part import PartFactory, XmlPart
+
+    for content_type in (CT.WML_FOOTNOTES, CT.WML_ENDNOTES):
+        PartFactory.part_type_for.setdefault(content_type, XmlPart)
+
+
+def text_parts(doc):
+    """{partname: root element} of the main document, headers, footers, footnotes and endnotes."""
+    parts = {str(doc.part.partname): doc.part.element}
+    for part in doc.part.package.iter_parts():
+        if part.content_type in TEXT_PART_TYPES and hasattr(part, "element"):
+            parts[str(part.partname)] = part.element
+    return parts
+
+
+def iter_paragraphs(doc):
+    """
+    Yield (partname, w:p element) for every paragraph of every text part, each exactly
+    once: body, tables at any nesting depth, merged cells, text boxes, content controls
+    (w:sdt), headers, footers, footnotes and endnotes.
+    """
+    for partname, root in text_parts(doc).items():
+        for p in root.iter(W_P):
+            yield partname, p
+
+
+def text_nodes(p):
+    """The w:t elements holding the text of paragraph ``p`` (not of paragraphs nested in it)."""
+    nodes = list(p.iter(W_T))
+    if next(p.iterdescendants(W_P), None) is None:
+        return nodes
+    # A text box inside the paragraph has paragraphs of its own
+    return [t for t in nodes if _owner(t) is p]
+
+
+def _owner(t):
+    parent = t.getparent()
+    while parent is not None and parent.tag != W_P:
+        parent = parent.getparent()
+    return parent
+
+
+def _path(root, element):
+    """Child indexes leading from ``root`` down to ``element``."""
+    path = []
+    while element is not root:
+        parent = element.getparent()
+        path.append(parent.index(element))
+        element = parent
+    return tuple(reversed(path))
+
+
+def _walk(element, path):
+    for index in path:
+        element = element[index]
+    return element
+
+
+def _file_signature(path):
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _file_digest(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+class CompiledTemplate:
+    """A parsed template plus the locations of every placeholder token in it."""
+
+    def __init__(self, path):
+        self.path = path
+        self.signature = _file_signature(path)
+        self.digest = _file_digest(path)
+        # Never accessed directly: python-docx caches wrappers around sub-elements
+        # (e.g. the body) which deepcopy would detach from the copied tree.
+        # python-docx is imported on first use so importing this module stays cheap
+        from docx import Document
+        _register_note_parts()
+        self._source = Document(path)
+        # token -> [(partname, paragraph path)]
+        self.locations = {}
+        # (partname, paragraph path, [w:t paths relative to the paragraph])
+        self.paragraph_locations = []
+        self._index()
+
+    def _index(self):
+        for partname, root in text_parts(self.new_document()).items():
+            for p in root.iter(W_P):
+                nodes = text_nodes(p)
+                matches = PLACEHOLDER_PATTERN.findall("".join(t.text or "" for t in nodes))
+                if not matches:
+                    continue
+                location = (partname, _path(root, p))
+                self.paragraph_locations.append(location + (tuple(_path(p, t) for t in nodes),))
+                for token in matches:
+                    self.locations.setdefault(token, []).append(location)
+
+    @property
+    def tokens(self):
+        return set(self.locations)
+
+    def new_document(self):
+        """Return an independent copy of the parsed template."""
+        return copy.deepcopy(self._source)
+
+    def placeholder_paragraphs(self, doc):
+        """
+        Text nodes of each paragraph of ``doc`` (a copy from new_document) that contains
+        a placeholder, as a list of w:t lists; located by path, without a scan.
+        """
+        parts = text_parts(doc)
+        paragraphs = []
+        for partname, p_path, node_paths in self.paragraph_locations:
+            p = _walk(parts[partname], p_path)
+            paragraphs.append([_walk(p, path) for path in node_paths])
+        return paragraphs
+
+    def unfilled(self, placeholders):
+        """Tokens of this template that ``placeholders`` has no value for, with their parts."""
+        return {token: sorted({partname for partname, _ in self.locations[token]})
+                for token in sorted(self.tokens - set(placeholders))}
+
+
+class TemplateRegistry:
+    """Process-wide cache of CompiledTemplate objects keyed by path."""
+
+    def __init__(self):
+        self._templates = {}
+        self._lock = threading.Lock()
+
+    def get(self, path):
+        path = os.path.abspath(path)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Template file not found: {path}")
+        with self._lock:
+            template = self._templates.get(path)
+            if template is not None and template.signature != _file_signature(path):
+                if template.digest == _file_digest(path):
+                    # Touched but not edited; keep the compiled copy
+                    template.signature = _file_signature(path)
+                else:
+                    template = None
+            if template is None:
+                template = CompiledTemplate(path)
+                self._templates[path] = template
+            return template
+
+    def clear(self):
+        with self._lock:
+            self._templates.clear()
+
+
+_registry = TemplateRegistry()
+
+
+def get_template(path):
+    """Return the compiled template for ``path`` from the default registry."""
+    return _registry.get(path)
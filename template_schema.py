@@ -0,0 +1,286 @@
+"""
+Declarative description of the document templates.
+
+Each ``TemplateSchema`` lists the template file, the output file name, how its
+reference number is issued and its ``Field``s: the input key, the widget label, the
+field type and the placeholder it fills. The Streamlit UI builds its widgets from the
+fields, and documents.py builds the placeholder dict from them, so adding a template
+means adding one entry to ``SCHEMAS``.
+
+Field types and how their values are written into the document:
+
+* ``text`` / ``textarea`` - as entered
+* ``date`` - DD-MM-YYYY (accepts date objects and YYYY-MM-DD, DD-MM-YYYY, DD/MM/YYYY)
+* ``percent`` - whole number followed by ``%``
+* ``money`` - two decimals
+* ``choice`` - one of ``options`` (a list, or {parent value: list} with ``depends_on``);
+  "None" or an empty value is written as ``blank``
+
+A field with ``compute`` is derived from the other fields when no value is given and
+has no widget. ``amount`` names the field whose value is recorded as the document's
+amount in the archive (document_archive.py). documents.validate_templates() checks that every declared placeholder
+exists in its .docx.
+"""
+from dataclasses import dataclass
+from datetime import date, datetime
+
+from references import generate_reference_number, generate_unique_reference
+
+FIELD_TYPES = ("text", "textarea", "date", "percent", "money", "choice")
+DATE_INPUT_FORMATS = ("%Y-%m-%d", "%d-%m-%Y", "%d/%m/%Y")
+NO_CHOICE = "None"
+
+
+class TemplateSchemaError(Exception):
+    """Raised when a schema does not match its template file."""
+
+
+def format_date(value):
+    """Render a date (or a date string from a CSV/JSON row) as DD-MM-YYYY."""
+    if isinstance(value, (date, datetime)):
+        return value.strftime("%d-%m-%Y")
+    if not value:
+        return datetime.today().strftime("%d-%m-%Y")
+    for fmt in DATE_INPUT_FORMATS:
+        try:
+            return datetime.strptime(str(value).strip(), fmt).strftime("%d-%m-%Y")
+        except ValueError:
+            continue
+    raise ValueError(f"Unrecognised date: {value!r}")
+
+
+def _empty(value):
+    return value is None or value == ""
+
+
+@dataclass(frozen=True)
+class Field:
+    key: str
+    label: str
+    placeholder: str = None
+    type: str = "text"
+    options: object = ()
+    depends_on: str = None
+    blank: str = ""
+    compute: object = None
+
+    def __post_init__(self):
+        if self.type not in FIELD_TYPES:
+            raise TemplateSchemaError(f"Field {self.key!r} has unknown type {self.type!r}")
+
+    @property
+    def has_widget(self):
+        return self.compute is None
+
+    def choices(self, fields):
+        """Options of a choice field, given the other field values for ``depends_on``."""
+        if self.depends_on is None:
+            return list(self.options)
+        return list(self.options.get(fields.get(self.depends_on), ()))
+
+    def value(self, fields):
+        value = fields.get(self.key)
+        if _empty(value) and self.compute is not None:
+            value = self.compute(fields)
+        return value
+
+    def format(self, fields):
+        """The text this field puts into the document."""
+        value = self.value(fields)
+        if self.type == "date":
+            return format_date(value)
+        if self.type == "percent":
+            return f"{int(float(value)) if not _empty(value) else 0}%"
+        if self.type == "money":
+            return f"{float(value) if not _empty(value) else 0.0:.2f}"
+        if self.type == "choice":
+            return self.blank if _empty(value) or str(value) == NO_CHOICE else str(value)
+        return "" if value is None else str(value)
+
+
+@dataclass(frozen=True)
+class TemplateSchema:
+    name: str
+    path: str
+    output: str
+    fields: tuple
+    reference: object
+    reference_placeholder: str
+    button_label: str
+    document_label: str
+    success_message: str = "Document generated successfully!"
+    amount: str = None
+
+    def placeholders(self, fields, reference):
+        """Placeholder dict for ``fields`` and the document's reference number."""
+        values = {field.placeholder: field.format(fields) for field in self.fields if field.placeholder}
+        values[self.reference_placeholder] = reference
+        return values
+
+    def declared_placeholders(self):
+        return {field.placeholder for field in self.fields if field.placeholder} | {self.reference_placeholder}
+
+    def metadata(self, fields):
+        """Client, service, amount and date of a document, as recorded in the archive."""
+        by_key = {field.key: field for field in self.fields}
+
+        def choice(key):
+            field = by_key.get(key)
+            value = field.format(fields).strip() if field is not None else ""
+            return value or None
+
+        amount = None
+        if self.amount in by_key:
+            try:
+                amount = float(str(by_key[self.amount].value(fields)).replace(",", ""))
+            except (TypeError, ValueError):
+                pass
+        dates = [field for field in self.fields if field.type == "date"]
+        return {
+            "client": fields.get("client_name") or None,
+            "service_type": choice("service_type"),
+            "service": choice("service"),
+            "amount": amount,
+            "document_date": dates[0].format(fields) if dates else None,
+        }
+
+    def output_stem(self, fields):
+        """File name (without extension) of a generated document, e.g. 'Invoice ACME'."""
+        client_name = fields.get("client_name")
+        return self.output.format(client_name="" if client_name is None else str(client_name))
+
+    def check(self, tokens):
+        """Problems with this schema given the placeholder ``tokens`` found in its .docx."""
+        problems = []
+        keys = [field.key for field in self.fields]
+        duplicates = sorted({key for key in keys if keys.count(key) > 1})
+        if duplicates:
+            problems.append(f"duplicate field keys {duplicates}")
+        missing = sorted(self.declared_placeholders() - set(tokens))
+        if missing:
+            problems.append(f"placeholders not found in {self.path}: {missing}")
+        for field in self.fields:
+            if field.depends_on is not None and field.depends_on not in keys:
+                problems.append(f"field {field.key!r} depends on unknown field {field.depends_on!r}")
+        return problems
+
+
+# Service Agreement cost fields: input key -> label (also the placeholder text)
+SERVICE_AGREEMENT_COSTS = {
+    "company_formation_cost": "Company Formation Cost",
+    "desk_rental_cost": "Desk-Space Office Rental Cost",
+    "businessman_visa_cost": "Businessman Visa Cost",
+    "misc_admin_charges": "Miscellaneous/Admin Charges",
+    "power_of_attorney_cost": "Power of Attorney Cost",
+    "estimation_charges": "Estimation Charges (Per Head)",
+    "labour_registration_cost": "Labour Authority Registration Cost",
+    "social_insurance_cost": "Social Insurance Registration Cost",
+    "free_advice_cost": "Free Advice/Guidance Cost",
+}
+
+# Invoice service types and the services offered under each
+SERVICE_CATALOGUE = {
+    "LMRA Affairs": [
+        "Visa Application", "Visa Termination", "Visa Renewal", "Visa Ceiling Application", "Changing Occupation", "Mobility Issues", "Offences Removal Application", "Runaway Application", "Domestic Permit Application", "LMRA Registration of Establishments", "Work Load Application", "Biometrics Appointment"
+    ],
+    "NPRA (Immigration) Affairs": [
+        "Visa Cancellation and Extension", "Dependent Visa Processing", "Domestic Visa Processing", "Visit Visa Extension", "Business Visit Visa Processing", "Dependent Visit Visa Processing", "Visa Cancellation Update", "Passport Update", "RP Stamping", "eVisa Processing", "Business Investor Visa Processing"
+    ],
+    "SIO Affairs": [
+        "Employee's Registration", "Employee's Termination", "Payment Processing", "Establishment Registration", "Addition Bahraini Employee"
+    ],
+    "CIO Affairs": [
+        "CPR Issuance", "CPR Renewal", "CPR Update", "Dependent CPR", "Lost CPR", "Address Update"
+    ],
+    "CID Affairs": [
+        "Report Issuance for Lost Passport", "Good Conduct Certificate Issuance", "Other Kind of Reports", "CPR Offense Inquiry and Removal"
+    ],
+    "eGovernment": ["Driving School Appointments","EWA Bills","Traffic Contraventions Details","Vehicle Details","Online Appointments"],
+
+    "MOICT Affairs":["SPC(Single Person Company) Formation","WLL(With Limited Liability) Formation","Partnership Company Formation","Individual Establishment Formation","Sijili Formation","Branch of a Foreign Company Formation","Branch of Addition/Deletion","Company Liquidation","Change Name","Change Address","Change Financial Year","Partner Addition/Deletion","Actvity Addition/Deletion","Transfer Ownership","Change of Directors","Change of Representatives","Change Sponsor","Capital Increase/Decrease","Change Company Period","Change Company Type","Settlement of CR for Deleted by Resolution","Settlement of CR for Deleted wothout Payment","Convert Sijilli Type","Change M&AA Only"],
+
+    "BIC Affairs":["Original CR","CR Extract","Document Attestation","eKey Assistance"],
+}
+
+
+def _total_cost(fields):
+    return sum(float(fields[key]) for key in SERVICE_AGREEMENT_COSTS if not _empty(fields.get(key)))
+
+
+SCHEMAS = [
+    TemplateSchema(
+        name="VAT Registration",
+        path="SAMPLE VAT registration and VAT filling -SME package.docx",
+        output="VAT {client_name}",
+        reference=generate_reference_number,
+        reference_placeholder="<<Reference Number>>",
+        button_label="Generate VAT Document",
+        document_label="VAT Document",
+        fields=(
+            Field("agreement_date", "Date of Agreement", "<<Date>>", type="date"),
+            Field("atten", "Attention", "<<Atten>>"),
+            Field("email", "Email", "<<Email>>"),
+            Field("client_name", "Client Name", "<<Client Name>>"),
+            Field("commercial_registration_number", "Commercial Registration Number", "<<Commercial Registration Number>>"),
+            Field("service_provider_name", "Service Provider Name", "<<Service Provider Name>>"),
+            Field("service_provider_cr", "Service Provider CR Number", "<<Service Provider CR Number>>"),
+            Field("company_name", "Company Name", "<<Company Name>>"),
+            Field("vat_registration_fee", "VAT Registration Fee", "<<VAT Registration Fee>>"),
+            Field("consultancy_fee", "Consultancy Fee", "<<Consultancy Fee>>"),
+            Field("authorized_person_name", "Authorized Person Name", "<<Authorized Person Name>>"),
+        ),
+    ),
+    TemplateSchema(
+        name="Service Agreement",
+        path="SAMPLE Service Agreement -Company formation -Bahrain - Filled.docx",
+        output="Service Agreement {client_name}",
+        reference=generate_reference_number,
+        reference_placeholder="<< Reference Number >>",
+        button_label="Generate Service Agreement Document",
+        document_label="Service Agreement",
+        amount="total_cost",
+        fields=(
+            Field("agreement_date", "Date of Agreement", "<< Date >>", type="date"),
+            Field("client_name", "Client Name", "<< Client Name >>"),
+            Field("bahraini_ownership", "Bahraini Ownership (%)", "<< Bahraini Ownership >>", type="percent"),
+            Field("gcc_ownership", "GCC Nationals Ownership (%)", "<< GCC Nationals Ownership >>", type="percent"),
+            Field("american_ownership", "American Nationals Ownership (%)", "<< American Nationals Ownership >>", type="percent"),
+            Field("foreign_ownership", "Foreign Ownership (%)", "<< Foreign Ownership >>", type="percent"),
+            Field("business_activity_1_isic", "Business Activity ISIC4 Code (1st)", "<<Text1>>"),
+            Field("business_activity_1_name", "Business Activity Name (1st)", "<<Text2>>"),
+            Field("business_activity_1_desc", "Business Activity Description (1st)", "<<Text3>>", type="textarea"),
+            Field("business_activity_2_isic", "Business Activity ISIC4 Code (2nd)", "<<Text4>>"),
+            Field("business_activity_2_name", "Business Activity Name (2nd)", "<<Text5>>"),
+            Field("business_activity_2_desc", "Business Activity Description (2nd)", "<<Text6>>", type="textarea"),
+            *(Field(key, label, f"<< {label} >>", type="money") for key, label in SERVICE_AGREEMENT_COSTS.items()),
+            Field("total_cost", "Total Cost", "<< Total Cost >>", type="money", compute=_total_cost),
+            Field("signatory_name", "Signatory Name", "<< Signatory Name >>"),
+            Field("passport_number", "Passport Number", "<< Passport Number >>"),
+        ),
+    ),
+    TemplateSchema(
+        name="Invoice",
+        path="SAMPLE -Invoice BKR2024CF158 - first payment.docx",
+        output="Invoice {client_name}",
+        reference=generate_unique_reference,
+        reference_placeholder="<<Invoice Number>>",
+        button_label="Generate Invoice",
+        document_label="Invoice",
+        success_message="Invoice generated successfully!",
+        amount="total_amount",
+        fields=(
+            Field("service_type", "Select Service Type", "<<Service Type>>", type="choice",
+                  options=tuple(SERVICE_CATALOGUE), blank=" "),
+            Field("service", "Select Service", "<<Service>>", type="choice",
+                  options=SERVICE_CATALOGUE, depends_on="service_type", blank=" "),
+            Field("invoice_date", "Date", "<<Date>>", type="date"),
+            Field("client_name", "Client Name", "<<Client Name>>"),
+            Field("reference_number", "Service Agreement Reference Number", "<<Service Agreement Ref Number>>"),
+            Field("remark", "Remarks in Website", "<<Remark>>", type="textarea"),
+            Field("attention", "Attention (Atten)", "<<Atten>>"),
+            Field("cost", "Cost (in BHD)", "<<Cost>>"),
+            Field("total_in_words", "Total Amount (in words)", "<<Total In Words>>"),
+            Field("total_amount", "Total Amount (in BHD)", "<<Total Amount>>"),
+        ),
+    ),
+]
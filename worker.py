@@ -0,0 +1,70 @@
+"""
+Conversion worker: runs the generation jobs queued by the web replicas.
+
+With ``STATE_BACKEND=local`` or ``redis`` (see shared_state.py) the UI and the API
+only queue jobs; each worker process takes them from the shared queue, fills the
+template, converts it to PDF and puts the files in the shared output store, where any
+replica serves the download. Run as many workers as PDF conversion needs,
+independently of the number of web replicas:
+
+    STATE_BACKEND=redis REDIS_URL=redis://cache:6379/0 python worker.py --threads 4
+
+Templates are compiled and the PDF backend started before the first job is taken.
+"""
+import argparse
+import signal
+import sys
+import threading
+
+from documents import start_warmup
+from jobs import DONE, QueuedJobManager, get_job_manager
+from shared_state import state_backend
+
+
+def work_loop(manager, stop, timeout=5, retry_delay=2):
+    """Run queued jobs until ``stop`` is set."""
+    while not stop.is_set():
+        try:
+            job = manager.work(timeout)
+        except Exception as e:
+            # A queue server restarting or a locked database must not end the worker
+            print(f"queue error: {type(e).__name__}: {e}", file=sys.stderr, flush=True)
+            stop.wait(retry_delay)
+            continue
+        if job is not None:
+            outcome = "done" if job.status == DONE else f"failed: {job.error}"
+            print(f"job {job.id} {outcome}", file=sys.stderr, flush=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run queued document generation jobs.")
+    parser.add_argument("--threads", type=int, default=2, help="jobs run in parallel by this process")
+    args = parser.parse_args(argv)
+
+    manager = get_job_manager()
+    if not isinstance(manager, QueuedJobManager):
+        parser.error(f"STATE_BACKEND={state_backend()} runs jobs in the web process; "
+                     "set it to 'local' or 'redis' to use workers")
+    warmup = start_warmup()
+    warmup.join()
+    if warmup.error is not None:
+        print(f"Warm-up failed: {warmup.error}", file=sys.stderr)
+        return 1
+
+    stop = threading.Event()
+    # Finish the running jobs, take no new ones
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: stop.set())
+    threads = [threading.Thread(target=work_loop, args=(manager, stop), name=f"worker-{i}")
+               for i in range(max(1, args.threads))]
+    for thread in threads:
+        thread.start()
+    print(f"worker ready ({state_backend()} backend, {len(threads)} threads)", file=sys.stderr, flush=True)
+    for thread in threads:
+        while thread.is_alive():
+            thread.join(0.5)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())